@@ -2,6 +2,7 @@ import os
 import subprocess
 from logger import Logger
 from config import Config
+from tools.node_toolchain import get_node_toolchain
 
 
 class BuildAgent:
@@ -41,9 +42,11 @@ class BuildAgent:
             self.logger.info(f"[BuildAgent] Building project at: {project_path}")
             
             # npm run buildを実行
+            toolchain = get_node_toolchain()
             result = subprocess.run(
-                ["npm", "run", "build"],
+                toolchain.command("npm", "run", "build"),
                 cwd=project_path,
+                env=toolchain.env(),
                 capture_output=True,
                 text=True,
                 check=True
@@ -0,0 +1,171 @@
+import time
+import asyncio
+import threading
+from typing import Dict, Optional
+from google.api_core.exceptions import ServerError
+from config import Config
+from logger import Logger
+from agents.rate_limiter import _exception_chain, is_rate_limit_error
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+
+class ProviderUnavailableError(Exception):
+    """サーキットブレーカーが開いているため、Gemini APIを呼ばずに即座に失敗させる場合の例外"""
+    def __init__(self, model: str, retry_after: float, failures: int):
+        super().__init__(
+            f"Gemini model {model} is unavailable ({failures} consecutive failures/timeouts); "
+            f"calls are rejected for the next {retry_after:.0f}s"
+        )
+        self.model = model
+        self.retry_after = retry_after
+        self.failures = failures
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """
+    プロバイダ側の障害（タイムアウト・5xx・接続エラー）かどうかを判定する。
+    429（レートリミッターが扱う）やレスポンスのパース失敗・キャンセルは障害として数えない。
+    """
+    if isinstance(error, (asyncio.CancelledError, ProviderUnavailableError)) or is_rate_limit_error(error):
+        return False
+    for exc in _exception_chain(error):
+        if isinstance(exc, (ServerError, TimeoutError, asyncio.TimeoutError, ConnectionError)):
+            return True
+        code = getattr(exc, "code", None)
+        if isinstance(code, int) and 500 <= code < 600:
+            return True
+        name = type(exc).__name__
+        if any(marker in name for marker in ("Timeout", "ServerError", "Unavailable", "ConnectError", "RemoteProtocolError")):
+            return True
+        if "DEADLINE_EXCEEDED" in str(exc) or "UNAVAILABLE" in str(exc):
+            return True
+    return False
+
+
+class CircuitBreaker:
+    """
+    1モデル分のサーキットブレーカー
+    - closed: 通常どおり呼び出す。障害がCIRCUIT_BREAKER_FAILURE_THRESHOLD回連続したらopenにする
+    - open: CIRCUIT_BREAKER_RESET_SECONDSの間、呼び出しをProviderUnavailableErrorで即座に拒否する
+    - half_open: 経過後は1回だけ試験的に呼び出し、成功すればclosed、障害ならopenに戻す
+      （試験呼び出しがキャンセルされた場合に備え、RESET_SECONDS経過ごとに次の試験呼び出しを許可する）
+    failure_threshold=0の場合は無効（常にclosed）
+    """
+
+    def __init__(self, model: str, failure_threshold: int, reset_seconds: float):
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+        # 統計（get_circuit_breakers().snapshot()で参照）
+        self.times_opened = 0
+        self.rejected = 0
+
+    def before_call(self) -> None:
+        """呼び出し前に確認する。拒否する場合はProviderUnavailableErrorを送出する"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "closed" or self.failure_threshold <= 0:
+                return
+            if self.state == "open" and now - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._probe_started = None
+                logger.info(f"[CircuitBreaker] {self.model} half-open, probing provider")
+            if self.state == "half_open":
+                if self._probe_started is None or now - self._probe_started >= self.reset_seconds:
+                    self._probe_started = now
+                    return
+                retry_after = self.reset_seconds - (now - self._probe_started)
+            else:
+                retry_after = self.reset_seconds - (now - self.opened_at)
+            self.rejected += 1
+            raise ProviderUnavailableError(self.model, max(0.0, retry_after), self.consecutive_failures)
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"[CircuitBreaker] {self.model} recovered, closing circuit")
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probe_started = None
+
+    def record_failure(self, error: BaseException) -> bool:
+        """
+        呼び出しの例外を記録する（プロバイダ障害以外は連続失敗数を変えない）。
+        Returns: プロバイダ障害によりサーキットが開いている場合True（呼び出し側はProviderUnavailableErrorに置き換える）
+        """
+        with self._lock:
+            if self.failure_threshold <= 0:
+                return False
+            if not is_provider_failure(error):
+                if self.state == "half_open":
+                    # 試験呼び出しの結果が判断できないため、次の呼び出しで改めて試す
+                    self._probe_started = None
+                return False
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                    logger.error(f"[CircuitBreaker] {self.model} opened after {self.consecutive_failures} consecutive failures "
+                                 f"(last: {type(error).__name__}), rejecting calls for {self.reset_seconds:.0f}s")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probe_started = None
+            return self.state == "open"
+
+    def unavailable_error(self) -> ProviderUnavailableError:
+        with self._lock:
+            retry_after = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+            return ProviderUnavailableError(self.model, retry_after, self.consecutive_failures)
+
+
+class CircuitBreakerRegistry:
+    """モデル別のサーキットブレーカー（全エージェント共通）"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = CircuitBreaker(model, self.failure_threshold, self.reset_seconds)
+                self._breakers[model] = breaker
+            return breaker
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                model: {
+                    "state": breaker.state,
+                    "consecutive_failures": breaker.consecutive_failures,
+                    "times_opened": breaker.times_opened,
+                    "rejected": breaker.rejected,
+                }
+                for model, breaker in self._breakers.items()
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_circuit_breakers() -> CircuitBreakerRegistry:
+    """Configに基づくプロセス共通のサーキットブレーカーを取得する"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CircuitBreakerRegistry(
+                    failure_threshold=Config.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                    reset_seconds=Config.CIRCUIT_BREAKER_RESET_SECONDS
+                )
+    return _registry
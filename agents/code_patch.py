@@ -0,0 +1,115 @@
+import re
+from typing import Dict, List, Optional
+
+# search/replaceブロック形式のパッチ
+#   FILE: page.tsx
+#   <<<<<<< SEARCH
+#   （現在のコードの該当行）
+#   =======
+#   （置き換え後の行）
+#   >>>>>>> REPLACE
+_FILE_LINE = re.compile(r'^(?:#+\s*)?FILE\s*:\s*`?([^`\s]+)`?\s*$', re.IGNORECASE)
+_SEARCH_LINE = re.compile(r'^<{5,}\s*SEARCH\s*$')
+_DIVIDER_LINE = re.compile(r'^={5,}\s*$')
+_REPLACE_LINE = re.compile(r'^>{5,}\s*REPLACE\s*$')
+
+
+class PatchApplyError(Exception):
+    """パッチをパース・適用できない場合の例外（呼び出し側は全文再生成にフォールバックする）"""
+    pass
+
+
+class PatchBlock:
+    def __init__(self, file: Optional[str], search: str, replace: str):
+        self.file = file
+        self.search = search
+        self.replace = replace
+
+
+def parse_patch(text: str) -> List[PatchBlock]:
+    """
+    LLMの出力からsearch/replaceブロックを取り出す（ブロック外のテキストやコードフェンスは無視する）。
+    FILE行は以降のブロックの対象ファイルになる。
+    """
+    blocks = []
+    current_file = None
+    state = None
+    search, replace = [], []
+    for line in (text or "").splitlines():
+        stripped = line.strip()
+        if state is None:
+            match = _FILE_LINE.match(stripped)
+            if match:
+                current_file = match.group(1)
+            elif _SEARCH_LINE.match(stripped):
+                state, search = "search", []
+        elif state == "search":
+            if _DIVIDER_LINE.match(stripped):
+                state, replace = "replace", []
+            else:
+                search.append(line)
+        elif _REPLACE_LINE.match(stripped):
+            blocks.append(PatchBlock(current_file, "\n".join(search), "\n".join(replace)))
+            state = None
+        else:
+            replace.append(line)
+    if state is not None:
+        raise PatchApplyError("unterminated search/replace block")
+    if not blocks:
+        raise PatchApplyError("no search/replace blocks found")
+    return blocks
+
+
+def _resolve_file(name: Optional[str], files: Dict[str, str]) -> str:
+    """ブロックの対象ファイル名を解決する（完全一致 -> ファイル名部分 -> 拡張子が一意に一致）"""
+    if name in files:
+        return name
+    if name:
+        basename = name.replace("\\", "/").rsplit("/", 1)[-1]
+        if basename in files:
+            return basename
+        extension = basename.rsplit(".", 1)[-1]
+        candidates = [file for file in files if file.endswith("." + extension)]
+        if len(candidates) == 1:
+            return candidates[0]
+    elif len(files) == 1:
+        return next(iter(files))
+    else:
+        raise PatchApplyError("missing FILE line before search/replace block")
+    raise PatchApplyError(f"unknown target file: {name}")
+
+
+def _replace_once(code: str, search: str, replace: str, file: str) -> str:
+    """searchが1箇所だけに一致する場合に置き換える（完全一致がなければ行単位で前後の空白を無視して探す）"""
+    if not search.strip():
+        raise PatchApplyError(f"empty SEARCH section for {file}")
+    count = code.count(search)
+    if count == 1:
+        return code.replace(search, replace, 1)
+    if count > 1:
+        raise PatchApplyError(f"SEARCH section matches {count} locations in {file}")
+
+    code_lines = code.split("\n")
+    search_lines = [line.strip() for line in search.strip("\n").split("\n")]
+    matches = [
+        i for i in range(len(code_lines) - len(search_lines) + 1)
+        if all(code_lines[i + k].strip() == search_lines[k] for k in range(len(search_lines)))
+    ]
+    if len(matches) != 1:
+        reason = "not found" if not matches else f"matches {len(matches)} locations"
+        raise PatchApplyError(f"SEARCH section {reason} in {file}: {search_lines[0][:80]!r}")
+    start = matches[0]
+    replace_lines = replace.strip("\n").split("\n") if replace.strip() else []
+    return "\n".join(code_lines[:start] + replace_lines + code_lines[start + len(search_lines):])
+
+
+def apply_patch(files: Dict[str, str], blocks: List[PatchBlock]) -> Dict[str, str]:
+    """
+    ファイル名 -> コードにパッチを順に適用した結果を返す（元のdictは変更しない）。
+    1つでも適用できないブロックがあればPatchApplyErrorを送出する（部分適用はしない）。
+    """
+    patched = dict(files)
+    for block in blocks:
+        file = _resolve_file(block.file, patched)
+        patched[file] = _replace_once(patched[file], block.search, block.replace, file)
+    return patched
@@ -0,0 +1,213 @@
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from logger import Logger
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+# キャッシュの残り寿命がこれを下回ったら作り直す（リクエストのタイムアウト180秒より長く取る）
+_EXPIRY_MARGIN_SECONDS = 200
+
+
+class _CacheEntry:
+    def __init__(self, name: str, expires_at: float, tokens: int):
+        self.name = name
+        self.expires_at = expires_at
+        self.tokens = tokens
+
+
+class LocalContextCache:
+    """
+    プロンプトの共通プレフィックス（デザイン・layout・globals.css・サイトマップ等）のコンテキストキャッシュ
+    - キー: モデル名 + プレフィックスのSHA-256（同じサイトの全ページ・全リトライで同一になる）
+    - プレフィックスごとに1回だけ作成し、同時に来たリクエストは作成完了を待って共有する
+    - 作成に失敗したプレフィックスは再作成せず、プレフィックス込みの全文を送信する
+    このクラス自体はプロバイダを使わないローカル代替（テスト用）で、送信内容は全文のまま再利用状況だけを記録する。
+    """
+    provider = "local"
+
+    def __init__(self, ttl_seconds: int, min_tokens: int):
+        self.ttl_seconds = max(ttl_seconds, _EXPIRY_MARGIN_SECONDS * 2)
+        self.min_tokens = min_tokens
+        self._entries: Dict[str, _CacheEntry] = {}
+        self._failed = set()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        # 失効して作り直したキャッシュの名前（release()でクライアントの破棄対象として返す）
+        self._retired: List[str] = []
+        self._lock = threading.Lock()
+        # 統計（snapshot()で参照）
+        self.created = 0
+        self.hits = 0
+        self.skipped = 0
+        self.failed = 0
+        self.reused_tokens = 0
+
+    @staticmethod
+    def make_key(model: str, prefix: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{model}\n".encode("utf-8"))
+        digest.update(prefix.encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _estimate_tokens(prefix: str) -> int:
+        return max(1, len(prefix) // 4)
+
+    def _create(self, key: str, model: str, prefix: str) -> str:
+        """キャッシュを作成して名前を返す（プロバイダ実装で上書きする）"""
+        return f"local/{key[:16]}"
+
+    def _delete(self, name: str) -> None:
+        pass
+
+    def _request(self, entry: _CacheEntry, prefix: str, prompt: str) -> Tuple[str, Optional[str]]:
+        """キャッシュヒット時に送信するプロンプトとcached_content名（ローカル代替では全文を送る）"""
+        return prefix + prompt, None
+
+    def _valid_entry(self, key: str) -> Optional[_CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at - time.monotonic() > _EXPIRY_MARGIN_SECONDS:
+            return entry
+        return None
+
+    def _get_or_create(self, key: str, model: str, prefix: str, tokens: int) -> Optional[_CacheEntry]:
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # 同じプレフィックスの作成は1回だけ（他のリクエストは作成完了を待って同じキャッシュを使う）
+        with key_lock:
+            entry = self._valid_entry(key)
+            if entry is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.reused_tokens += entry.tokens
+                return entry
+            if key in self._failed:
+                return None
+            try:
+                name = self._create(key, model, prefix)
+            except Exception as e:
+                logger.warning(f"[ContextCache] Failed to create {self.provider} cache for {model} (~{tokens} tokens), sending full prompt: {e}")
+                with self._lock:
+                    self.failed += 1
+                    self._failed.add(key)
+                return None
+            entry = _CacheEntry(name, time.monotonic() + self.ttl_seconds, tokens)
+            with self._lock:
+                previous = self._entries.get(key)
+                if previous is not None:
+                    self._retired.append(previous.name)
+                self._entries[key] = entry
+                self.created += 1
+            logger.info(f"[ContextCache] Created {self.provider} cache {name} for {model} (~{tokens} tokens, ttl={self.ttl_seconds}s)")
+            return entry
+
+    def resolve(self, model: str, prefix: str, prompt: str) -> Tuple[str, Optional[str]]:
+        """
+        共通プレフィックスとページ固有プロンプトから、実際に送信するプロンプトとcached_content名を返す。
+        キャッシュを使えない場合は (prefix + prompt, None)。
+        """
+        tokens = self._estimate_tokens(prefix)
+        if tokens < self.min_tokens:
+            with self._lock:
+                self.skipped += 1
+            return prefix + prompt, None
+        entry = self._get_or_create(self.make_key(model, prefix), model, prefix, tokens)
+        if entry is None:
+            return prefix + prompt, None
+        return self._request(entry, prefix, prompt)
+
+    async def aresolve(self, model: str, prefix: str, prompt: str) -> Tuple[str, Optional[str]]:
+        """resolveのasyncio版（キャッシュ作成のAPI呼び出しはスレッドで行い、イベントループをブロックしない）"""
+        return await asyncio.to_thread(self.resolve, model, prefix, prompt)
+
+    def release(self) -> List[str]:
+        """
+        作成済みのキャッシュを破棄し、記録と統計をリセットする（ワークフロー終了時。破棄しなくてもTTLで失効する）。
+        破棄・失効したキャッシュの名前を返す（それを指定して作成したクライアントの破棄用）
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+            names = self._retired + [entry.name for entry in entries]
+            self._entries.clear()
+            self._failed.clear()
+            self._key_locks.clear()
+            self._retired = []
+            self.created = self.hits = self.skipped = self.failed = self.reused_tokens = 0
+        for entry in entries:
+            try:
+                self._delete(entry.name)
+            except Exception as e:
+                logger.debug(f"[ContextCache] Failed to delete {entry.name}: {e}")
+        return names
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "provider": self.provider,
+                "created": self.created,
+                "hits": self.hits,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "reused_tokens": self.reused_tokens,
+            }
+
+
+class GeminiContextCache(LocalContextCache):
+    """
+    Gemini APIのコンテキストキャッシュ（cached_content）を使う実装。
+    プレフィックスはキャッシュ作成時に1回だけ送信し、以降のリクエストはページ固有部分のみ送る。
+    """
+    provider = "gemini"
+
+    def __init__(self, ttl_seconds: int, min_tokens: int):
+        super().__init__(ttl_seconds, min_tokens)
+        self._client = None
+
+    def _genai_client(self):
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=Config.GOOGLE_API_KEY)
+        return self._client
+
+    def _create(self, key: str, model: str, prefix: str) -> str:
+        from google.genai import types
+        cache = self._genai_client().caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name=f"web-dev-mcp-{key[:12]}",
+                contents=[types.Content(role="user", parts=[types.Part(text=prefix)])],
+                ttl=f"{self.ttl_seconds}s",
+            ),
+        )
+        return cache.name
+
+    def _delete(self, name: str) -> None:
+        self._genai_client().caches.delete(name=name)
+
+    def _request(self, entry: _CacheEntry, prefix: str, prompt: str) -> Tuple[str, Optional[str]]:
+        return prompt, entry.name
+
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache() -> Optional[LocalContextCache]:
+    """Configに基づくプロセス共通のコンテキストキャッシュを取得する（LLM_CONTEXT_CACHE=offの場合はNone）"""
+    global _context_cache
+    if Config.LLM_CONTEXT_CACHE not in ("gemini", "local"):
+        return None
+    if _context_cache is None:
+        with _context_cache_lock:
+            if _context_cache is None:
+                # 記録・再生（LLM_BACKEND=record / replay）ではプロンプト全体をキーにするため、Gemini側のキャッシュは使わない
+                use_gemini = Config.LLM_CONTEXT_CACHE == "gemini" and Config.LLM_BACKEND == "gemini"
+                cache_class = GeminiContextCache if use_gemini else LocalContextCache
+                _context_cache = cache_class(
+                    ttl_seconds=Config.LLM_CONTEXT_CACHE_TTL_SECONDS,
+                    min_tokens=Config.LLM_CONTEXT_CACHE_MIN_TOKENS
+                )
+    return _context_cache
@@ -9,6 +9,7 @@ import sys
 import signal
 from config import Config
 from logger import Logger
+from tools.node_toolchain import get_node_toolchain
 
 logger = Logger(log_file=Config.LOG_FILE)
 
@@ -44,9 +45,11 @@ class ExecutionAgent:
             
             # npm run devでサーバーを起動
             logger.info(f"[ExecutionAgent] Starting development server on port {port}")
+            toolchain = get_node_toolchain()
             process = subprocess.Popen(
-                ["npm", "run", "dev", "--", "--port", str(port)],
+                toolchain.command("npm", "run", "dev", "--", "--port", str(port)),
                 cwd=project_path,
+                env=toolchain.env(),
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Iterator, AsyncIterator, List, Optional
+from google.api_core.exceptions import ResourceExhausted
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from config import Config
+from logger import Logger
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+# ストリーミング時に1チャンクとして返す文字数
+_STREAM_CHUNK_CHARS = 64
+# ストリーミング時、レイテンシのうち最初のチャンクまでに割り当てる割合（残りはチャンク間に均等に割り当てる）
+_FIRST_CHUNK_FRACTION = 0.2
+
+
+class FakeLLMMissError(Exception):
+    """replayモードで記録済みレスポンスがなく、代替の応答関数も設定されていない場合の例外"""
+    pass
+
+
+def _prompt_text(value: Any) -> str:
+    """invokeの入力（文字列・メッセージのリスト・PromptValue）をキー計算用のテキストにする"""
+    if isinstance(value, str):
+        return value
+    if hasattr(value, "to_messages"):
+        value = value.to_messages()
+    if isinstance(value, (list, tuple)):
+        return "\n".join(message.content if isinstance(message, BaseMessage) else str(message) for message in value)
+    return str(value)
+
+
+def _usage(prompt: str, content: str) -> Dict:
+    input_tokens = max(1, len(prompt) // 4)
+    output_tokens = len(content) // 4
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    レイテンシ分布の指定をパースする（秒）
+    - "0" / "1.5": 固定値
+    - "uniform:最小:最大"
+    - "lognormal:中央値:sigma"（裾の長い分布。sigmaが大きいほど遅い呼び出しが増える）
+    """
+    parts = [part.strip() for part in (spec or "0").split(":")]
+    try:
+        if parts[0] == "uniform":
+            low, high = float(parts[1]), float(parts[2])
+            return lambda rng: rng.uniform(low, high)
+        if parts[0] == "lognormal":
+            import math
+            median, sigma = float(parts[1]), float(parts[2])
+            return lambda rng: rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        fixed = float(parts[-1])
+        return lambda rng: fixed
+    except (ValueError, IndexError):
+        logger.warning(f"[FakeLLM] Ignoring invalid LLM_FAKE_LATENCY: {spec}")
+        return lambda rng: 0.0
+
+
+class LLMRecordingStore:
+    """
+    プロンプトのハッシュ -> 記録済みレスポンス（JSON Linesファイル）
+    同じキーで複数回記録されている場合（リトライ・複数候補など）は、replay時に記録順に返す（末尾まで来たら先頭に戻る）。
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._responses: Dict[str, List[str]] = {}
+        self._replayed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, schema: Optional[str] = None) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{model}\n{schema or ''}\n".encode("utf-8"))
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self._responses.setdefault(entry["key"], []).append(entry["response"])
+        logger.info(f"[FakeLLM] Loaded {sum(len(v) for v in self._responses.values())} recorded responses from {self.path}")
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+    def next_response(self, key: str) -> Optional[str]:
+        with self._lock:
+            responses = self._responses.get(key)
+            if not responses:
+                return None
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+            return responses[index % len(responses)]
+
+    def record(self, key: str, model: str, prompt: str, response: str, schema: Optional[str] = None) -> None:
+        entry = {"key": key, "model": model, "schema": schema, "prompt_preview": prompt[:200], "response": response}
+        with self._lock:
+            self._responses.setdefault(key, []).append(response)
+            if not self.path:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class FakeLLMBackend:
+    """
+    ChatGoogleGenerativeAIの代わりに使うオフラインのLLMバックエンド（LLM_BACKEND=replay / record）
+    - replay: 記録済みレスポンスを返す。記録がない場合はresponder（プロンプトから応答を作る関数）を呼び、それもなければFakeLLMMissError
+      LLM_FAKE_LATENCYの分布で待機し、LLM_FAKE_RATE_LIMIT_RATEの確率で429（ResourceExhausted）を送出する
+    - record: 実際のGeminiを呼び出し、レスポンスを記録する（待機・429の注入はしない）
+    乱数はLLM_FAKE_SEEDで初期化するため、同じ呼び出し順なら同じレイテンシ・429が再現される。
+    """
+
+    def __init__(self, mode: str, store: LLMRecordingStore, latency: str = "0", rate_limit_rate: float = 0.0, seed: int = 0,
+                 responder: Optional[Callable[[str, str, Optional[str]], str]] = None):
+        self.mode = mode
+        self.store = store
+        self.responder = responder
+        self.rate_limit_rate = rate_limit_rate
+        self._latency = parse_latency(latency)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # 統計（snapshot()で参照）
+        self.calls = 0
+        self.replayed = 0
+        self.responded = 0
+        self.recorded = 0
+        self.rate_limited = 0
+
+    def snapshot(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "calls": self.calls,
+            "replayed": self.replayed,
+            "responded": self.responded,
+            "recorded": self.recorded,
+            "rate_limited": self.rate_limited,
+        }
+
+    def begin_call(self, model: str) -> float:
+        """呼び出しを数え、429を注入するか判定して、待機するレイテンシ（秒）を返す"""
+        with self._lock:
+            self.calls += 1
+            if self.mode != "replay":
+                return 0.0
+            if self.rate_limit_rate > 0 and self._rng.random() < self.rate_limit_rate:
+                self.rate_limited += 1
+                retry = round(self._rng.uniform(0.1, 1.0), 2)
+                raise ResourceExhausted(f"429 RESOURCE_EXHAUSTED: quota exceeded for {model} (injected by fake LLM backend). Please retry in {retry}s.")
+            return max(0.0, self._latency(self._rng))
+
+    def respond(self, model: str, prompt: str, schema: Optional[str] = None) -> str:
+        """replayモードのレスポンス（記録済み -> responder -> FakeLLMMissError の順）"""
+        key = LLMRecordingStore.make_key(model, prompt, schema)
+        content = self.store.next_response(key)
+        if content is not None:
+            with self._lock:
+                self.replayed += 1
+            return content
+        if self.responder is not None:
+            with self._lock:
+                self.responded += 1
+            return self.responder(model, prompt, schema)
+        raise FakeLLMMissError(f"No recorded response for model={model} schema={schema} key={key[:12]}: {prompt[:120]!r}")
+
+    def record(self, model: str, prompt: str, content: str, schema: Optional[str] = None) -> None:
+        self.store.record(LLMRecordingStore.make_key(model, prompt, schema), model, prompt, content, schema)
+        with self._lock:
+            self.recorded += 1
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    FakeLLMBackendを使うチャットモデル。ChatGoogleGenerativeAIと同じくinvoke / ainvoke / stream / astream /
+    with_structured_output(include_raw=True)に対応し、usage_metadata（文字数/4の推定値）を返す。
+    recordモードではdelegate（実際のChatGoogleGenerativeAI）を呼び出して記録する。
+    """
+    model: str
+    temperature: float = 0.2
+    backend: Any = None
+    delegate: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _message(self, prompt: str, content: str, chunk: bool = False):
+        message_class = AIMessageChunk if chunk else AIMessage
+        return message_class(content=content, usage_metadata=_usage(prompt, content))
+
+    # --- invoke / ainvoke ---
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = _prompt_text(messages)
+        delay = self.backend.begin_call(self.model)
+        if self.delegate is not None:
+            message = self.delegate.invoke(messages)
+            self.backend.record(self.model, prompt, message.content)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        time.sleep(delay)
+        content = self.backend.respond(self.model, prompt)
+        return ChatResult(generations=[ChatGeneration(message=self._message(prompt, content))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = _prompt_text(messages)
+        delay = self.backend.begin_call(self.model)
+        if self.delegate is not None:
+            message = await self.delegate.ainvoke(messages)
+            self.backend.record(self.model, prompt, message.content)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        await asyncio.sleep(delay)
+        content = self.backend.respond(self.model, prompt)
+        return ChatResult(generations=[ChatGeneration(message=self._message(prompt, content))])
+
+    # --- stream / astream ---
+    def _chunks(self, prompt: str, content: str) -> List[str]:
+        return [content[i:i + _STREAM_CHUNK_CHARS] for i in range(0, len(content), _STREAM_CHUNK_CHARS)] or [""]
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        prompt = _prompt_text(messages)
+        delay = self.backend.begin_call(self.model)
+        if self.delegate is not None:
+            parts = []
+            try:
+                for chunk in self.delegate.stream(messages):
+                    parts.append(chunk.content if isinstance(chunk.content, str) else "")
+                    yield ChatGenerationChunk(message=chunk)
+            finally:
+                # 呼び出し側が必要な出力を受け取って途中で閉じた場合も、受信済みの分を記録する
+                if parts:
+                    self.backend.record(self.model, prompt, "".join(parts))
+            return
+        content = self.backend.respond(self.model, prompt)
+        pieces = self._chunks(prompt, content)
+        time.sleep(delay * _FIRST_CHUNK_FRACTION)
+        for i, piece in enumerate(pieces):
+            if i > 0:
+                time.sleep(delay * (1 - _FIRST_CHUNK_FRACTION) / len(pieces))
+            # usage_metadataは最後のチャンクにまとめて付ける（呼び出し側はチャンクごとの値を合計する）
+            message = self._message(prompt, content, chunk=True) if i == len(pieces) - 1 else AIMessageChunk(content=piece)
+            message.content = piece
+            yield ChatGenerationChunk(message=message)
+
+    async def _astream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        prompt = _prompt_text(messages)
+        delay = self.backend.begin_call(self.model)
+        if self.delegate is not None:
+            parts = []
+            try:
+                async for chunk in self.delegate.astream(messages):
+                    parts.append(chunk.content if isinstance(chunk.content, str) else "")
+                    yield ChatGenerationChunk(message=chunk)
+            finally:
+                if parts:
+                    self.backend.record(self.model, prompt, "".join(parts))
+            return
+        content = self.backend.respond(self.model, prompt)
+        pieces = self._chunks(prompt, content)
+        await asyncio.sleep(delay * _FIRST_CHUNK_FRACTION)
+        for i, piece in enumerate(pieces):
+            if i > 0:
+                await asyncio.sleep(delay * (1 - _FIRST_CHUNK_FRACTION) / len(pieces))
+            message = self._message(prompt, content, chunk=True) if i == len(pieces) - 1 else AIMessageChunk(content=piece)
+            message.content = piece
+            yield ChatGenerationChunk(message=message)
+
+    # --- with_structured_output ---
+    def _structured_result(self, prompt: str, content: str, schema, include_raw: bool):
+        raw = self._message(prompt, content)
+        try:
+            parsed, error = schema(**json.loads(content)), None
+        except Exception as e:
+            parsed, error = None, e
+        if include_raw:
+            return {"raw": raw, "parsed": parsed, "parsing_error": error}
+        if error is not None:
+            raise error
+        return parsed
+
+    def _recorded_structured(self, prompt: str, result, schema, include_raw: bool):
+        """recordモード：実際の構造化出力の結果を、検証済みJSON（失敗時は生テキスト）として記録する"""
+        parsed = result.get("parsed") if include_raw else result
+        if parsed is not None:
+            content = json.dumps(parsed.dict(), ensure_ascii=False)
+        else:
+            raw = result.get("raw")
+            content = raw.content if raw is not None and isinstance(raw.content, str) else ""
+        self.backend.record(self.model, prompt, content, schema.__name__)
+        return result
+
+    def with_structured_output(self, schema, include_raw: bool = False, **kwargs):
+        structured_delegate = self.delegate.with_structured_output(schema, include_raw=include_raw, **kwargs) if self.delegate is not None else None
+
+        def invoke(value):
+            prompt = _prompt_text(value)
+            delay = self.backend.begin_call(self.model)
+            if structured_delegate is not None:
+                return self._recorded_structured(prompt, structured_delegate.invoke(value), schema, include_raw)
+            time.sleep(delay)
+            return self._structured_result(prompt, self.backend.respond(self.model, prompt, schema.__name__), schema, include_raw)
+
+        async def ainvoke(value):
+            prompt = _prompt_text(value)
+            delay = self.backend.begin_call(self.model)
+            if structured_delegate is not None:
+                return self._recorded_structured(prompt, await structured_delegate.ainvoke(value), schema, include_raw)
+            await asyncio.sleep(delay)
+            return self._structured_result(prompt, self.backend.respond(self.model, prompt, schema.__name__), schema, include_raw)
+
+        return RunnableLambda(invoke, afunc=ainvoke)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_fake_llm_backend() -> FakeLLMBackend:
+    """Configに基づくプロセス共通のFakeLLMBackendを取得する"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = Config.LLM_FAKE_RECORDINGS
+                if path and not os.path.isabs(path):
+                    # プロジェクトルートからの絶対パスを構築
+                    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), path)
+                _backend = FakeLLMBackend(
+                    mode=Config.LLM_BACKEND,
+                    store=LLMRecordingStore(path),
+                    latency=Config.LLM_FAKE_LATENCY,
+                    rate_limit_rate=Config.LLM_FAKE_RATE_LIMIT_RATE,
+                    seed=Config.LLM_FAKE_SEED
+                )
+    return _backend
+
+
+def create_fake_llm(model: str, temperature: float = 0.2, delegate=None) -> FakeChatModel:
+    """LLMClientRegistryから呼ばれる（recordモードの場合はdelegateに実際のクライアントを渡す）"""
+    return FakeChatModel(model=model, temperature=temperature, backend=get_fake_llm_backend(), delegate=delegate)
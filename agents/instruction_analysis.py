@@ -1,8 +1,6 @@
 import os
 from dotenv import load_dotenv
 import json
-import time
-import random
 from google.api_core.exceptions import ResourceExhausted, TooManyRequests
 from config import Config
 from logger import Logger
@@ -12,7 +10,10 @@ load_dotenv()
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from langchain.output_parsers import PydanticOutputParser, OutputFixingParser
-from langchain_google_genai import ChatGoogleGenerativeAI
+from agents.llm_client import get_llm, invoke_llm, invoke_structured
+from agents.llm_telemetry import llm_tags
+from agents.circuit_breaker import ProviderUnavailableError
+from agents.json_extraction import record_fallback
 from agents.prompts import INSTRUCTION_ANALYSIS_PROMPT
 
 logger = Logger(log_file=Config.LOG_FILE)
@@ -39,27 +40,13 @@ class InstructionAnalysisAgent:
         logger.info(f"[InstructionAnalysisAgent] Analyzing user instruction...")
         parser = PydanticOutputParser(pydantic_object=OutputSchema)
         
-        # Gemini APIレート制限対応のリトライロジック
+        # パース失敗・API失敗時のリトライ（429の待機・バックオフは共有レートリミッターが担当）
         max_retries = 3
-        base_delay = 2
         
         for attempt in range(max_retries):
             try:
                 if attempt > 0:
-                    # 指数バックオフ + ランダム要素
-                    delay = base_delay * (2 ** (attempt - 1)) + random.uniform(0.5, 1.5)
-                    logger.info(f"[InstructionAnalysisAgent] Retrying Gemini API call, attempt {attempt + 1}, waiting {delay:.2f} seconds")
-                    time.sleep(delay)
-                
-                fixing_parser = OutputFixingParser.from_llm(
-                    parser=parser, 
-                    llm=ChatGoogleGenerativeAI(
-                        model="gemini-2.5-pro-preview-06-05", 
-                        temperature=0.2, 
-                        google_api_key=Config.GOOGLE_API_KEY,
-                        timeout=180  # 3分タイムアウト
-                    )
-                )
+                    logger.info(f"[InstructionAnalysisAgent] Retrying Gemini API call, attempt {attempt + 1}")
                 
                 # プロンプトを明確に構造化してuser_instructionを強調
                 prompt = f"""
@@ -77,21 +64,25 @@ IMPORTANT: Focus on the user requirements above and transform them into the spec
                 logger.debug(f"[InstructionAnalysisAgent] User instruction length: {len(user_instruction)} characters")
                 logger.debug(f"[InstructionAnalysisAgent] Full prompt constructed")
                 
-                # レート制限回避のための軽微な遅延
-                if attempt == 0:
-                    time.sleep(random.uniform(0.3, 0.8))
-                
-                llm = ChatGoogleGenerativeAI(
-                    model="gemini-2.5-pro-preview-06-05", 
-                    temperature=0.2, 
-                    google_api_key=Config.GOOGLE_API_KEY,
-                    timeout=180  # 3分タイムアウト
-                )
-                response = llm.invoke(prompt)
+                with llm_tags(stage="analysis", attempt=attempt + 1):
+                    if Config.LLM_STRUCTURED_OUTPUT:
+                        # OutputSchemaスキーマで生成させ、pydanticで直接検証する
+                        response = invoke_structured(prompt, "gemini-2.5-pro-preview-06-05", OutputSchema, temperature=0.2, timeout=180)  # 3分タイムアウト
+                    else:
+                        response = invoke_llm(prompt, "gemini-2.5-pro-preview-06-05", temperature=0.2, timeout=180)  # 3分タイムアウト
                 logger.info(f"[InstructionAnalysisAgent] Successfully called Gemini API on attempt {attempt + 1}")
                 
                 try:
-                    result = fixing_parser.parse(response.content)
+                    if response.parsed is not None:
+                        result = response.parsed
+                    else:
+                        # 構造化出力が無効、または検証に失敗した場合のみOutputFixingParser（修正用のLLM呼び出しを伴う）を使う
+                        record_fallback("instruction_analysis")
+                        fixing_parser = OutputFixingParser.from_llm(
+                            parser=parser, 
+                            llm=get_llm("gemini-2.5-pro-preview-06-05", temperature=0.2, timeout=180)  # 3分タイムアウト
+                        )
+                        result = fixing_parser.parse(response.content)
                     logger.debug(f"[InstructionAnalysisAgent] Successfully parsed result with {len(result.pages)} pages")
                     logger.info(f"[InstructionAnalysisAgent] Analysis complete - generated {len(result.pages)} pages: {[p.name for p in result.pages]}")
                     return result.dict()
@@ -104,11 +95,13 @@ IMPORTANT: Focus on the user requirements above and transform them into the spec
                     continue
                 
             except (ResourceExhausted, TooManyRequests) as e:
-                logger.warning(f"[InstructionAnalysisAgent] Rate limit hit on attempt {attempt + 1}: {e}")
-                if attempt == max_retries - 1:
-                    logger.error(f"[InstructionAnalysisAgent] Rate limit exceeded after {max_retries} attempts")
-                    return {"overall_design": "", "pages": [], "siteMap": []}
-                continue
+                # レートリミッター側でリトライ済みのため、ここで再試行してもクォータを浪費するだけ
+                logger.error(f"[InstructionAnalysisAgent] Rate limit exceeded after limiter retries: {e}")
+                return {"overall_design": "", "pages": [], "siteMap": []}
+
+            except ProviderUnavailableError:
+                # プロバイダ障害中はリトライせず、ワークフローを即座に停止させる
+                raise
                 
             except Exception as e:
                 logger.warning(f"[InstructionAnalysisAgent] API call failed on attempt {attempt + 1}: {e}")
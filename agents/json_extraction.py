@@ -0,0 +1,224 @@
+import re
+import json
+import threading
+from collections import Counter
+from typing import Dict, Iterator, List, Optional
+from config import Config
+from logger import Logger
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+# 文字列外では括弧と引用符、文字列内では引用符とエスケープだけを見ればよい
+_STRUCTURAL_CHARS = re.compile(r'[{}"]')
+_STRING_CHARS = re.compile(r'["\\]')
+
+
+class IncrementalJSONExtractor:
+    """
+    ストリーミング中のテキストからトップレベルのJSONオブジェクトを逐次取り出す。
+    - 文字列リテラルを考慮した括弧スキャン（code内の { } や \\" で誤検知しない）
+    - 前回の走査位置から再開するため、チャンクを何度feedしても全体で線形時間
+    - オブジェクト外のテキスト（前置き、```json フェンスなど）は読み飛ばす
+    - 閉じたがデコードできないオブジェクトは、開始位置の次から読み直して中のオブジェクトを探す
+      （テキストの終わりまで閉じなかったオブジェクトはfinish()で同様に読み直す）
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.objects: List[dict] = []
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._start = None
+        self._last_object_end = 0
+
+    def feed(self, chunk: str) -> List[dict]:
+        """チャンクを追加し、このチャンクで閉じたJSONオブジェクトを返す"""
+        self.text += chunk
+        text = self.text
+        completed = []
+        i = self._pos
+        n = len(text)
+        while i < n:
+            if self._depth == 0:
+                j = text.find("{", i)
+                if j < 0:
+                    i = n
+                    break
+                # JSONオブジェクトは必ず {" か {} で始まる（前置きの文章中の { は読み飛ばす）
+                k = j + 1
+                while k < n and text[k] in " \t\r\n":
+                    k += 1
+                if k >= n:
+                    # 次の文字が次のチャンクに来るまで待つ
+                    i = j
+                    break
+                if text[k] not in '"}':
+                    i = j + 1
+                    continue
+                self._start = j
+                self._depth = 1
+                self._in_string = False
+                i = j + 1
+                continue
+
+            match = (_STRING_CHARS if self._in_string else _STRUCTURAL_CHARS).search(text, i)
+            if match is None:
+                i = n
+                break
+            j = match.start()
+            char = text[j]
+            if self._in_string:
+                if char == "\\":
+                    if j + 1 >= n:
+                        # エスケープ対象の文字が次のチャンクに来るまで待つ
+                        i = j
+                        break
+                    i = j + 2
+                    continue
+                if char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    obj = self._decode(text[self._start:j + 1])
+                    start, self._start = self._start, None
+                    if obj is None:
+                        # 壊れたオブジェクト（括弧の対応は取れている）。中に有効なオブジェクトがあれば取り出す
+                        self._in_string = False
+                        i = start + 1
+                        continue
+                    completed.append(obj)
+                    self.objects.append(obj)
+                    self._last_object_end = j + 1
+            i = j + 1
+        self._pos = i
+        return completed
+
+    def finish(self) -> List[dict]:
+        """
+        テキストの終わりに呼ぶ。閉じていないオブジェクト（括弧が足りない・途中で切れた）があれば、
+        その開始位置の次から読み直し、後ろにある閉じたオブジェクトを返す
+        """
+        completed = []
+        while self._depth > 0:
+            self._pos = self._start + 1
+            self._depth = 0
+            self._in_string = False
+            self._start = None
+            completed.extend(self.feed(""))
+        return completed
+
+    @staticmethod
+    def _decode(candidate: str) -> Optional[dict]:
+        try:
+            # strict=False: 文字列内の生の改行・タブ（LLMがよく出力する）を許容する
+            obj = json.loads(candidate, strict=False)
+        except ValueError:
+            return None
+        return obj if isinstance(obj, dict) else None
+
+    @property
+    def in_object(self) -> bool:
+        return self._depth > 0
+
+    @property
+    def chars_since_object(self) -> int:
+        """直前のオブジェクト（なければ先頭）以降、オブジェクト外で読み進めた文字数"""
+        if self.in_object:
+            return 0
+        return len(self.text) - self._last_object_end
+
+
+# 正規表現によるフォールバックパースの利用回数（構造化出力・逐次抽出で取り出せなかった回数）
+_fallback_counts = Counter()
+_fallback_lock = threading.Lock()
+
+
+def record_fallback(label: str) -> None:
+    with _fallback_lock:
+        _fallback_counts[label] += 1
+    logger.debug(f"[json_extraction] Regex fallback used: {label}")
+
+
+def get_fallback_stats() -> Dict[str, int]:
+    """呼び出し元ラベルごとのフォールバック利用回数"""
+    with _fallback_lock:
+        return dict(_fallback_counts)
+
+
+def iter_json_objects(text: str) -> Iterator[dict]:
+    """
+    テキスト中のトップレベルのJSONオブジェクトを先頭から順に返す（1パス・線形時間）。
+    部分文字列のコピーは閉じたオブジェクトのデコード時のみ行う。
+    """
+    extractor = IncrementalJSONExtractor()
+    yield from extractor.feed(text)
+    yield from extractor.finish()
+
+
+def _find_matching(obj, required_fields: Optional[list]) -> Iterator[dict]:
+    """必須フィールドを満たすdictを返す。満たさない場合はラッパー（{"files": [...]}等）の中を探す"""
+    if isinstance(obj, dict):
+        if not required_fields or all(field in obj for field in required_fields):
+            yield obj
+            return
+        children = obj.values()
+    elif isinstance(obj, list):
+        children = obj
+    else:
+        return
+    for child in children:
+        yield from _find_matching(child, required_fields)
+
+
+# 共通JSONパースユーティリティ（構造化出力・逐次抽出が使えない場合のフォールバック）
+def robust_json_parser(content: str, required_fields: list = None, specific_patterns: list = None, extract_multiple: bool = False, label: str = None):
+    """
+    堅牢なJSONパース共通関数
+    
+    Args:
+        content: パースするテキストコンテンツ
+        required_fields: 必須フィールドリスト（例: ['score', 'feedback', 'passed']）
+        specific_patterns: 特化パターンリスト（括弧スキャンで見つからなかった場合のみ使用）
+        extract_multiple: 複数のJSONオブジェクト抽出フラグ
+        label: 利用回数の集計キー（get_fallback_stats()で参照）
+        
+    Returns:
+        dict or list: パースされたJSONオブジェクト（extract_multiple=Trueの場合はリスト）
+    """
+    record_fallback(label or "unknown")
+    parsed_objects = []
+    
+    # 文字列を考慮した括弧スキャンで1パス抽出（コードブロック内外・前置きの文章を問わない）
+    for obj in iter_json_objects(content):
+        for matched in _find_matching(obj, required_fields):
+            if not extract_multiple:
+                return matched
+            parsed_objects.append(matched)
+    
+    # 特化パターンマッチング（JSON全体の括弧が壊れている場合の最後の手段）
+    if not parsed_objects and specific_patterns:
+        for pattern in specific_patterns:
+            for candidate in re.findall(pattern, content, re.DOTALL):
+                try:
+                    parsed = json.loads(candidate.strip(), strict=False)
+                except ValueError as e:
+                    logger.debug(f"[robust_json_parser] JSON parse failed: {e}, candidate length: {len(candidate)}")
+                    continue
+                for matched in _find_matching(parsed, required_fields):
+                    if not extract_multiple:
+                        return matched
+                    parsed_objects.append(matched)
+    
+    # 結果を返す
+    if extract_multiple:
+        return parsed_objects
+    elif parsed_objects:
+        return parsed_objects[0]
+    else:
+        return None
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional
+from config import Config
+from logger import Logger
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+# 上限を超えたときに削除して残す合計サイズの割合
+EVICT_TARGET_RATIO = 0.9
+
+
+class LLMResponseCache:
+    """
+    LLMレスポンスのコンテンツアドレス型ディスクキャッシュ
+    - キー: モデル名 + temperature + 展開済みプロンプトのSHA-256
+    - 1エントリ1ファイル（cache_dir/<key先頭2文字>/<key>.json）
+    - ヒット時にmtimeを更新し、合計サイズが上限を超えたらmtimeの古い順に削除（LRU）
+      合計サイズは書き込み・削除ごとに加減算した見積もりで判定し、ディレクトリの走査は上限を超えたときだけ行う
+    - TTLを過ぎたエントリはミス扱いとして削除
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, ttl_seconds: int, enabled: bool = True, bypass: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        # bypass=Trueの場合は読み込みをスキップし、書き込みのみ行う（強制リフレッシュ）
+        self.bypass = bypass
+        self._lock = threading.Lock()
+        # キャッシュの合計サイズの見積もり（最初の書き込み時に1回だけ走査して初期化する）
+        self._total_bytes: Optional[int] = None
+
+    @staticmethod
+    def make_key(model: str, prompt: str, temperature: float = 0.2) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{model}\n{float(temperature)}\n".encode("utf-8"))
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュ済みのレスポンス本文を返す。ミス・期限切れ・無効時はNone"""
+        if not self.enabled or self.bypass:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug(f"[LLMResponseCache] Broken cache entry {key[:12]}: {e}")
+            self.invalidate(key)
+            return None
+
+        if self.ttl_seconds > 0 and time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            logger.debug(f"[LLMResponseCache] Expired entry {key[:12]}")
+            self.invalidate(key)
+            return None
+
+        # LRU管理のためアクセス時刻を更新
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry.get("content")
+
+    def set(self, key: str, model: str, content: str) -> None:
+        if not self.enabled or not content:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"model": model, "created_at": time.time(), "content": content}, f, ensure_ascii=False)
+            new_size = os.path.getsize(tmp_path)
+            old_size = self._size(path)
+            # 並列書き込みでも壊れたファイルを読ませないようにアトミックに置換
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"[LLMResponseCache] Failed to write cache entry {key[:12]}: {e}")
+            return
+        self._add_bytes(new_size - old_size)
+
+    def invalidate(self, key: Optional[str]) -> None:
+        """レビュー不合格などで再利用すべきでないエントリを削除する"""
+        if not key:
+            return
+        path = self._path(key)
+        size = self._size(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.debug(f"[LLMResponseCache] Failed to invalidate {key[:12]}: {e}")
+            return
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes = max(0, self._total_bytes - size)
+
+    @staticmethod
+    def _size(path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _add_bytes(self, delta: int) -> None:
+        """合計サイズの見積もりを更新し、上限を超えた場合だけ走査して削除する"""
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan()[1]
+            else:
+                self._total_bytes += delta
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        """キャッシュ内の全エントリ（mtime, サイズ, パス）と合計サイズ"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def _evict(self) -> None:
+        """
+        合計サイズが上限を超えた場合、最終アクセスの古いエントリから削除する（self._lockを保持して呼ぶ）。
+        他プロセスの書き込みも反映するため、実際のサイズで見積もりを更新する。
+        上限に張り付いて書き込みのたびに走査しないよう、上限の90%まで削除する
+        """
+        entries, total = self._scan()
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= target:
+                    break
+            logger.debug(f"[LLMResponseCache] Evicted entries, cache size now {total} bytes")
+        self._total_bytes = total
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> LLMResponseCache:
+    """Configに基づくプロセス共通のレスポンスキャッシュを取得する"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                # プロジェクトルートからの絶対パスを構築
+                project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                _response_cache = LLMResponseCache(
+                    cache_dir=os.path.join(project_root, Config.LLM_CACHE_DIR),
+                    max_bytes=Config.LLM_CACHE_MAX_BYTES,
+                    ttl_seconds=Config.LLM_CACHE_TTL_SECONDS,
+                    enabled=Config.LLM_CACHE_ENABLED,
+                    bypass=Config.LLM_CACHE_BYPASS
+                )
+    return _response_cache
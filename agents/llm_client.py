@@ -0,0 +1,486 @@
+import json
+import asyncio
+import threading
+import weakref
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from langchain_google_genai import ChatGoogleGenerativeAI
+from config import Config
+from logger import Logger
+from agents.llm_cache import get_response_cache
+from agents.rate_limiter import get_rate_limiter, is_rate_limit_error
+from agents.context_cache import get_context_cache
+from agents.llm_telemetry import track_llm_call, record_cache_hit
+from agents.llm_hedging import hedge_delay, arun_hedged
+from agents.circuit_breaker import get_circuit_breakers
+from agents.fake_llm import create_fake_llm
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+
+def _create_client(model: str, temperature: float, timeout: int, cached_content: Optional[str]):
+    """
+    クライアントを生成する。
+    LLM_BACKEND=replayの場合はオフラインのFakeChatModel、recordの場合は実際のクライアントを包んで応答を記録するFakeChatModel
+    """
+    if Config.LLM_BACKEND == "replay":
+        return create_fake_llm(model, temperature)
+    client = ChatGoogleGenerativeAI(
+        model=model,
+        temperature=temperature,
+        google_api_key=Config.GOOGLE_API_KEY,
+        timeout=timeout,
+        # 429のリトライ・バックオフはレートリミッターで一元管理するため、SDK側のリトライは無効化
+        max_retries=1,
+        cached_content=cached_content
+    )
+    if Config.LLM_BACKEND == "record":
+        return create_fake_llm(model, temperature, delegate=client)
+    return client
+
+
+# Geminiクライアントをプロセス全体で共有するレジストリ
+class LLMClientRegistry:
+    """
+    (model, temperature, timeout, cached_content) をキーにChatGoogleGenerativeAIを1インスタンスだけ生成して使い回す。
+    認証・トランスポートの初期化は初回のみとなり、確立済みのkeep-alive接続を
+    全エージェント・全ワーカースレッドで共有する。
+    cached_content: コンテキストキャッシュ名（共通プレフィックスをキャッシュ済みの場合のみ指定）。
+    キャッシュの破棄時にdiscard()でそのキャッシュ名のクライアントを破棄し、サイトごとに増え続けないようにする
+    """
+    _clients: Dict[Tuple[str, float, int, Optional[str]], ChatGoogleGenerativeAI] = {}
+    _async_clients = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, model: str, temperature: float = 0.2, timeout: int = 180, cached_content: Optional[str] = None) -> ChatGoogleGenerativeAI:
+        key = (model, float(temperature), int(timeout), cached_content)
+        client = cls._clients.get(key)
+        if client is not None:
+            return client
+        with cls._lock:
+            # ロック取得待ちの間に他スレッドが生成している可能性があるため再確認
+            client = cls._clients.get(key)
+            if client is None:
+                logger.debug(f"[LLMClientRegistry] Creating client: model={model}, temperature={temperature}, timeout={timeout}")
+                client = _create_client(model, temperature, timeout, cached_content)
+                cls._clients[key] = client
+            return client
+
+    @classmethod
+    def get_async(cls, model: str, temperature: float = 0.2, timeout: int = 180, cached_content: Optional[str] = None) -> ChatGoogleGenerativeAI:
+        """
+        ainvoke用のクライアントを取得する。
+        非同期トランスポートは生成時のイベントループに紐づくため、ループごとにインスタンスを保持し、
+        ループの破棄とともに解放する（同一ループ内では接続を使い回す）。
+        """
+        loop = asyncio.get_running_loop()
+        key = (model, float(temperature), int(timeout), cached_content)
+        with cls._lock:
+            loop_clients = cls._async_clients.setdefault(loop, {})
+            client = loop_clients.get(key)
+            if client is None:
+                logger.debug(f"[LLMClientRegistry] Creating async client: model={model}, temperature={temperature}, timeout={timeout}")
+                client = _create_client(model, temperature, timeout, cached_content)
+                loop_clients[key] = client
+            return client
+
+    @classmethod
+    def discard(cls, cached_contents: Iterable[str]) -> None:
+        """破棄・失効したコンテキストキャッシュを指定して作成したクライアントを破棄する（ワークフロー終了時）"""
+        names = set(cached_contents)
+        if not names:
+            return
+        with cls._lock:
+            for clients in [cls._clients] + list(cls._async_clients.values()):
+                for key in [key for key in clients if key[3] in names]:
+                    del clients[key]
+
+    @classmethod
+    def clear(cls):
+        """登録済みクライアントを破棄する（APIキー変更時やテスト用）"""
+        with cls._lock:
+            cls._clients.clear()
+            cls._async_clients.clear()
+
+
+def get_llm(model: str, temperature: float = 0.2, timeout: int = 180, cached_content: Optional[str] = None) -> ChatGoogleGenerativeAI:
+    """共有Geminiクライアントを取得する"""
+    return LLMClientRegistry.get(model, temperature, timeout, cached_content)
+
+
+def _estimate_tokens(prompt: str) -> int:
+    """TPMバケット用の入力トークン数の見積もり（送信後にusage_metadataで精算する）"""
+    return max(1, len(prompt) // 4)
+
+
+class LLMResponse:
+    """invoke_llmの戻り値（AIMessageと同様に.contentで本文を参照できる）"""
+    def __init__(self, content: str, model: str, cache_key: Optional[str] = None, cached: bool = False, parsed=None):
+        self.content = content
+        self.model = model
+        self.cache_key = cache_key
+        self.cached = cached
+        # 構造化出力（invoke_structured）の場合の検証済みpydanticモデル。検証できなかった場合はNone
+        self.parsed = parsed
+
+
+class StreamAbortedError(Exception):
+    """ストリーミング中に期待するスキーマから外れたと判断して生成を打ち切った場合の例外"""
+    def __init__(self, message: str, content: str = ""):
+        super().__init__(message)
+        self.content = content
+
+
+def _lookup_cache(prompt: str, model: str, temperature: float, use_cache: bool) -> Tuple[Optional[str], Optional[LLMResponse]]:
+    """キャッシュキーと、ヒットした場合はキャッシュ済みレスポンスを返す"""
+    if not use_cache:
+        return None, None
+    cache = get_response_cache()
+    cache_key = cache.make_key(model, prompt, temperature)
+    content = cache.get(cache_key)
+    if content is None:
+        return cache_key, None
+    logger.info(f"[LLMClient] Cache hit: model={model}, key={cache_key[:12]}")
+    return cache_key, LLMResponse(content, model, cache_key=cache_key, cached=True)
+
+
+def _split_prompt(model: str, prompt: str, prefix: str) -> Tuple[str, Optional[str]]:
+    """
+    実際に送信するプロンプトとcached_content名を返す。
+    共通プレフィックスがコンテキストキャッシュ済みならページ固有部分のみを送り、そうでなければ全文を送る。
+    """
+    context_cache = get_context_cache() if prefix else None
+    if context_cache is None:
+        return prefix + prompt, None
+    return context_cache.resolve(model, prefix, prompt)
+
+
+async def _asplit_prompt(model: str, prompt: str, prefix: str) -> Tuple[str, Optional[str]]:
+    """_split_promptのasyncio版"""
+    context_cache = get_context_cache() if prefix else None
+    if context_cache is None:
+        return prefix + prompt, None
+    return await context_cache.aresolve(model, prefix, prompt)
+
+
+def _chunk_text(chunk) -> str:
+    """AIMessageChunkからテキスト部分を取り出す（contentがパーツのリストの場合にも対応）"""
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content or []:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and part.get("type") == "text":
+            parts.append(part.get("text", ""))
+    return "".join(parts)
+
+
+def _call_with_rate_limit(model: str, prompt: str, call: Callable[[], object]):
+    """
+    レートリミッターから送信枠を取得してcall()を実行し、429の場合はバックオフしてリトライする。
+    モデルのサーキットブレーカーが開いている場合は送信せずにProviderUnavailableErrorを送出する。
+    """
+    limiter = get_rate_limiter().for_model(model)
+    breaker = get_circuit_breakers().for_model(model)
+    estimated_tokens = _estimate_tokens(prompt)
+    max_retries = Config.LLM_RATE_LIMIT_MAX_RETRIES
+    with track_llm_call(model) as record:
+        for attempt in range(max_retries + 1):
+            breaker.before_call()
+            record.queue_seconds += limiter.acquire(estimated_tokens)
+            try:
+                result = call()
+            except Exception as e:
+                if breaker.record_failure(e):
+                    raise breaker.unavailable_error() from e
+                if not is_rate_limit_error(e) or attempt == max_retries:
+                    raise
+                delay = limiter.record_rate_limited(e)
+                record.retries += 1
+                logger.warning(f"[LLMClient] Rate limited on {model} (attempt {attempt + 1}/{max_retries + 1}), backing off {delay:.1f}s")
+                continue
+            breaker.record_success()
+            record.add_usage(result.get("raw") if isinstance(result, dict) else result)
+            limiter.record_success(estimated_tokens, record.input_tokens or None)
+            return result
+
+
+async def _acall_with_rate_limit(model: str, prompt: str, call: Callable[[], Awaitable]):
+    """_call_with_rate_limitのasyncio版"""
+    limiter = get_rate_limiter().for_model(model)
+    breaker = get_circuit_breakers().for_model(model)
+    estimated_tokens = _estimate_tokens(prompt)
+    max_retries = Config.LLM_RATE_LIMIT_MAX_RETRIES
+    with track_llm_call(model) as record:
+        for attempt in range(max_retries + 1):
+            breaker.before_call()
+            record.queue_seconds += await limiter.aacquire(estimated_tokens)
+            try:
+                result = await call()
+            except Exception as e:
+                if breaker.record_failure(e):
+                    raise breaker.unavailable_error() from e
+                if not is_rate_limit_error(e) or attempt == max_retries:
+                    raise
+                delay = limiter.record_rate_limited(e)
+                record.retries += 1
+                logger.warning(f"[LLMClient] Rate limited on {model} (attempt {attempt + 1}/{max_retries + 1}), backing off {delay:.1f}s")
+                continue
+            breaker.record_success()
+            record.add_usage(result.get("raw") if isinstance(result, dict) else result)
+            limiter.record_success(estimated_tokens, record.input_tokens or None)
+            return result
+
+
+def invoke_llm(prompt: str, model: str, temperature: float = 0.2, timeout: int = 180, use_cache: bool = False, prefix: str = "") -> LLMResponse:
+    """
+    共有クライアントでGeminiを呼び出す。
+    use_cache=Trueの場合はディスクキャッシュを参照し、ヒットすればAPIを呼ばずに返す。
+    prefix: 複数リクエストで共通のプロンプト先頭部分（prefix + promptが全文）。コンテキストキャッシュの対象になる。
+    API呼び出し前にモデル別のレートリミッターから送信枠を取得し、429の場合はリトライヒント
+    （なければ指数バックオフ）に従って待ってから最大LLM_RATE_LIMIT_MAX_RETRIES回リトライする。
+    ミス時の結果はここでは保存しない（呼び出し側がパース成功後にstore_response()で保存する）。
+    """
+    cache_key, cached = _lookup_cache(prefix + prompt, model, temperature, use_cache)
+    if cached is not None:
+        record_cache_hit(model)
+        return cached
+
+    request, cached_content = _split_prompt(model, prompt, prefix)
+    llm = get_llm(model, temperature=temperature, timeout=timeout, cached_content=cached_content)
+    response = _call_with_rate_limit(model, prefix + prompt, lambda: llm.invoke(request))
+    return LLMResponse(response.content, model, cache_key=cache_key, cached=False)
+
+
+async def ainvoke_llm(prompt: str, model: str, temperature: float = 0.2, timeout: int = 180, use_cache: bool = False, prefix: str = "") -> LLMResponse:
+    """
+    invoke_llmのasyncio版（llm.ainvokeを使い、待機中にスレッドを占有しない）。
+    LLM_HEDGE_ENABLEDの場合、直近のレイテンシのパーセンタイルを過ぎても応答がなければ複製リクエストを送り、先に返った方を使う。
+    """
+    cache_key, cached = _lookup_cache(prefix + prompt, model, temperature, use_cache)
+    if cached is not None:
+        record_cache_hit(model)
+        return cached
+
+    request, cached_content = await _asplit_prompt(model, prompt, prefix)
+    llm = LLMClientRegistry.get_async(model, temperature=temperature, timeout=timeout, cached_content=cached_content)
+    response = await arun_hedged(
+        model, hedge_delay(model),
+        lambda claim: _acall_with_rate_limit(model, prefix + prompt, lambda: llm.ainvoke(request))
+    )
+    return LLMResponse(response.content, model, cache_key=cache_key, cached=False)
+
+
+def _structured_cache_model(model: str, schema) -> str:
+    # 同じプロンプトでもスキーマが異なれば別エントリとする
+    return f"{model}#{schema.__name__}"
+
+
+def _validate_structured(schema, content: str):
+    try:
+        return schema(**json.loads(content))
+    except Exception:
+        return None
+
+
+def _structured_response(result: dict, model: str, schema, cache_key: Optional[str]) -> LLMResponse:
+    parsed = result.get("parsed")
+    if parsed is not None:
+        content = json.dumps(parsed.dict(), ensure_ascii=False)
+    else:
+        # スキーマ検証に失敗した場合は生テキストを返し、呼び出し側のフォールバックパースに任せる
+        logger.warning(f"[LLMClient] Structured output validation failed for {schema.__name__}: {result.get('parsing_error')}")
+        raw = result.get("raw")
+        content = _chunk_text(raw) if raw is not None else ""
+    return LLMResponse(content, model, cache_key=cache_key, cached=False, parsed=parsed)
+
+
+def _lookup_structured_cache(prompt: str, model: str, schema, temperature: float, use_cache: bool) -> Tuple[Optional[str], Optional[LLMResponse]]:
+    cache_key, cached = _lookup_cache(prompt, _structured_cache_model(model, schema), temperature, use_cache)
+    if cached is None:
+        return cache_key, None
+    parsed = _validate_structured(schema, cached.content)
+    if parsed is None:
+        # スキーマ変更などで検証できなくなったエントリは破棄して再生成する
+        invalidate_response(cache_key)
+        return cache_key, None
+    cached.parsed = parsed
+    return cache_key, cached
+
+
+def invoke_structured(prompt: str, model: str, schema, temperature: float = 0.2, timeout: int = 180, use_cache: bool = False, prefix: str = "") -> LLMResponse:
+    """
+    スキーマ制約付きでGeminiを呼び出す（with_structured_output）。
+    レスポンスはpydanticで直接検証し、LLMResponse.parsedに格納する（contentは検証済みJSON文字列）。
+    検証できなかった場合はparsed=Noneで生テキストを返す（正規表現パースはフォールバックとして呼び出し側で行う）。
+    """
+    cache_key, cached = _lookup_structured_cache(prefix + prompt, model, schema, temperature, use_cache)
+    if cached is not None:
+        record_cache_hit(model)
+        return cached
+
+    request, cached_content = _split_prompt(model, prompt, prefix)
+    runnable = get_llm(model, temperature=temperature, timeout=timeout, cached_content=cached_content).with_structured_output(schema, include_raw=True)
+    result = _call_with_rate_limit(model, prefix + prompt, lambda: runnable.invoke(request))
+    return _structured_response(result, model, schema, cache_key)
+
+
+async def ainvoke_structured(prompt: str, model: str, schema, temperature: float = 0.2, timeout: int = 180, use_cache: bool = False, prefix: str = "") -> LLMResponse:
+    """invoke_structuredのasyncio版（ainvoke_llmと同様に複製リクエストの対象）"""
+    cache_key, cached = _lookup_structured_cache(prefix + prompt, model, schema, temperature, use_cache)
+    if cached is not None:
+        record_cache_hit(model)
+        return cached
+
+    request, cached_content = await _asplit_prompt(model, prompt, prefix)
+    runnable = LLMClientRegistry.get_async(model, temperature=temperature, timeout=timeout, cached_content=cached_content).with_structured_output(schema, include_raw=True)
+    result = await arun_hedged(
+        model, hedge_delay(model),
+        lambda claim: _acall_with_rate_limit(model, prefix + prompt, lambda: runnable.ainvoke(request))
+    )
+    return _structured_response(result, model, schema, cache_key)
+
+
+def stream_llm(prompt: str, model: str, temperature: float = 0.2, timeout: int = 180, use_cache: bool = False,
+               on_chunk: Optional[Callable[[str], Optional[bool]]] = None, prefix: str = "") -> LLMResponse:
+    """
+    invoke_llmのストリーミング版。受信したテキストを逐次on_chunkに渡す。
+    - on_chunkがFalseを返した場合は必要な出力が揃ったとみなし、残りの生成を待たずに接続を閉じる
+    - on_chunkがStreamAbortedErrorを送出した場合は生成を打ち切り、そのまま送出する
+    - キャッシュヒット時はキャッシュ済みの本文全体を1チャンクとしてon_chunkに渡す
+    - 429のリトライは1文字も受信していない場合のみ行う
+    """
+    cache_key, cached = _lookup_cache(prefix + prompt, model, temperature, use_cache)
+    if cached is not None:
+        record_cache_hit(model)
+        if on_chunk is not None:
+            on_chunk(cached.content)
+        return cached
+
+    limiter = get_rate_limiter().for_model(model)
+    breaker = get_circuit_breakers().for_model(model)
+    estimated_tokens = _estimate_tokens(prefix + prompt)
+    max_retries = Config.LLM_RATE_LIMIT_MAX_RETRIES
+    request, cached_content = _split_prompt(model, prompt, prefix)
+    with track_llm_call(model) as record:
+        for attempt in range(max_retries + 1):
+            breaker.before_call()
+            record.queue_seconds += limiter.acquire(estimated_tokens)
+            parts = []
+            stream = get_llm(model, temperature=temperature, timeout=timeout, cached_content=cached_content).stream(request)
+            try:
+                for chunk in stream:
+                    # usage_metadataはチャンクごとの差分なので合計する
+                    record.add_usage(chunk)
+                    text = _chunk_text(chunk)
+                    if not text:
+                        continue
+                    record.first_chunk()
+                    parts.append(text)
+                    if on_chunk is not None and on_chunk(text) is False:
+                        logger.debug(f"[LLMClient] Stream stopped early: model={model}, chars={sum(len(p) for p in parts)}")
+                        break
+            except StreamAbortedError as e:
+                # 応答自体は受信できているため、プロバイダ障害としては数えない
+                breaker.record_success()
+                e.content = "".join(parts)
+                record.status = "aborted"
+                logger.warning(f"[LLMClient] Stream aborted: model={model}, chars={len(e.content)}: {e}")
+                raise
+            except Exception as e:
+                if breaker.record_failure(e):
+                    raise breaker.unavailable_error() from e
+                if parts or not is_rate_limit_error(e) or attempt == max_retries:
+                    raise
+                delay = limiter.record_rate_limited(e)
+                record.retries += 1
+                logger.warning(f"[LLMClient] Rate limited on {model} (attempt {attempt + 1}/{max_retries + 1}), backing off {delay:.1f}s")
+                continue
+            finally:
+                stream.close()
+            breaker.record_success()
+            limiter.record_success(estimated_tokens, record.input_tokens or None)
+            return LLMResponse("".join(parts), model, cache_key=cache_key, cached=False)
+
+
+async def astream_llm(prompt: str, model: str, temperature: float = 0.2, timeout: int = 180, use_cache: bool = False,
+                      on_chunk: Optional[Callable[[str], Optional[bool]]] = None, prefix: str = "") -> LLMResponse:
+    """
+    stream_llmのasyncio版（llm.astreamを使用）。
+    LLM_HEDGE_ENABLEDの場合、直近の最初のチャンクまでの時間のパーセンタイルを過ぎても受信がなければ複製リクエストを送る。
+    先に受信を始めた方だけがon_chunkに渡され、もう一方はその時点でキャンセルする。
+    """
+    cache_key, cached = _lookup_cache(prefix + prompt, model, temperature, use_cache)
+    if cached is not None:
+        record_cache_hit(model)
+        if on_chunk is not None:
+            on_chunk(cached.content)
+        return cached
+
+    limiter = get_rate_limiter().for_model(model)
+    breaker = get_circuit_breakers().for_model(model)
+    estimated_tokens = _estimate_tokens(prefix + prompt)
+    max_retries = Config.LLM_RATE_LIMIT_MAX_RETRIES
+    request, cached_content = await _asplit_prompt(model, prompt, prefix)
+
+    async def run(claim: Callable[[], bool]) -> str:
+        with track_llm_call(model) as record:
+            for attempt in range(max_retries + 1):
+                breaker.before_call()
+                record.queue_seconds += await limiter.aacquire(estimated_tokens)
+                parts = []
+                stream = LLMClientRegistry.get_async(model, temperature=temperature, timeout=timeout, cached_content=cached_content).astream(request)
+                try:
+                    async for chunk in stream:
+                        # usage_metadataはチャンクごとの差分なので合計する
+                        record.add_usage(chunk)
+                        text = _chunk_text(chunk)
+                        if not text:
+                            continue
+                        if not parts and not claim():
+                            # 複製リクエストの相手が先に受信を始めた
+                            raise asyncio.CancelledError()
+                        record.first_chunk()
+                        parts.append(text)
+                        if on_chunk is not None and on_chunk(text) is False:
+                            logger.debug(f"[LLMClient] Stream stopped early: model={model}, chars={sum(len(p) for p in parts)}")
+                            break
+                except StreamAbortedError as e:
+                    # 応答自体は受信できているため、プロバイダ障害としては数えない
+                    breaker.record_success()
+                    e.content = "".join(parts)
+                    record.status = "aborted"
+                    logger.warning(f"[LLMClient] Stream aborted: model={model}, chars={len(e.content)}: {e}")
+                    raise
+                except Exception as e:
+                    if breaker.record_failure(e):
+                        raise breaker.unavailable_error() from e
+                    if parts or not is_rate_limit_error(e) or attempt == max_retries:
+                        raise
+                    delay = limiter.record_rate_limited(e)
+                    record.retries += 1
+                    logger.warning(f"[LLMClient] Rate limited on {model} (attempt {attempt + 1}/{max_retries + 1}), backing off {delay:.1f}s")
+                    continue
+                finally:
+                    # 途中で抜けた場合も接続を確実に閉じる
+                    await stream.aclose()
+                breaker.record_success()
+                limiter.record_success(estimated_tokens, record.input_tokens or None)
+                return "".join(parts)
+
+    content = await arun_hedged(model, hedge_delay(model, first_chunk=True), run)
+    return LLMResponse(content, model, cache_key=cache_key, cached=False)
+
+
+def store_response(response: LLMResponse) -> None:
+    """パース・検証に成功したレスポンスをキャッシュに保存する"""
+    if response.cache_key and not response.cached:
+        get_response_cache().set(response.cache_key, response.model, response.content)
+
+
+def invalidate_response(cache_key: Optional[str]) -> None:
+    """レビュー不合格となった生成結果をキャッシュから取り除く"""
+    if cache_key:
+        get_response_cache().invalidate(cache_key)
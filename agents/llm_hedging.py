@@ -0,0 +1,106 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+from config import Config
+from logger import Logger
+from agents.llm_telemetry import llm_tags, get_llm_tags, recent_latency_percentile, record_hedge
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+
+def hedge_delay(model: str, first_chunk: bool = False) -> Optional[float]:
+    """
+    複製リクエストを送るまでの待ち時間（同じモデル・ステージの直近のレイテンシのLLM_HEDGE_PERCENTILEパーセンタイル）。
+    ヘッジが無効・対象外のステージ・サンプル不足の場合はNone。
+    first_chunk: ストリーミングの場合は最初のチャンクまでの時間で判定する
+    """
+    if not Config.LLM_HEDGE_ENABLED:
+        return None
+    tags = get_llm_tags()
+    stage = tags.get("stage", "unknown")
+    if tags.get("hedge") or stage not in _hedge_stages():
+        return None
+    delay = recent_latency_percentile(model, stage, Config.LLM_HEDGE_PERCENTILE, Config.LLM_HEDGE_MIN_SAMPLES, first_chunk)
+    if delay is None:
+        return None
+    return max(delay, Config.LLM_HEDGE_MIN_DELAY_SECONDS)
+
+
+def _hedge_stages():
+    return {stage.strip() for stage in Config.LLM_HEDGE_STAGES.split(",") if stage.strip()}
+
+
+class HedgeRace:
+    """
+    元のリクエストと複製リクエストのどちらを採用するかを決める。
+    最初にclaim()した側が勝ち、もう一方はその時点でキャンセルされる。
+    """
+
+    def __init__(self):
+        self.winner: Optional[int] = None
+        self.tasks: Dict[int, asyncio.Task] = {}
+
+    def claim(self, index: int) -> bool:
+        if self.winner is None:
+            self.winner = index
+            for other, task in self.tasks.items():
+                if other != index:
+                    task.cancel()
+        return self.winner == index
+
+
+async def arun_hedged(model: str, delay: Optional[float], run: Callable[[Callable[[], bool]], Awaitable]):
+    """
+    run(claim)を実行し、delay秒以内に結果（ストリーミングの場合は最初のチャンク）が返らなければ同じrunをもう1つ並列に送る。
+    先に完了した方（run内でclaim()した場合はその時点で先にclaimした方）の結果を返し、もう一方はキャンセルする。
+    複製リクエストもrun内でレートリミッターを通るため、クォータを共有する。
+    一方が失敗した場合はもう一方の完了を待ち、両方失敗した場合は元のリクエストの例外を送出する。
+    """
+    if delay is None:
+        return await run(lambda: True)
+
+    race = HedgeRace()
+    primary = asyncio.create_task(run(lambda: race.claim(0)))
+    race.tasks[0] = primary
+    try:
+        await asyncio.wait({primary}, timeout=delay)
+        if primary.done() or race.winner is not None:
+            # 期限内に完了した、またはストリーミングで最初のチャンクを受信済み
+            return await primary
+
+        stage = get_llm_tags().get("stage", "unknown")
+        logger.info(f"[LLMHedging] No response from {model} ({stage}) after {delay:.1f}s, sending hedged request")
+        # 複製側の呼び出しはテレメトリ上hedgeとして記録する（タスク作成時のコンテキストがコピーされる）
+        with llm_tags(hedge=True):
+            hedge = asyncio.create_task(run(lambda: race.claim(1)))
+        race.tasks[1] = hedge
+
+        pending = {primary, hedge}
+        errors: Dict[int, BaseException] = {}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = 0 if task is primary else 1
+                if task.cancelled():
+                    continue
+                if task.exception() is not None:
+                    errors[index] = task.exception()
+                    if race.winner == index:
+                        # ストリーミングで受信を始めた側が失敗した場合（もう一方はキャンセル済み）
+                        record_hedge(model, stage, delay, "failed")
+                        raise errors[index]
+                    continue
+                if race.winner is None or race.winner == index:
+                    race.claim(index)
+                    winner = "primary" if index == 0 else "hedge"
+                    record_hedge(model, stage, delay, winner)
+                    logger.info(f"[LLMHedging] {winner} request won for {model} ({stage})")
+                    return task.result()
+        record_hedge(model, stage, delay, "failed")
+        raise errors.get(0) or errors.get(1) or asyncio.CancelledError()
+    finally:
+        # 呼び出し元のキャンセル・例外時も含め、残ったリクエストを確実に止める
+        leftovers = [task for task in race.tasks.values() if not task.done()]
+        for task in leftovers:
+            task.cancel()
+        if leftovers:
+            await asyncio.gather(*leftovers, return_exceptions=True)
@@ -0,0 +1,462 @@
+import os
+import json
+import asyncio
+import math
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from logger import Logger
+from agents.circuit_breaker import ProviderUnavailableError
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+# 呼び出し元が設定するタグ（stage / page / attempt）。asyncioタスクごとにコピーされるため並列ページ間で混ざらない
+_tags: contextvars.ContextVar[Dict] = contextvars.ContextVar("llm_telemetry_tags", default={})
+# 実行中のワークフローの集計先（create_website 1回につき1つ）
+_current_run: contextvars.ContextVar[Optional["WorkflowTelemetry"]] = contextvars.ContextVar("llm_telemetry_run", default=None)
+
+
+@contextmanager
+def llm_tags(**tags):
+    """with内のLLM呼び出しにタグを付ける（既存のタグに上書きマージ）"""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def set_llm_tags(**tags) -> None:
+    """現在のコンテキスト（asyncioタスク）以降のLLM呼び出しにタグを付ける（リトライループの先頭など）"""
+    _tags.set({**_tags.get(), **tags})
+
+
+def get_llm_tags() -> Dict:
+    return dict(_tags.get())
+
+
+class LLMCallRecord:
+    """1回のLLM呼び出し（429リトライを含む）の計測値"""
+
+    def __init__(self, model: str, tags: Dict):
+        self.model = model
+        self.stage = tags.get("stage", "unknown")
+        self.page = tags.get("page")
+        self.attempt = tags.get("attempt")
+        # 並列に生成するページ候補の番号（候補が1つの場合はNone）
+        self.candidate = tags.get("candidate")
+        # layoutレビュー中に先行生成したページの呼び出しの場合、その元になったlayoutの試行番号
+        self.speculation = tags.get("speculation")
+        # layoutが不合格になり破棄された先行生成の呼び出し
+        self.wasted = False
+        # 応答が遅い呼び出しに対して追加で送った複製リクエスト
+        self.hedge = bool(tags.get("hedge"))
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.latency_seconds = 0.0
+        self.first_chunk_seconds = None
+        self.queue_seconds = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.retries = 0
+        self.response_cached = False
+        self.status = "ok"
+        self.error = None
+
+    def add_usage(self, message) -> None:
+        """AIMessage（ストリーミング時は各チャンクの差分）のusage_metadataを加算する"""
+        usage = getattr(message, "usage_metadata", None) or {}
+        self.input_tokens += usage.get("input_tokens") or 0
+        self.output_tokens += usage.get("output_tokens") or 0
+        self.cached_tokens += (usage.get("input_token_details") or {}).get("cache_read") or 0
+
+    def first_chunk(self) -> None:
+        if self.first_chunk_seconds is None:
+            self.first_chunk_seconds = time.perf_counter() - self._start
+
+    def finish(self) -> None:
+        self.latency_seconds = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict:
+        return {
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="milliseconds"),
+            "stage": self.stage,
+            "page": self.page,
+            "attempt": self.attempt,
+            "candidate": self.candidate,
+            "speculation": self.speculation,
+            "wasted": self.wasted,
+            "hedge": self.hedge,
+            "model": self.model,
+            "status": self.status,
+            "error": self.error,
+            "response_cached": self.response_cached,
+            "latency_seconds": round(self.latency_seconds, 3),
+            "first_chunk_seconds": None if self.first_chunk_seconds is None else round(self.first_chunk_seconds, 3),
+            "queue_seconds": round(self.queue_seconds, 3),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "retries": self.retries,
+        }
+
+
+def parse_pricing(value: str) -> Dict[str, Tuple[float, float]]:
+    """"model=入力USD:出力USD" 形式（100万トークンあたり）のモデル別単価をパースする"""
+    pricing = {}
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            model, spec = item.split("=", 1)
+            input_price, output_price = spec.split(":", 1)
+            pricing[model.strip()] = (float(input_price), float(output_price))
+        except ValueError:
+            logger.warning(f"[LLMTelemetry] Ignoring invalid LLM_PRICING entry: {item}")
+    return pricing
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100.0 * len(ordered)) - 1)
+    return round(ordered[index], 3)
+
+
+def _estimate_cost(records: List[LLMCallRecord], pricing: Dict[str, Tuple[float, float]]) -> float:
+    cost = 0.0
+    for record in records:
+        input_price, output_price = pricing.get(record.model, (0.0, 0.0))
+        cost += record.input_tokens * input_price / 1_000_000 + record.output_tokens * output_price / 1_000_000
+    return round(cost, 6)
+
+
+def _aggregate(records: List[LLMCallRecord], pricing: Dict[str, Tuple[float, float]]) -> Dict:
+    api_calls = [r for r in records if not r.response_cached]
+    latencies = [r.latency_seconds for r in api_calls if r.status == "ok"]
+    first_chunks = [r.first_chunk_seconds for r in api_calls if r.first_chunk_seconds is not None]
+    return {
+        "calls": len(api_calls),
+        "response_cache_hits": len(records) - len(api_calls),
+        "errors": sum(1 for r in api_calls if r.status not in ("ok", "cancelled", "rejected")),
+        # 合格候補が決まった時点でキャンセルされた呼び出し（途中までのトークンは消費済み）
+        "cancelled": sum(1 for r in api_calls if r.status == "cancelled"),
+        # サーキットブレーカーが開いていたため送信せずに拒否した呼び出し
+        "rejected": sum(1 for r in api_calls if r.status == "rejected"),
+        "retries": sum(r.retries for r in api_calls),
+        "latency_p50_seconds": _percentile(latencies, 50),
+        "latency_p95_seconds": _percentile(latencies, 95),
+        "latency_max_seconds": _percentile(latencies, 100),
+        "latency_total_seconds": round(sum(r.latency_seconds for r in api_calls), 3),
+        "first_chunk_p50_seconds": _percentile(first_chunks, 50),
+        "queue_total_seconds": round(sum(r.queue_seconds for r in api_calls), 3),
+        "input_tokens": sum(r.input_tokens for r in api_calls),
+        "output_tokens": sum(r.output_tokens for r in api_calls),
+        "cached_tokens": sum(r.cached_tokens for r in api_calls),
+        "estimated_cost_usd": _estimate_cost(api_calls, pricing),
+    }
+
+
+class WorkflowTelemetry:
+    """1回のワークフロー実行中のLLM呼び出し記録と、品質制御の試行結果を集める"""
+
+    def __init__(self, name: str):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.records: List[LLMCallRecord] = []
+        self.outcomes: List[Dict] = []
+        self.speculations: List[Dict] = []
+        self.hedges: List[Dict] = []
+        # ワークフローのステージ（analysis / setup / layout / pages / install / server_start / build / upload）の実行区間
+        self.stages: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: LLMCallRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def add_outcome(self, component: str, attempt: int, passed: bool, score: Optional[int] = None) -> None:
+        with self._lock:
+            self.outcomes.append({"component": component, "attempt": attempt, "passed": passed, "score": score})
+
+    def add_speculation(self, layout_attempt: int, approved: bool, seconds: float, pages_completed: int, pages_total: int) -> None:
+        """
+        layoutレビュー中のページ先行生成の結果を記録する。
+        不合格で破棄された場合は、その先行生成の呼び出しを無駄になった呼び出しとしてマークする。
+        """
+        with self._lock:
+            self.speculations.append({
+                "layout_attempt": layout_attempt,
+                "approved": approved,
+                "seconds": round(seconds, 3),
+                "pages_completed": pages_completed,
+                "pages_total": pages_total,
+            })
+            if not approved:
+                for record in self.records:
+                    if record.speculation == layout_attempt:
+                        record.wasted = True
+
+    def add_hedge(self, model: str, stage: str, delay: float, winner: str) -> None:
+        """複製リクエストを送った呼び出しの結果を記録する（winner: "primary" / "hedge" / "failed"）"""
+        with self._lock:
+            self.hedges.append({"model": model, "stage": stage, "delay_seconds": round(delay, 3), "winner": winner})
+
+    def add_stage(self, name: str, started: float, finished: float, status: str) -> None:
+        """ステージの実行区間を記録する（started / finished: time.perf_counter()の値）"""
+        with self._lock:
+            self.stages.append({
+                "stage": name,
+                "start_offset_seconds": round(started - self._start, 3),
+                "seconds": round(finished - started, 3),
+                "status": status,
+            })
+
+    def _hedge_summary(self, records: List[LLMCallRecord], pricing: Dict[str, Tuple[float, float]]) -> Dict:
+        """複製リクエストの送信回数・勝敗と、複製リクエスト自体の消費量"""
+        hedge_calls = [r for r in records if r.hedge and not r.response_cached]
+        by_stage = {}
+        for hedge in self.hedges:
+            entry = by_stage.setdefault(hedge["stage"], {"fired": 0, "hedge_wins": 0})
+            entry["fired"] += 1
+            entry["hedge_wins"] += 1 if hedge["winner"] == "hedge" else 0
+        return {
+            "fired": len(self.hedges),
+            "hedge_wins": sum(1 for h in self.hedges if h["winner"] == "hedge"),
+            "primary_wins": sum(1 for h in self.hedges if h["winner"] == "primary"),
+            "failed": sum(1 for h in self.hedges if h["winner"] == "failed"),
+            "by_stage": by_stage,
+            "hedge_input_tokens": sum(r.input_tokens for r in hedge_calls),
+            "hedge_output_tokens": sum(r.output_tokens for r in hedge_calls),
+            "hedge_cost_usd": _estimate_cost(hedge_calls, pricing),
+        }
+
+    def _speculation_summary(self, records: List[LLMCallRecord], pricing: Dict[str, Tuple[float, float]]) -> Dict:
+        """先行生成の回数と、破棄された分の呼び出し・トークン・時間"""
+        wasted = [r for r in records if r.wasted and not r.response_cached]
+        discarded = [s for s in self.speculations if not s["approved"]]
+        return {
+            "runs": len(self.speculations),
+            "discarded": len(discarded),
+            # 採用された先行生成がlayoutレビューと重なっていた時間（直列実行に比べて短縮できた時間の上限）
+            "overlap_seconds": round(sum(s["seconds"] for s in self.speculations if s["approved"]), 3),
+            "wasted_pages_completed": sum(s["pages_completed"] for s in discarded),
+            "wasted_calls": len(wasted),
+            "wasted_input_tokens": sum(r.input_tokens for r in wasted),
+            "wasted_output_tokens": sum(r.output_tokens for r in wasted),
+            "wasted_latency_seconds": round(sum(r.latency_seconds for r in wasted), 3),
+            "wasted_cost_usd": _estimate_cost(wasted, pricing),
+        }
+
+    def _attempts(self) -> Dict[str, Dict]:
+        """コンポーネント（layout / page_<name>）ごとの試行回数・合否・スコア推移"""
+        attempts = {}
+        for outcome in self.outcomes:
+            entry = attempts.setdefault(outcome["component"], {"attempts": 0, "passed": False, "scores": []})
+            entry["attempts"] = max(entry["attempts"], outcome["attempt"] or 0)
+            entry["passed"] = outcome["passed"]
+            entry["scores"].append(outcome["score"])
+        return attempts
+
+    def summary(self) -> Dict:
+        pricing = parse_pricing(Config.LLM_PRICING)
+        with self._lock:
+            records = list(self.records)
+            speculation = self._speculation_summary(records, pricing)
+            hedging = self._hedge_summary(records, pricing)
+            stages = sorted(self.stages, key=lambda stage: stage["start_offset_seconds"])
+        by_stage, by_model = {}, {}
+        for record in records:
+            by_stage.setdefault(record.stage, []).append(record)
+            by_model.setdefault(record.model, []).append(record)
+        return {
+            "run_id": self.run_id,
+            "wall_seconds": round(time.perf_counter() - self._start, 3),
+            **_aggregate(records, pricing),
+            "by_stage": {stage: _aggregate(items, pricing) for stage, items in by_stage.items()},
+            "by_model": {model: _aggregate(items, pricing) for model, items in by_model.items()},
+            "attempts": self._attempts(),
+            "speculation": speculation,
+            "hedging": hedging,
+            "stages": stages,
+        }
+
+    def write(self, path: Optional[str] = None) -> Optional[str]:
+        """集計と呼び出しごとの記録をJSON Linesファイルに1行で追記する。書き込んだパスを返す"""
+        path = path or metrics_file_path()
+        if not path:
+            return None
+        with self._lock:
+            calls = [record.to_dict() for record in self.records]
+        entry = {
+            "run_id": self.run_id,
+            "name": self.name,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+            "summary": self.summary(),
+            "calls": calls,
+        }
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.warning(f"[LLMTelemetry] Failed to write metrics file {path}: {e}")
+            return None
+        return path
+
+
+class LatencyWindow:
+    """
+    モデル・ステージごとの直近の呼び出しのレイテンシ（プロセス共通、ワークフローをまたいで保持する）。
+    複製リクエストを送るまでの待ち時間の算出に使う。
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._latencies: Dict[Tuple[str, str], deque] = {}
+        self._first_chunks: Dict[Tuple[str, str], deque] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, record: LLMCallRecord) -> None:
+        key = (record.model, record.stage)
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self.size)).append(record.latency_seconds)
+            if record.first_chunk_seconds is not None:
+                self._first_chunks.setdefault(key, deque(maxlen=self.size)).append(record.first_chunk_seconds)
+
+    def percentile(self, model: str, stage: str, percent: float, min_samples: int, first_chunk: bool = False) -> Optional[float]:
+        """直近のレイテンシ（first_chunk=Trueの場合は最初のチャンクまでの時間）のパーセンタイル。サンプル不足ならNone"""
+        samples = self._first_chunks if first_chunk else self._latencies
+        with self._lock:
+            values = list(samples.get((model, stage), ()))
+        if len(values) < max(1, min_samples):
+            return None
+        return _percentile(values, percent)
+
+
+_latency_window = LatencyWindow(Config.LLM_HEDGE_WINDOW)
+
+
+def recent_latency_percentile(model: str, stage: str, percent: float, min_samples: int, first_chunk: bool = False) -> Optional[float]:
+    return _latency_window.percentile(model, stage, percent, min_samples, first_chunk)
+
+
+def resolve_log_path(value: str) -> Optional[str]:
+    """ログ系ファイルのパス（相対パスはlogディレクトリ基準、空文字ならNone）"""
+    if not value:
+        return None
+    if os.path.isabs(value):
+        return value
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(project_root, "log", value)
+
+
+def metrics_file_path() -> Optional[str]:
+    """メトリクスファイルのパス（LLM_METRICS_FILEが空なら無効）"""
+    return resolve_log_path(Config.LLM_METRICS_FILE)
+
+
+@contextmanager
+def telemetry_run(name: str):
+    """with内（asyncioタスク・_run_syncのスレッドを含む）のLLM呼び出しを1つの実行として集計する"""
+    telemetry = WorkflowTelemetry(name)
+    token = _current_run.set(telemetry)
+    try:
+        yield telemetry
+    finally:
+        _current_run.reset(token)
+
+
+def current_run() -> Optional[WorkflowTelemetry]:
+    return _current_run.get()
+
+
+@contextmanager
+def track_llm_call(model: str):
+    """
+    1回のLLM呼び出しを計測する。例外時はstatus="error"（キャンセル時は"cancelled"、サーキットブレーカーによる拒否は"rejected"）として記録し、例外はそのまま送出する。
+    実行中のワークフローがない場合も記録オブジェクトは返す（集計されないだけ）。
+    """
+    record = LLMCallRecord(model, _tags.get())
+    try:
+        yield record
+    except BaseException as e:
+        if record.status == "ok":
+            if isinstance(e, asyncio.CancelledError):
+                record.status = "cancelled"
+            elif isinstance(e, ProviderUnavailableError) and e.__cause__ is None:
+                # 送信前に拒否した呼び出し（送信して失敗した結果サーキットが開いた呼び出しはerror）
+                record.status = "rejected"
+            else:
+                record.status = "error"
+        record.error = type(e).__name__
+        raise
+    finally:
+        record.finish()
+        if record.status == "ok":
+            _latency_window.observe(record)
+        telemetry = _current_run.get()
+        if telemetry is not None:
+            telemetry.add(record)
+
+
+def record_cache_hit(model: str) -> None:
+    """レスポンスキャッシュにヒットした呼び出しを記録する（APIは呼ばれていない）"""
+    telemetry = _current_run.get()
+    if telemetry is not None:
+        record = LLMCallRecord(model, _tags.get())
+        record.response_cached = True
+        telemetry.add(record)
+
+
+def record_speculation(layout_attempt: int, approved: bool, seconds: float, pages_completed: int, pages_total: int) -> None:
+    """ページ先行生成の採用・破棄を記録する"""
+    telemetry = _current_run.get()
+    if telemetry is not None:
+        telemetry.add_speculation(layout_attempt, approved, seconds, pages_completed, pages_total)
+
+
+def record_hedge(model: str, stage: str, delay: float, winner: str) -> None:
+    """複製リクエストの勝敗を記録する"""
+    telemetry = _current_run.get()
+    if telemetry is not None:
+        telemetry.add_hedge(model, stage, delay, winner)
+
+
+@contextmanager
+def workflow_stage(name: str, started: Optional[float] = None):
+    """
+    with内をワークフローのステージとして計測する（例外時はstatus="error"、キャンセル時は"cancelled"）。
+    エラーを戻り値で返す処理の場合は、yieldされたdictのstatusを"error"に書き換える。
+    started: 計測開始時刻（time.perf_counter()の値）。with以前に始まっていた処理（先行生成したページなど）を含める場合に指定する
+    """
+    started = time.perf_counter() if started is None else started
+    stage = {"status": "ok"}
+    try:
+        yield stage
+    except BaseException as e:
+        stage["status"] = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        raise
+    finally:
+        telemetry = _current_run.get()
+        if telemetry is not None:
+            telemetry.add_stage(name, started, time.perf_counter(), stage["status"])
+
+
+def record_attempt(component: str, attempt: int, passed: bool, score: Optional[int] = None) -> None:
+    """品質制御ループの試行結果を記録する（何回目の試行で合格したか）"""
+    telemetry = _current_run.get()
+    if telemetry is not None:
+        telemetry.add_outcome(component, attempt, passed, score)
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from logger import Logger
+from agents.llm_telemetry import resolve_log_path
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+PRO_MODEL = "gemini-2.5-pro"
+FLASH_MODEL = "gemini-2.5-flash"
+
+# 実装が重くなりやすいコンテンツ（フォーム・アニメーション・表など）のキーワード
+_HEAVY_KEYWORDS = (
+    "form", "animation", "animated", "carousel", "slider", "gallery", "table", "pricing", "timeline",
+    "map", "faq", "accordion", "chart", "testimonial", "filter", "フォーム", "アニメーション",
+    "スライダー", "ギャラリー", "料金", "地図", "タイムライン",
+)
+
+
+class RoutingDecision:
+    """1回のページ生成試行に対するモデル選択と、その結果（レビュースコア・所要時間）"""
+
+    def __init__(self, page: str, attempt: int, complexity: float, bucket: str, model: str, reason: str):
+        self.page = page
+        self.attempt = attempt
+        self.complexity = complexity
+        self.bucket = bucket
+        self.model = model
+        self.reason = reason
+        self._start = time.perf_counter()
+
+    def to_dict(self) -> Dict:
+        return {
+            "page": self.page,
+            "attempt": self.attempt,
+            "complexity": self.complexity,
+            "bucket": self.bucket,
+            "model": self.model,
+            "reason": self.reason,
+        }
+
+
+def page_complexity(page_spec: dict, sitemap: list) -> float:
+    """
+    ページ仕様の複雑さのスコア。
+    contentsの項目数 + 記述量（200文字ごとに1）+ 重いコンテンツのキーワード（1つにつき2）+ サイトマップのページ数 x 0.2
+    """
+    contents = [str(item) for item in page_spec.get("contents", []) or []]
+    text = " ".join(contents).lower()
+    keyword_hits = sum(1 for keyword in _HEAVY_KEYWORDS if keyword in text)
+    score = len(contents) + len(text) / 200 + keyword_hits * 2 + len(sitemap or []) * 0.2
+    return round(score, 2)
+
+
+def _bucket(complexity: float) -> str:
+    """過去の合格率を集計する複雑さの区分"""
+    if complexity < Config.MODEL_ROUTER_FLASH_MAX_COMPLEXITY / 2:
+        return "low"
+    if complexity <= Config.MODEL_ROUTER_FLASH_MAX_COMPLEXITY:
+        return "medium"
+    return "high"
+
+
+class ModelRouter:
+    """
+    ページ生成のモデル（gemini-2.5-flash / gemini-2.5-pro）を試行ごとに選ぶ。
+    - 複雑さのスコアが閾値以下のページはflashで生成する
+    - 同じ複雑さの区分でflashの過去の合格率が閾値を下回っている場合はproを使う
+    - レビュー不合格後のリトライはproにエスカレーションする
+    判断と結果（スコア・所要時間）はJSON Linesファイルに記録し、次回以降の合格率の集計に使う。
+    """
+
+    def __init__(self, log_path: Optional[str]):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        # (model, bucket) -> [合格数, 試行数]
+        self._stats: Dict[Tuple[str, str], List[int]] = {}
+        self._load_history()
+
+    def _load_history(self) -> None:
+        if not self.log_path or not os.path.exists(self.log_path):
+            return
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._count(entry.get("model"), entry.get("bucket"), entry.get("passed"))
+        except OSError as e:
+            logger.warning(f"[ModelRouter] Failed to read routing history {self.log_path}: {e}")
+
+    def _count(self, model: Optional[str], bucket: Optional[str], passed: Optional[bool]) -> None:
+        if not model or not bucket or passed is None:
+            return
+        stats = self._stats.setdefault((model, bucket), [0, 0])
+        stats[0] += 1 if passed else 0
+        stats[1] += 1
+
+    def pass_rate(self, model: str, bucket: str) -> Optional[float]:
+        """過去の合格率（試行数がMODEL_ROUTER_MIN_SAMPLES未満の場合はNone）"""
+        with self._lock:
+            passed, total = self._stats.get((model, bucket), [0, 0])
+        if total < Config.MODEL_ROUTER_MIN_SAMPLES:
+            return None
+        return passed / total
+
+    def route_page(self, page_spec: dict, sitemap: list, attempt: int, previous: Optional[RoutingDecision] = None) -> RoutingDecision:
+        """
+        ページ生成の試行に使うモデルを選ぶ。
+        previous: 同じページの直前の試行の判断（不合格だった場合に渡す）
+        """
+        page = page_spec.get("slug") or page_spec.get("name", "")
+        complexity = page_complexity(page_spec, sitemap)
+        bucket = _bucket(complexity)
+        if Config.MODEL_ROUTING != "adaptive":
+            return RoutingDecision(page, attempt, complexity, bucket, PRO_MODEL, "routing_disabled")
+        if previous is not None:
+            reason = "escalated_after_failure" if previous.model != PRO_MODEL else "retry"
+            return RoutingDecision(page, attempt, complexity, bucket, PRO_MODEL, reason)
+        if complexity > Config.MODEL_ROUTER_FLASH_MAX_COMPLEXITY:
+            return RoutingDecision(page, attempt, complexity, bucket, PRO_MODEL, "complex_page")
+        rate = self.pass_rate(FLASH_MODEL, bucket)
+        if rate is not None and rate < Config.MODEL_ROUTER_MIN_PASS_RATE:
+            return RoutingDecision(page, attempt, complexity, bucket, PRO_MODEL, f"low_flash_pass_rate({rate:.2f})")
+        return RoutingDecision(page, attempt, complexity, bucket, FLASH_MODEL, "simple_page")
+
+    def record_outcome(self, decision: RoutingDecision, passed: bool, score: Optional[int] = None) -> None:
+        """判断の結果を記録する（合格率の集計に反映し、ログファイルに1行追記する）"""
+        latency = time.perf_counter() - decision._start
+        entry = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            **decision.to_dict(),
+            "passed": passed,
+            "score": score,
+            "latency_seconds": round(latency, 3),
+        }
+        logger.info(f"[ModelRouter] page={decision.page} attempt={decision.attempt} model={decision.model} ({decision.reason}, complexity={decision.complexity}) -> passed={passed}, score={score}, {latency:.1f}s")
+        with self._lock:
+            self._count(decision.model, decision.bucket, passed)
+            if not self.log_path:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.warning(f"[ModelRouter] Failed to write routing log {self.log_path}: {e}")
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """プロセス共通のルーターを取得する（初回に過去のルーティングログを読み込む）"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter(resolve_log_path(Config.MODEL_ROUTER_LOG_FILE))
+    return _router
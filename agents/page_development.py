@@ -1,12 +1,17 @@
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
 from config import Config
 from logger import Logger
 from pydantic import BaseModel
-from langchain_google_genai import ChatGoogleGenerativeAI
 import os
-import re, json
-from agents.review_page import review_layout_files, review_develop_page
-from agents.prompts import LAYOUT_PROMPT, DEVELOP_PAGE_PROMPT, DEVELOP_PAGE_REVISION_PROMPT, LAYOUT_REVISION_PROMPT
+from agents.review_page import areview_develop_page
+from agents.llm_client import ainvoke_llm, astream_llm, ainvoke_structured, store_response, StreamAbortedError
+from agents.json_extraction import IncrementalJSONExtractor, robust_json_parser, iter_json_objects
+from agents.static_review import check_layout_files, check_page_files
+from agents.code_patch import parse_patch, apply_patch, PatchApplyError
+from agents.llm_telemetry import llm_tags
+from agents.circuit_breaker import ProviderUnavailableError
+from agents.prompts import (LAYOUT_PROMPT, DEVELOP_PAGE_CONTEXT_PROMPT, DEVELOP_PAGE_PROMPT, DEVELOP_PAGE_REVISION_CONTEXT_PROMPT,
+                            DEVELOP_PAGE_REVISION_PROMPT, DEVELOP_PAGE_PATCH_PROMPT, LAYOUT_REVISION_PROMPT, STRUCTURED_FILES_PROMPT)
 import time
 import random
 from google.api_core.exceptions import ResourceExhausted, TooManyRequests
@@ -26,122 +31,24 @@ class ReviewResult(BaseModel):
     feedback: str
     passed: bool
 
-# 共通JSONパースユーティリティ
-def robust_json_parser(content: str, required_fields: list = None, specific_patterns: list = None, extract_multiple: bool = False):
-    """
-    堅牢なJSONパース共通関数
-    
-    Args:
-        content: パースするテキストコンテンツ
-        required_fields: 必須フィールドリスト（例: ['score', 'feedback', 'passed']）
-        specific_patterns: 特化パターンリスト
-        extract_multiple: 複数のJSONオブジェクト抽出フラグ
-        
-    Returns:
-        dict or list: パースされたJSONオブジェクト（extract_multiple=Trueの場合はリスト）
-    """
-    json_candidates = []
-    
-    # 戦略1: コードブロック内のJSONを抽出（```json または ``` のパターン）
-    code_blocks = re.findall(r"```(?:json)?\s*([\s\S]*?)```", content)
-    for block in code_blocks:
-        block = block.strip()
-        if block.startswith('{') and block.endswith('}'):
-            json_candidates.append(block)
-        else:
-            # コードブロック内で{}パターンを探す
-            json_matches = re.findall(r'\{[\s\S]*?\}', block)
-            json_candidates.extend(json_matches)
-    
-    # 戦略2: 生のレスポンステキストから{}パターンを抽出
-    raw_matches = re.findall(r'\{[\s\S]*?\}', content)
-    json_candidates.extend(raw_matches)
-    
-    # 戦略3: より厳密な複雑JSONパターンマッチング（長いfeedbackフィールド対応）
-    # マルチラインのfeedbackを含むJSONを正確に抽出
-    complex_json_pattern = r'\{\s*"score"\s*:\s*\d+\s*,\s*"feedback"\s*:\s*".*?"\s*,\s*"passed"\s*:\s*(?:true|false)\s*\}'
-    complex_matches = re.findall(complex_json_pattern, content, re.DOTALL)
-    json_candidates.extend(complex_matches)
-    
-    # 戦略4: より柔軟なバランス括弧マッチング（ネストした構造に対応）
-    def extract_balanced_json(text, start_pos=0):
-        """括弧バランスを考慮した正確なJSON抽出"""
-        candidates = []
-        i = start_pos
-        while i < len(text):
-            if text[i] == '{':
-                bracket_count = 1
-                start = i
-                i += 1
-                in_string = False
-                escape_next = False
-                
-                while i < len(text) and bracket_count > 0:
-                    char = text[i]
-                    
-                    if escape_next:
-                        escape_next = False
-                    elif char == '\\':
-                        escape_next = True
-                    elif char == '"' and not escape_next:
-                        in_string = not in_string
-                    elif not in_string:
-                        if char == '{':
-                            bracket_count += 1
-                        elif char == '}':
-                            bracket_count -= 1
-                    
-                    i += 1
-                
-                if bracket_count == 0:
-                    candidates.append(text[start:i])
-            else:
-                i += 1
-        return candidates
-    
-    balanced_candidates = extract_balanced_json(content)
-    json_candidates.extend(balanced_candidates)
-    
-    # 戦略5: 特化パターンマッチング
-    if specific_patterns:
-        for pattern in specific_patterns:
-            pattern_matches = re.findall(pattern, content, re.DOTALL)
-            json_candidates.extend(pattern_matches)
-    
-    # パース結果格納
-    parsed_objects = []
-    
-    # 各候補を試してパース
-    for candidate in json_candidates:
-        candidate = candidate.strip()
-        if not candidate:
-            continue
-        try:
-            parsed = json.loads(candidate)
-            if isinstance(parsed, dict):
-                # 必須フィールドチェック
-                if required_fields:
-                    if all(field in parsed for field in required_fields):
-                        if extract_multiple:
-                            parsed_objects.append(parsed)
-                        else:
-                            return parsed
-                else:
-                    if extract_multiple:
-                        parsed_objects.append(parsed)
-                    else:
-                        return parsed
-        except (json.JSONDecodeError, ValueError) as e:
-            continue
-    
-    # 結果を返す
-    if extract_multiple:
-        return parsed_objects
-    elif parsed_objects:
-        return parsed_objects[0]
-    else:
-        return None
+# 構造化出力用のスキーマ（metaは自由形式のためスキーマから外し、受信後に空dictで補完する）
+class GeneratedFile(BaseModel):
+    name: str
+    dir: str
+    file_type: str
+    code: str
+    required_libs: List[str] = []
+
+    def to_file_content(self) -> Dict:
+        return FileContent(meta={}, **self.dict()).dict()
 
+class LayoutFiles(BaseModel):
+    layout: GeneratedFile
+    globals_css: GeneratedFile
+
+class PageFiles(BaseModel):
+    page: GeneratedFile
+    module_css: GeneratedFile
 
 # layout.tsxの内容をキャッシュするクラス
 class LayoutCache:
@@ -154,68 +61,154 @@ class LayoutCache:
         return cls._layout_code
 
 
-def generate_layout(overall_design: str, sitemap: list = None, project_name: str = "nextjs_site") -> Dict:
+class _ArtifactCollector:
     """
-    サイト全体のデザイン方針とサイトマップを受けて、app/layout.tsxとapp/globals.cssを同時生成し、キャッシュ＆物理ファイル作成。
-    Returns: dict (layout, globals_css, review)
+    ストリーミング中のテキストからファイルのJSONオブジェクトを逐次取り出す（astream_llmのon_chunk）
+    - 期待するファイルのオブジェクトが閉じた時点でon_artifact(key, obj)を呼ぶ（レスポンス全体を待たずに書き込める）
+    - 期待するファイルが揃ったらFalseを返し、残りの生成（説明文など）を待たずに打ち切る
+    - オブジェクト外のテキストがLLM_STREAM_ABORT_CHARS文字を超えたら（JSONが始まらない等）StreamAbortedError
     """
-    if sitemap is None:
-        sitemap = []
-    review_feedback = ""
-    # 1回だけ生成
+
+    def __init__(self, label: str, matchers: Dict[str, Callable[[dict], bool]], on_artifact: Optional[Callable[[str, dict], None]] = None):
+        self.label = label
+        self.matchers = matchers
+        self.on_artifact = on_artifact
+        self.extractor = IncrementalJSONExtractor()
+        self.found = {}
+        self.started_at = time.monotonic()
+
+    def __call__(self, text: str) -> bool:
+        for obj in self.extractor.feed(text):
+            for key, matcher in self.matchers.items():
+                if key in self.found or not matcher(obj):
+                    continue
+                self.found[key] = obj
+                logger.info(f"[{self.label}] Streamed {obj.get('name')} after {time.monotonic() - self.started_at:.2f}s")
+                if self.on_artifact is not None:
+                    try:
+                        self.on_artifact(key, obj)
+                    except Exception as e:
+                        logger.error(f"[{self.label}] Artifact callback failed for {obj.get('name')}: {e}")
+                break
+        if len(self.found) == len(self.matchers):
+            return False
+        if self.extractor.chars_since_object > Config.LLM_STREAM_ABORT_CHARS:
+            raise StreamAbortedError(
+                f"{self.label}: no expected JSON object within {Config.LLM_STREAM_ABORT_CHARS} characters "
+                f"(received {[obj.get('name') for obj in self.found.values()]})"
+            )
+        return True
+
+
+def _is_layout_obj(obj: dict) -> bool:
+    return obj.get('file_type') == 'layout' and obj.get('name') == 'layout.tsx'
+
+
+def _is_globals_css_obj(obj: dict) -> bool:
+    return obj.get('file_type') == 'css' and obj.get('name') == 'globals.css'
+
+
+def _page_matchers(is_home_page: bool, slug: str) -> Dict[str, Callable[[dict], bool]]:
+    """page.tsxとmodule.cssの判定（_parse_page_responseと同じ条件）"""
+    expected_css_name = "home.module.css" if is_home_page else f'{slug}.module.css'
+    return {
+        "page": lambda obj: obj.get('file_type') == 'page',
+        "module_css": lambda obj: obj.get('file_type') == 'css' and obj.get('name') == expected_css_name,
+    }
+
+
+def _build_layout_prompt(overall_design: str, sitemap: list, review_feedback: str = "") -> str:
+    """layout.tsx + globals.css生成用プロンプトを組み立てる（review_feedbackがあれば修正用プロンプト）"""
     if not review_feedback:
-        prompt = LAYOUT_PROMPT.format(
+        return LAYOUT_PROMPT.format(
             overall_design=overall_design,
             sitemap=sitemap
         )
-    else:
-        prompt = LAYOUT_REVISION_PROMPT.format(
-            review_feedback=review_feedback,
-            overall_design=overall_design,
-            sitemap=sitemap
-        )
-    logger.info(f"[PageDev] Generating layout")
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro", 
-        temperature=0.2, 
-        google_api_key=Config.GOOGLE_API_KEY,
-        timeout=180  # 3分タイムアウト
+    return LAYOUT_REVISION_PROMPT.format(
+        review_feedback=review_feedback,
+        overall_design=overall_design,
+        sitemap=sitemap
     )
-    response = llm.invoke(prompt)
-    
-    # JSON抽出の改善
-    patterns = [
-        r'\{\s*"name"\s*:\s*"layout\\.tsx"[\s\S]*?"file_type"\s*:\s*"layout"[\s\S]*?\}',
-        r'\{\s*"name"\s*:\s*"globals\\.css"[\s\S]*?"file_type"\s*:\s*"css"[\s\S]*?\}'
-    ]
-    parsed_objects = robust_json_parser(response.content, required_fields=['name', 'file_type', 'code'], specific_patterns=patterns, extract_multiple=True)
-    layout_obj, css_obj = None, None
-    for obj in parsed_objects:
-        if obj.get('file_type') == 'layout' and obj.get('name') == 'layout.tsx':
-            layout_obj = obj
-        elif obj.get('file_type') == 'css' and obj.get('name') == 'globals.css':
-            css_obj = obj
-    # フォールバック: レガシー方式（共通化関数でカバーできない場合）
+
+
+def _structured_files(response, keys: List[str]) -> Optional[Dict[str, Dict]]:
+    """構造化出力で検証済みのファイルをFileContent形式のdictで返す（検証できなかった場合はNone）"""
+    if response.parsed is None:
+        return None
+    return {key: getattr(response.parsed, key).to_file_content() for key in keys}
+
+
+def _parse_layout_response(response, files: Optional[Dict[str, Dict]] = None, sitemap: list = None) -> Dict:
+    """
+    layout生成レスポンスからlayout.tsxとglobals.cssのオブジェクトを取り出す。
+    files: ストリーミングの逐次抽出や構造化出力で取り出し済みのファイル。揃っていない場合のみ正規表現でパースする
+    取り出したコードは静的チェックで自動修正し、修正できない問題があればLLMレビュー不要の不合格結果をreviewに入れる
+    """
+    files = files or {}
+    layout_obj, css_obj = files.get("layout"), files.get("globals_css")
     if not layout_obj or not css_obj:
-        logger.debug(f"[generate_layout] Primary parsing failed, trying fallback")
-        matches = re.findall(r'\{.*?\}(?=\s*\{|$)', response.content, re.DOTALL)
-        for i, match in enumerate(matches):
-            try:
-                obj = json.loads(match)
-                if obj.get('file_type') == 'layout' and layout_obj is None:
-                    layout_obj = obj
-                elif obj.get('file_type') == 'css' and obj.get('name') == 'globals.css' and css_obj is None:
-                    css_obj = obj
-            except Exception as e:
-                logger.debug(f"[generate_layout] JSON parse failed: {e}")
+        # JSON抽出の改善
+        patterns = [
+            r'\{\s*"name"\s*:\s*"layout\\.tsx"[\s\S]*?"file_type"\s*:\s*"layout"[\s\S]*?\}',
+            r'\{\s*"name"\s*:\s*"globals\\.css"[\s\S]*?"file_type"\s*:\s*"css"[\s\S]*?\}'
+        ]
+        parsed_objects = robust_json_parser(response.content, required_fields=['name', 'file_type', 'code'], specific_patterns=patterns, extract_multiple=True, label="generate_layout")
+        for obj in parsed_objects:
+            if _is_layout_obj(obj) and layout_obj is None:
+                layout_obj = obj
+            elif _is_globals_css_obj(obj) and css_obj is None:
+                css_obj = obj
+        # ファイル名が異なってもfile_typeがlayoutであれば採用する
+        if layout_obj is None:
+            layout_obj = next((obj for obj in parsed_objects if obj.get('file_type') == 'layout'), None)
     if layout_obj and css_obj:
         logger.info("[generate_layout] Layout generation completed")
-        return {"layout": layout_obj, "globals_css": css_obj}
+        store_response(response)
+        result = {"layout": layout_obj, "globals_css": css_obj, "cache_key": response.cache_key}
+        if Config.STATIC_REVIEW_ENABLED:
+            static = check_layout_files(layout_obj.get("code", ""), css_obj.get("code", ""), sitemap)
+            static.log()
+            layout_obj["code"], css_obj["code"] = static.files["layout"], static.files["globals_css"]
+            if not static.passed:
+                result["review"] = static.to_review_result()
+        return result
     else:
         logger.error(f"[generate_layout] Failed to extract layout objects")
         return {"layout": layout_obj, "globals_css": css_obj, "error": "layout or css generation failed"}
 
 
+def generate_layout(overall_design: str, sitemap: list = None, project_name: str = "nextjs_site", on_artifact: Callable[[str, dict], None] = None,
+                    review_feedback: str = "") -> Dict:
+    """agenerate_layoutの同期版"""
+    from agents.step_generation import _run_sync
+    return _run_sync(agenerate_layout(overall_design, sitemap, project_name, on_artifact, review_feedback))
+
+
+async def agenerate_layout(overall_design: str, sitemap: list = None, project_name: str = "nextjs_site", on_artifact: Callable[[str, dict], None] = None,
+                           review_feedback: str = "") -> Dict:
+    """
+    サイト全体のデザイン方針とサイトマップを受けて、app/layout.tsxとapp/globals.cssを同時生成し、キャッシュ＆物理ファイル作成。
+    on_artifact: ストリーミング時、各ファイルのJSONオブジェクトが閉じた時点で呼ばれるコールバック
+    review_feedback: 前回の生成結果に対する静的チェックの指摘（ある場合は修正用プロンプトで再生成する）
+    Returns: dict (layout, globals_css, review)
+    """
+    if sitemap is None:
+        sitemap = []
+    prompt = _build_layout_prompt(overall_design, sitemap, review_feedback)
+    logger.info(f"[PageDev] Generating layout")
+    # 同一プロンプトの再実行時はディスクキャッシュから返す
+    if Config.LLM_STREAMING:
+        collector = _ArtifactCollector("generate_layout", {"layout": _is_layout_obj, "globals_css": _is_globals_css_obj}, on_artifact)
+        response = await astream_llm(prompt, "gemini-2.5-pro", temperature=0.2, timeout=180, use_cache=True, on_chunk=collector)  # 3分タイムアウト
+        return _parse_layout_response(response, collector.found, sitemap)
+    if Config.LLM_STRUCTURED_OUTPUT:
+        prompt += STRUCTURED_FILES_PROMPT.format(keys='"layout" and "globals_css"')
+        response = await ainvoke_structured(prompt, "gemini-2.5-pro", LayoutFiles, temperature=0.2, timeout=180, use_cache=True)  # 3分タイムアウト
+        return _parse_layout_response(response, _structured_files(response, ["layout", "globals_css"]), sitemap)
+    response = await ainvoke_llm(prompt, "gemini-2.5-pro", temperature=0.2, timeout=180, use_cache=True)  # 3分タイムアウト
+    return _parse_layout_response(response, sitemap=sitemap)
+
+
 def extract_json_objects(text):
     """JSONを様々なパターンから抽出する堅牢な関数（develop_page用）"""
     patterns = [
@@ -224,27 +217,30 @@ def extract_json_objects(text):
     ]
     
     # 共通パーサーを使用
-    json_objs = robust_json_parser(text, required_fields=['name', 'file_type'], specific_patterns=patterns, extract_multiple=True)
+    json_objs = robust_json_parser(text, required_fields=['name', 'file_type'], specific_patterns=patterns, extract_multiple=True, label="develop_page")
     
-    # フォールバック: レガシー方式（raw_decode）
+    # フォールバック: 必須フィールドを問わず全オブジェクトを返す
     if not json_objs:
-        idx = 0
-        while idx < len(text):
-            try:
-                obj, end = json.JSONDecoder().raw_decode(text[idx:])
-                if isinstance(obj, dict):
-                    json_objs.append(obj)
-                idx += end
-            except Exception:
-                idx += 1
+        json_objs = list(iter_json_objects(text))
     
     return json_objs
 
-def develop_page(overall_design: str, page_spec: dict, sitemap: list, globals_css: str = "", project_name: str = "nextjs_site") -> Dict:
+def _is_home_page(page_spec: dict) -> bool:
+    """homeページ判定ロジック"""
+    page_name = page_spec.get("name", "")
+    slug = page_spec.get("slug", "")
+    path = page_spec.get("path", "")
+    return (page_name.lower() in ['home', 'index', 'top'] or 
+            slug.lower() in ['', 'home', 'index'] or 
+            path == '/')
+
+
+def _build_page_prompt(overall_design: str, page_spec: dict, sitemap: list, globals_css: str, is_home_page: bool,
+                       layout_code: Optional[str] = None) -> Tuple[str, str]:
     """
-    サイト全体デザイン・ページ仕様・サイトマップ・グローバルCSSを受けて、page.tsxとmodule.cssを生成する。
-    homeページの場合はルートディレクトリ（app/page.tsx）に配置し、他のページは app/[slug]/page.tsx に配置する。
-    Returns: dict (page, module_css, review, is_home_page)
+    page.tsx + module.css生成用プロンプトを組み立てる（review_feedbackがあれば修正用プロンプト）
+    layout_code: 参照するlayout.tsx（Noneの場合は承認済みのLayoutCache）
+    Returns: (全ページ共通のプレフィックス, ページ固有のプロンプト)
     """
     page_name = page_spec.get("name", "")
     slug = page_spec.get("slug", "")
@@ -252,92 +248,90 @@ def develop_page(overall_design: str, page_spec: dict, sitemap: list, globals_cs
     nav = page_spec.get("nav", [])
     contents = page_spec.get("contents", [])
     review_feedback = page_spec.get("review_feedback", "")
+    if layout_code is None:
+        layout_code = LayoutCache.get() or ""
 
-    # homeページ判定ロジック
-    is_home_page = (page_name.lower() in ['home', 'index', 'top'] or 
-                   slug.lower() in ['', 'home', 'index'] or 
-                   path == '/')
-
-    logger.info(f"[develop_page] Generating page '{page_name}'")
-    layout_code = LayoutCache.get() or ""
-
+    # プレフィックスにはページごとに変わる値を入れない（同じサイトの全ページで同一にする）
+    site_context = dict(overall_design=overall_design, layout_code=layout_code, globals_css=globals_css, sitemap=sitemap)
     if not review_feedback:
-        prompt = DEVELOP_PAGE_PROMPT.format(
-            overall_design=overall_design,
-            layout_code=layout_code,
-            globals_css=globals_css,
+        return DEVELOP_PAGE_CONTEXT_PROMPT.format(**site_context), DEVELOP_PAGE_PROMPT.format(
             page_name=page_name,
             slug=slug,
             path=path,
             nav=nav,
             contents=contents,
-            sitemap=sitemap,
-            is_home_page=is_home_page
-        )
-    else:
-        prompt = DEVELOP_PAGE_REVISION_PROMPT.format(
-            review_feedback=review_feedback,
-            overall_design=overall_design,
-            layout_code=layout_code,
-            globals_css=globals_css,
-            page_spec=page_spec,
-            slug=slug,
-            sitemap=sitemap,
             is_home_page=is_home_page
         )
+    return DEVELOP_PAGE_REVISION_CONTEXT_PROMPT.format(**site_context), DEVELOP_PAGE_REVISION_PROMPT.format(
+        review_feedback=review_feedback,
+        page_spec=page_spec,
+        slug=slug,
+        is_home_page=is_home_page
+    )
 
-    # 1回だけAPIコール
-    try:
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-pro", 
-            temperature=0.2, 
-            google_api_key=Config.GOOGLE_API_KEY,
-            timeout=180  # 3分タイムアウト
-        )
-        response = llm.invoke(prompt)
-    except (ResourceExhausted, TooManyRequests) as e:
-        logger.warning(f"[develop_page] Rate limit hit for {page_name}: {e}")
-        return {"error": f"Gemini API rate limit exceeded: {str(e)}", "page": None, "module_css": None, "is_home_page": is_home_page}
-    except Exception as e:
-        logger.warning(f"[develop_page] API call failed for {page_name}: {e}")
-        return {"error": f"Gemini API call failed: {str(e)}", "page": None, "module_css": None, "is_home_page": is_home_page}
-    
+
+def _build_page_result(page_obj: dict, css_obj: dict, cache_key: Optional[str], overall_design: str, page_spec: dict, sitemap: list,
+                       globals_css: str, is_home_page: bool) -> Dict:
+    """
+    取り出したpage.tsx / module.cssを静的チェック（自動修正）し、レビューコンテキストと合わせた生成結果を返す。
+    修正できない問題があればLLMレビュー不要の不合格結果をreviewに入れる
+    """
+    # レビューコンテキスト（globals.cssを含む）はどちらのステージがレビューしても共通
+    review_context = {
+        'overall_design': overall_design,
+        'page_spec': page_spec,
+        'sitemap': sitemap,
+        'globals_css': globals_css,
+        'is_home_page': is_home_page
+    }
+    review = None
+    if Config.STATIC_REVIEW_ENABLED:
+        static = check_page_files(page_obj.get("code", ""), css_obj.get("code", ""), page_spec.get("slug", ""), is_home_page, sitemap)
+        static.log()
+        page_obj["code"], css_obj["code"] = static.files["page"], static.files["module_css"]
+        if not static.passed:
+            review = static.to_review_result()
+    return {
+        "page": page_obj, 
+        "module_css": css_obj, 
+        "review": review,
+        "review_context": review_context,
+        "is_home_page": is_home_page,
+        "cache_key": cache_key
+    }
+
+
+def _parse_page_response(response, overall_design: str, page_spec: dict, sitemap: list, globals_css: str, is_home_page: bool,
+                         files: Optional[Dict[str, Dict]] = None) -> Dict:
+    """
+    ページ生成レスポンスからpage.tsxとmodule.cssを取り出し、レビューコンテキストと合わせて返す。
+    レビューは呼び出し側（同期/非同期）で実行する。
+    files: ストリーミングの逐次抽出や構造化出力で取り出し済みのファイル。揃っていない場合のみ正規表現でパースする
+    """
+    page_name = page_spec.get("name", "")
+    slug = page_spec.get("slug", "")
     try:
-        # JSON抽出・パース
-        json_objs = extract_json_objects(response.content)
-        page_obj, css_obj = None, None
+        files = files or {}
+        page_obj, css_obj = files.get("page"), files.get("module_css")
         
-        # homeページの場合とそれ以外でCSSファイル名を調整
-        expected_css_name = "home.module.css" if is_home_page else f'{slug}.module.css'
-        
-        for obj in json_objs:
-            if isinstance(obj, dict) and obj.get('file_type') == 'page' and page_obj is None:
-                page_obj = obj
-            elif isinstance(obj, dict) and obj.get('file_type') == 'css' and obj.get('name') == expected_css_name and css_obj is None:
-                css_obj = obj
-            if page_obj and css_obj:
-                break
+        if not page_obj or not css_obj:
+            # JSON抽出・パース
+            json_objs = extract_json_objects(response.content)
+            
+            # homeページの場合とそれ以外でCSSファイル名を調整
+            matchers = _page_matchers(is_home_page, slug)
+            
+            for obj in json_objs:
+                if isinstance(obj, dict) and matchers["page"](obj) and page_obj is None:
+                    page_obj = obj
+                elif isinstance(obj, dict) and matchers["module_css"](obj) and css_obj is None:
+                    css_obj = obj
+                if page_obj and css_obj:
+                    break
                 
         if page_obj and css_obj:
-            # レビュー実行
-            review_result = review_develop_page(
-                page_obj['code'], 
-                css_obj['code'], 
-                {
-                    'overall_design': overall_design,
-                    'page_spec': page_spec,
-                    'sitemap': sitemap,
-                    'is_home_page': is_home_page
-                }
-            )
-            logger.info(f"[develop_page] Page '{page_name}' completed (score: {review_result.get('score', 0)})")
-            
-            return {
-                "page": page_obj, 
-                "module_css": css_obj, 
-                "review": review_result,
-                "is_home_page": is_home_page
-            }
+            store_response(response)
+            return _build_page_result(page_obj, css_obj, response.cache_key, overall_design, page_spec, sitemap, globals_css, is_home_page)
             
         logger.error(f"[develop_page] JSON parsing failed for {page_name}")
         return {
@@ -357,6 +351,145 @@ def develop_page(overall_design: str, page_spec: dict, sitemap: list, globals_cs
             "is_home_page": is_home_page
         }
 
+
+def develop_page(overall_design: str, page_spec: dict, sitemap: list, globals_css: str = "", project_name: str = "nextjs_site", run_review: bool = None,
+                 on_artifact: Callable[[str, dict], None] = None, temperature: float = 0.2, layout_code: Optional[str] = None,
+                 model: str = "gemini-2.5-pro") -> Dict:
+    """adevelop_pageの同期版"""
+    from agents.step_generation import _run_sync
+    return _run_sync(adevelop_page(overall_design, page_spec, sitemap, globals_css, project_name, run_review, on_artifact, temperature, layout_code, model))
+
+
+async def adevelop_page(overall_design: str, page_spec: dict, sitemap: list, globals_css: str = "", project_name: str = "nextjs_site", run_review: bool = None,
+                        on_artifact: Callable[[str, dict], None] = None, temperature: float = 0.2, layout_code: Optional[str] = None,
+                        model: str = "gemini-2.5-pro") -> Dict:
+    """
+    サイト全体デザイン・ページ仕様・サイトマップ・グローバルCSSを受けて、page.tsxとmodule.cssを生成する。
+    homeページの場合はルートディレクトリ（app/page.tsx）に配置し、他のページは app/[slug]/page.tsx に配置する。
+    run_review: Trueの場合はここでレビューまで実行する。Noneの場合はConfig.PAGE_REVIEW_OWNERに従う。
+        レビューしない場合もreview_contextを返すので、呼び出し側が同じコンテキストで1回だけレビューできる。
+    on_artifact: ストリーミング時、page.tsx / module.cssのJSONオブジェクトが閉じた時点で呼ばれるコールバック
+    temperature: 生成時のtemperature（ページ候補を複数生成する場合は候補ごとに変える）
+    layout_code: 参照するlayout.tsx。Noneの場合は承認済みのLayoutCacheを使う（layoutレビュー中に先行生成する場合は候補のコードを渡す）
+    model: 生成に使うモデル（step_generationではModelRouterがページの複雑さに応じて選ぶ）
+    Returns: dict (page, module_css, review, review_context, is_home_page)
+    """
+    if run_review is None:
+        run_review = Config.PAGE_REVIEW_OWNER == "develop_page"
+
+    page_name = page_spec.get("name", "")
+    is_home_page = _is_home_page(page_spec)
+    logger.info(f"[develop_page] Generating page '{page_name}'")
+    prefix, prompt = _build_page_prompt(overall_design, page_spec, sitemap, globals_css, is_home_page, layout_code)
+
+    # 1回だけAPIコール
+    try:
+        files = None
+        if Config.LLM_STREAMING:
+            collector = _ArtifactCollector("develop_page", _page_matchers(is_home_page, page_spec.get("slug", "")), on_artifact)
+            response = await astream_llm(prompt, model, temperature=temperature, timeout=180, use_cache=True, on_chunk=collector, prefix=prefix)  # 3分タイムアウト
+            files = collector.found
+        elif Config.LLM_STRUCTURED_OUTPUT:
+            prompt += STRUCTURED_FILES_PROMPT.format(keys='"page" and "module_css"')
+            response = await ainvoke_structured(prompt, model, PageFiles, temperature=temperature, timeout=180, use_cache=True, prefix=prefix)  # 3分タイムアウト
+            files = _structured_files(response, ["page", "module_css"])
+        else:
+            response = await ainvoke_llm(prompt, model, temperature=temperature, timeout=180, use_cache=True, prefix=prefix)  # 3分タイムアウト
+    except StreamAbortedError as e:
+        logger.warning(f"[develop_page] Generation aborted for {page_name}: {e}")
+        return {"error": f"Generation aborted: {str(e)}", "page": None, "module_css": None, "raw_response": e.content, "is_home_page": is_home_page}
+    except (ResourceExhausted, TooManyRequests) as e:
+        logger.warning(f"[develop_page] Rate limit hit for {page_name}: {e}")
+        return {"error": f"Gemini API rate limit exceeded: {str(e)}", "page": None, "module_css": None, "is_home_page": is_home_page}
+    except ProviderUnavailableError:
+        raise
+    except Exception as e:
+        logger.warning(f"[develop_page] API call failed for {page_name}: {e}")
+        return {"error": f"Gemini API call failed: {str(e)}", "page": None, "module_css": None, "is_home_page": is_home_page}
+
+    result = _parse_page_response(response, overall_design, page_spec, sitemap, globals_css, is_home_page, files)
+    if result.get("review_context") is None:
+        return result
+    if result.get("review") is not None:
+        logger.info(f"[develop_page] Page '{page_name}' rejected by static pre-review")
+    elif run_review:
+        result["review"] = await areview_develop_page(result["page"]["code"], result["module_css"]["code"], result["review_context"])
+        logger.info(f"[develop_page] Page '{page_name}' completed (score: {result['review'].get('score', 0)})")
+    else:
+        logger.info(f"[develop_page] Page '{page_name}' generated (review deferred to caller)")
+    return result
+
+def _module_css_name(page_spec: dict, is_home_page: bool) -> str:
+    return "home.module.css" if is_home_page else f"{page_spec.get('slug', '')}.module.css"
+
+
+def _build_page_patch_prompt(overall_design: str, page_spec: dict, sitemap: list, globals_css: str, is_home_page: bool,
+                             previous: Dict, layout_code: Optional[str] = None) -> Tuple[str, str]:
+    """
+    差分修正用プロンプトを組み立てる（前回のコード + review_feedback -> search/replaceブロック）
+    プレフィックスは全文再生成の修正用プロンプトと共通（同じコンテキストキャッシュを使う）
+    Returns: (全ページ共通のプレフィックス, ページ固有のプロンプト)
+    """
+    if layout_code is None:
+        layout_code = LayoutCache.get() or ""
+    site_context = dict(overall_design=overall_design, layout_code=layout_code, globals_css=globals_css, sitemap=sitemap)
+    return DEVELOP_PAGE_REVISION_CONTEXT_PROMPT.format(**site_context), DEVELOP_PAGE_PATCH_PROMPT.format(
+        review_feedback=page_spec.get("review_feedback", ""),
+        page_spec=page_spec,
+        is_home_page=is_home_page,
+        page_code=previous["page"]["code"],
+        css_name=_module_css_name(page_spec, is_home_page),
+        module_css_code=previous["module_css"]["code"]
+    )
+
+
+def _apply_page_patch(response, previous: Dict, overall_design: str, page_spec: dict, sitemap: list, globals_css: str, is_home_page: bool) -> Optional[Dict]:
+    """
+    パッチを前回のコードに適用し、develop_pageと同じ形式の生成結果を返す。
+    適用できない・適用結果が壊れている場合はNone（全文再生成にフォールバックする）
+    """
+    page_name = page_spec.get("name", "")
+    css_name = _module_css_name(page_spec, is_home_page)
+    try:
+        patched = apply_patch(
+            {"page.tsx": previous["page"]["code"], css_name: previous["module_css"]["code"]},
+            parse_patch(response.content)
+        )
+    except PatchApplyError as e:
+        logger.warning(f"[develop_page] Patch for '{page_name}' could not be applied, falling back to full regeneration: {e}")
+        return None
+    if "export default" not in patched["page.tsx"]:
+        logger.warning(f"[develop_page] Patched page.tsx for '{page_name}' has no default export, falling back to full regeneration")
+        return None
+    logger.info(f"[develop_page] Patch applied for '{page_name}' ({len(response.content)} chars instead of full regeneration)")
+    store_response(response)
+    page_obj = {**previous["page"], "code": patched["page.tsx"]}
+    css_obj = {**previous["module_css"], "code": patched[css_name]}
+    return _build_page_result(page_obj, css_obj, response.cache_key, overall_design, page_spec, sitemap, globals_css, is_home_page)
+
+
+async def apatch_page(overall_design: str, page_spec: dict, sitemap: list, globals_css: str, previous: Dict, layout_code: Optional[str] = None,
+                      model: str = "gemini-2.5-pro") -> Optional[Dict]:
+    """
+    レビュー不合格のページを、前回のコードとpage_spec["review_feedback"]からsearch/replaceブロックで差分修正する。
+    出力トークンが全文再生成より大幅に少なく、小さな修正ほど速い。レビューは呼び出し側で行う。
+    previous: 前回の生成結果（page / module_css）
+    model: 修正に使うモデル
+    Returns: develop_pageと同じ形式のdict。パッチを適用できなかった場合はNone（呼び出し側で全文再生成する）
+    """
+    is_home_page = _is_home_page(page_spec)
+    prefix, prompt = _build_page_patch_prompt(overall_design, page_spec, sitemap, globals_css, is_home_page, previous, layout_code)
+    logger.info(f"[develop_page] Patching page '{page_spec.get('name', '')}'")
+    try:
+        with llm_tags(stage="page_patch"):
+            response = await ainvoke_llm(prompt, model, temperature=0.2, timeout=180, use_cache=True, prefix=prefix)  # 3分タイムアウト
+    except ProviderUnavailableError:
+        raise
+    except Exception as e:
+        logger.warning(f"[develop_page] Patch request failed for {page_spec.get('name', '')}, falling back to full regeneration: {e}")
+        return None
+    return _apply_page_patch(response, previous, overall_design, page_spec, sitemap, globals_css, is_home_page)
+
 # 複数ページをまとめて生成する関数
 def generate_pages(pages: List[Dict], overall_design: str) -> List[Dict]:
     """
@@ -365,7 +498,7 @@ def generate_pages(pages: List[Dict], overall_design: str) -> List[Dict]:
     """
     results = []
     for page in pages:
-        result = develop_page(overall_design, page, [], "")
+        result = develop_page(overall_design, page, [], "", run_review=True)
         results.append(result)
     return results
 
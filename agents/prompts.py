@@ -357,15 +357,10 @@ You MUST verify that EVERY issue mentioned in the review feedback is addressed:
 """ 
 
 # Individual Page (app/[slug]/page.tsx + module.css) 生成用プロンプト
-DEVELOP_PAGE_PROMPT = """
-You are an expert Next.js 13+ developer specializing in React Server Components. Generate production-ready page.tsx and module.css files for {slug} page.
-
-**Context:**
-- Design: {overall_design}
-- Layout: {layout_code}
-- CSS: {globals_css}
-- Page: name={page_name}, slug={slug}, path={path}, is_home_page={is_home_page}
-- SiteMap: {sitemap}
+# 全ページで共通のプレフィックス（ルール + サイト共通コンテキスト）と、ページ固有のサフィックスに分割している。
+# プレフィックスは同一サイト内でバイト単位で同一になるため、コンテキストキャッシュで1回だけ送信できる。
+DEVELOP_PAGE_CONTEXT_PROMPT = """
+You are an expert Next.js 13+ developer specializing in React Server Components. Generate production-ready page.tsx and module.css files for the page specified in the PAGE TO GENERATE section at the end of this prompt.
 
 **CRITICAL REQUIREMENTS:**
 
@@ -392,7 +387,7 @@ You are an expert Next.js 13+ developer specializing in React Server Components.
 
 3. **IMPORT PATHS (BUILD-BREAKING IF WRONG)**
    - HOME PAGE (is_home_page=True): import './globals.css', dir: ""
-   - NON-HOME PAGE (is_home_page=False): import '../globals.css', dir: '{slug}'
+   - NON-HOME PAGE (is_home_page=False): import '../globals.css', dir: slug of the page
 
 4. **CSS CLASSES**
    - Standard TailwindCSS: text-gray-900, bg-white, flex, p-4, etc.
@@ -421,20 +416,9 @@ You are an expert Next.js 13+ developer specializing in React Server Components.
   - `&lt;` or `&#60;` for less than (<)
   - `&gt;` or `&#62;` for greater than (>)
 
-**OUTPUT FORMAT:**
-Output EXACTLY TWO JSON objects in separate ```json code blocks:
-
-```json
-{{"name": "page.tsx", "dir": "{slug}", "file_type": "page", "code": "...", "meta": {{}}, "required_libs": []}}
-```
-
-```json
-{{"name": "{slug}.module.css", "dir": "{slug}", "file_type": "css", "code": "...", "meta": {{}}, "required_libs": []}}
-```
-
 **FORMATTING RULES:**
 - For home page: dir="", filename="home.module.css"
-- For non-home pages: dir="{slug}", filename="{slug}.module.css"
+- For non-home pages: dir=slug, filename="<slug>.module.css"
 - Each JSON object in separate code blocks
 - No additional text between code blocks
 
@@ -465,10 +449,32 @@ NON-HOME PAGE:
   padding: 2rem
 }}
 ```
+
+**SITE CONTEXT (shared by all pages):**
+- Design: {overall_design}
+- Layout: {layout_code}
+- CSS: {globals_css}
+- SiteMap: {sitemap}
+"""
+
+DEVELOP_PAGE_PROMPT = """
+**PAGE TO GENERATE:**
+- Page: name={page_name}, slug={slug}, path={path}, is_home_page={is_home_page}
+
+**OUTPUT FORMAT:**
+Output EXACTLY TWO JSON objects in separate ```json code blocks:
+
+```json
+{{"name": "page.tsx", "dir": "{slug}", "file_type": "page", "code": "...", "meta": {{}}, "required_libs": []}}
+```
+
+```json
+{{"name": "{slug}.module.css", "dir": "{slug}", "file_type": "css", "code": "...", "meta": {{}}, "required_libs": []}}
+```
 """
 
-# Individual Page Revision (review feedback修正用) プロンプト
-DEVELOP_PAGE_REVISION_PROMPT = """
+# Individual Page Revision (review feedback修正用) プロンプト（共通プレフィックス + ページ固有サフィックス）
+DEVELOP_PAGE_REVISION_CONTEXT_PROMPT = """
 You are an expert Next.js developer and senior code reviewer specializing in Next.js 13+ Server Components. Your task is to fix ALL issues identified in review feedback to generate production-ready code.
 
 ## CRITICAL REQUIREMENTS
@@ -491,12 +497,12 @@ You are an expert Next.js developer and senior code reviewer specializing in Nex
 - **Alternative**: Use descriptive variable names instead of comments when possible
 
 ### 2. Import Paths
-- **HOME PAGE** (is_home_page: {is_home_page}):
+- **HOME PAGE** (is_home_page: True):
   - Import: `import './globals.css'`
   - Directory: `""`
 - **NON-HOME PAGE**:
   - Import: `import '../globals.css'`
-  - Directory: `'{slug}'`
+  - Directory: slug of the page
 
 ### 3. Component Structure
 - **PROHIBITED**: No `<header>`, `<nav>`, or navigation elements (inherited from layout.tsx)
@@ -526,13 +532,18 @@ You are an expert Next.js developer and senior code reviewer specializing in Nex
 - Japanese content preferred
 - h1 elements must be within content sections, not isolated
 
-## INPUT CONTEXT
-- **Review Feedback**: {review_feedback}
+## INPUT CONTEXT (shared by all pages)
 - **Design**: {overall_design}
 - **Layout**: {layout_code}
 - **CSS**: {globals_css}
-- **Page Spec**: {page_spec}
 - **SiteMap**: {sitemap}
+"""
+
+DEVELOP_PAGE_REVISION_PROMPT = """
+## PAGE TO REVISE
+- **Review Feedback**: {review_feedback}
+- **Page Spec**: {page_spec}
+- **is_home_page**: {is_home_page}
 
 ## OUTPUT FORMAT
 Generate two separate JSON objects in ```json code blocks:
@@ -546,6 +557,43 @@ Generate two separate JSON objects in ```json code blocks:
 ```
 """
 
+# 差分修正用サフィックス（プレフィックスはDEVELOP_PAGE_REVISION_CONTEXT_PROMPTを共用）
+# 前回のコードとレビューフィードバックを渡し、全文ではなくsearch/replaceブロックだけを出力させる
+DEVELOP_PAGE_PATCH_PROMPT = """
+## PAGE TO REVISE (PATCH MODE)
+- **Review Feedback**: {review_feedback}
+- **Page Spec**: {page_spec}
+- **is_home_page**: {is_home_page}
+
+## CURRENT CODE
+FILE: page.tsx
+```tsx
+{page_code}
+```
+
+FILE: {css_name}
+```css
+{module_css_code}
+```
+
+## OUTPUT FORMAT (PATCH ONLY)
+Do NOT output the full files. Output ONLY search/replace blocks that fix every issue in the review feedback:
+
+FILE: page.tsx
+<<<<<<< SEARCH
+exact lines copied from the current code (same indentation)
+=======
+replacement lines
+>>>>>>> REPLACE
+
+Rules:
+- Put a FILE line (page.tsx or {css_name}) before the blocks for that file
+- SEARCH must match the current code exactly and must appear only once in that file
+- Keep each SEARCH as short as possible while staying unique; prefer several small blocks over one large block
+- To add new CSS rules, SEARCH for the last rule of {css_name} and REPLACE it with that rule followed by the new rules
+- Output nothing except FILE lines and search/replace blocks
+"""
+
 # Layout Files (layout.tsx + globals.css) 専用レビュープロンプト
 LAYOUT_REVIEW_PROMPT = """
 You are a world-class Next.js reviewer specializing in layout files (layout.tsx + globals.css). Review both files with focus on layout-specific requirements:
@@ -629,8 +677,8 @@ You are a world-class Next.js reviewer specializing in layout files (layout.tsx
 - Feedback must specifically mention CSS @apply errors and undefined custom classes
 """
 
-# Individual Pageレビュープロンプト
-DEVELOP_PAGE_REVIEW_PROMPT = """
+# Individual Pageレビュープロンプト（共通プレフィックス + ページ固有サフィックス）
+DEVELOP_PAGE_REVIEW_CONTEXT_PROMPT = """
 You are a Next.js expert reviewing page.tsx and module.css files for Next.js 13+ Server Components. Score below 80 for any critical failure.
 
 **CRITICAL FAILURES (SCORE < 80):**
@@ -662,11 +710,15 @@ You are a Next.js expert reviewing page.tsx and module.css files for Next.js 13+
 7. **SERVER COMPONENT VIOLATIONS**: 'use client', event handlers, external packages
 8. **EXTERNAL RESOURCES**: External URLs instead of local images
 
-**VALIDATION CONTEXT:**
+**VALIDATION CONTEXT (shared by all pages):**
 - overall_design: {overall_design}
-- page_spec: {page_spec}
 - sitemap: {sitemap}
 - globals.css: {globals_css}
+"""
+
+DEVELOP_PAGE_REVIEW_PROMPT = """
+**PAGE UNDER REVIEW:**
+- page_spec: {page_spec}
 - slug: {slug}
 - is_home_page: {is_home_page}
 
@@ -682,3 +734,35 @@ module.css:
 - Score < 80: passed = false
 - Feedback must specify exact issues found
 """ 
+
+DEVELOP_PAGE_BATCH_REVIEW_ITEM_PROMPT = """
+=== PAGE {index}: {slug} ===
+- page_spec: {page_spec}
+- slug: {slug}
+- is_home_page: {is_home_page}
+
+page.tsx:
+{page_code}
+
+module.css:
+{module_css_code}
+"""
+
+DEVELOP_PAGE_BATCH_REVIEW_PROMPT = """
+**PAGES UNDER REVIEW ({count} pages):**
+Review EACH page independently against the criteria above. Issues in one page must not affect the score of another page.
+{pages}
+**OUTPUT:** {{"reviews": [{{"index": int, "slug": str, "score": int, "feedback": str, "passed": bool}}, ...]}}
+- Exactly one review per page, in the same order as above, with the page's number (PAGE <index>) and slug
+- Several pages may share the same slug (alternative candidates of one page); review each of them separately by index
+- Score ≥ 80: passed = true
+- Score < 80: passed = false
+- Feedback must specify exact issues found in that page
+"""
+
+STRUCTURED_FILES_PROMPT = """
+
+**STRUCTURED OUTPUT MODE:**
+Ignore the code-block output format above. Return exactly ONE JSON object with the keys {keys}.
+Each value is a file object with name, dir, file_type, code and required_libs, following the same rules as above.
+"""
@@ -0,0 +1,274 @@
+import re
+import time
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple
+from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+from config import Config
+from logger import Logger
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+# 429レスポンスに含まれるリトライ待ち時間のヒント（精度の高いものから順に評価）
+# 例: "Please retry in 17.5s." / 'retryDelay': '17s' / retry_delay { seconds: 17 } / Retry-After: 17
+_RETRY_HINT_PATTERNS = [
+    re.compile(r"retry in (\d+(?:\.\d+)?)\s*(ms|s)\b", re.IGNORECASE),
+    re.compile(r"retry[_ ]?delay['\"]?\s*[:{]\s*['\"]?(?:seconds:\s*)?(\d+(?:\.\d+)?)", re.IGNORECASE),
+    re.compile(r"retry-after['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)", re.IGNORECASE),
+]
+
+
+def _exception_chain(error: BaseException):
+    """例外とその原因（__cause__ / __context__）を順に返す（ラップされた429を見逃さないため）"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Gemini APIのレート制限（429 / RESOURCE_EXHAUSTED）かどうかを判定する"""
+    for exc in _exception_chain(error):
+        if isinstance(exc, (ResourceExhausted, TooManyRequests)):
+            return True
+        if getattr(exc, "code", None) == 429 or "RateLimit" in type(exc).__name__:
+            return True
+        if "RESOURCE_EXHAUSTED" in str(exc):
+            return True
+    return False
+
+
+def parse_retry_delay(error: BaseException) -> Optional[float]:
+    """429エラーからサーバー指定の待ち時間（秒）を取り出す。見つからなければNone"""
+    for exc in _exception_chain(error):
+        message = str(exc)
+        for pattern in _RETRY_HINT_PATTERNS:
+            match = pattern.search(message)
+            if match:
+                seconds = float(match.group(1))
+                if len(match.groups()) > 1 and match.group(2) == "ms":
+                    seconds /= 1000.0
+                return seconds
+    return None
+
+
+class TokenBucket:
+    """
+    一定レートで補充されるトークンバケット（予約方式）
+    - reserve()は先にトークンを差し引き、不足分が補充されるまでの待ち時間を返す
+      （同時に来たリクエストは予約順に等間隔で送出される）
+    - rate_per_minute=0の場合は無制限
+    - pause_until()で指定時刻まで補充を止める（429のクールダウン用）
+    """
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float):
+        self.rate = rate_per_minute / 60.0
+        # バースト上限：burst_seconds分のクォータまで（1分ぶんを一気に使い切らない）
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def _wait_for(self, tokens: float, now: float) -> float:
+        paused = max(0.0, self.updated_at - now)
+        deficit = max(0.0, -tokens) / self.rate
+        return paused + deficit
+
+    def reserve(self, amount: float, now: float) -> float:
+        if self.rate <= 0:
+            return max(0.0, self.updated_at - now)
+        self._refill(now)
+        # 1リクエストがバースト上限を超える場合でも永久に待たないよう上限で切る
+        self.tokens -= min(amount, self.capacity)
+        return self._wait_for(self.tokens, now)
+
+    def refund(self, amount: float, now: float) -> None:
+        if self.rate <= 0:
+            return
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """予約せずに、今amountを要求した場合の待ち時間を返す"""
+        if self.rate <= 0:
+            return max(0.0, self.updated_at - now)
+        tokens = self.tokens
+        if now > self.updated_at:
+            tokens = min(self.capacity, tokens + (now - self.updated_at) * self.rate)
+        return self._wait_for(tokens - min(amount, self.capacity), now)
+
+    def pause_until(self, until: float) -> None:
+        if until > self.updated_at:
+            self._refill(min(until, time.monotonic()))
+            self.tokens = min(self.tokens, 0.0)
+            self.updated_at = until
+
+
+class ModelRateLimiter:
+    """1モデル分のリクエスト数/分（RPM）とトークン数/分（TPM）のバケット"""
+
+    def __init__(self, model: str, rpm: float, tpm: float, burst_seconds: float):
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = TokenBucket(rpm, burst_seconds)
+        self._tokens = TokenBucket(tpm, burst_seconds)
+        self._consecutive_limits = 0
+        self._lock = threading.Lock()
+        # 統計（get_rate_limiter().snapshot()で参照）
+        self.total_requests = 0
+        self.total_wait_seconds = 0.0
+        self.rate_limited = 0
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            delay = max(self._requests.reserve(1, now), self._tokens.reserve(estimated_tokens, now))
+            self.total_requests += 1
+            self.total_wait_seconds += delay
+            return delay
+
+    def _refund(self, estimated_tokens: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._requests.refund(1, now)
+            self._tokens.refund(estimated_tokens, now)
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """送信枠を予約し、必要なら枠が空くまでスレッドを待機させる。待った秒数を返す"""
+        delay = self._reserve(estimated_tokens)
+        if delay > 0:
+            logger.debug(f"[RateLimiter] Waiting {delay:.2f}s for {self.model} quota")
+            time.sleep(delay)
+        return delay
+
+    async def aacquire(self, estimated_tokens: int) -> float:
+        """acquireのasyncio版（待機中にイベントループをブロックしない）"""
+        delay = self._reserve(estimated_tokens)
+        if delay > 0:
+            logger.debug(f"[RateLimiter] Waiting {delay:.2f}s for {self.model} quota")
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # 送信しなかった枠は返却する
+                self._refund(estimated_tokens)
+                raise
+        return delay
+
+    def record_success(self, estimated_tokens: int, actual_tokens: Optional[int] = None) -> None:
+        """成功時に呼ぶ。実トークン数が分かれば見積もりとの差分をTPMバケットで精算する"""
+        with self._lock:
+            self._consecutive_limits = 0
+            if actual_tokens and self._tokens.rate > 0:
+                self._tokens.tokens -= actual_tokens - estimated_tokens
+
+    def record_rate_limited(self, error: BaseException) -> float:
+        """
+        429受信時に呼ぶ。サーバーのリトライヒントがあればそれに従い、なければ指数バックオフ。
+        待ち時間の間はこのモデルの全リクエストを止め、再開後も1件ずつ送出させる。
+        Returns: クールダウン秒数
+        """
+        hint = parse_retry_delay(error)
+        with self._lock:
+            self._consecutive_limits += 1
+            self.rate_limited += 1
+            if hint is not None:
+                delay = hint
+            else:
+                delay = min(
+                    Config.LLM_RATE_LIMIT_BACKOFF_MAX,
+                    Config.LLM_RATE_LIMIT_BACKOFF_BASE * (2 ** (self._consecutive_limits - 1))
+                )
+            until = time.monotonic() + delay
+            self._requests.pause_until(until)
+            self._tokens.pause_until(until)
+        return delay
+
+    def wait_time(self, estimated_tokens: int = 0) -> float:
+        """今リクエストした場合に送出まで待つ秒数"""
+        with self._lock:
+            now = time.monotonic()
+            return max(self._requests.wait_time(1, now), self._tokens.wait_time(estimated_tokens, now))
+
+
+class RateLimiter:
+    """モデルごとのModelRateLimiterを保持する（全エージェントで共有）"""
+
+    def __init__(self, default_rpm: float, default_tpm: float, overrides: Dict[str, Tuple[float, float]], burst_seconds: float):
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.overrides = overrides
+        self.burst_seconds = burst_seconds
+        self._limiters: Dict[str, ModelRateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model: str) -> ModelRateLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is not None:
+            return limiter
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                rpm, tpm = self.overrides.get(model, (self.default_rpm, self.default_tpm))
+                logger.debug(f"[RateLimiter] Creating limiter: model={model}, rpm={rpm}, tpm={tpm}")
+                limiter = ModelRateLimiter(model, rpm, tpm, self.burst_seconds)
+                self._limiters[model] = limiter
+            return limiter
+
+    def wait_times(self) -> Dict[str, float]:
+        """モデルごとの現在の待ち時間（秒）"""
+        return {model: limiter.wait_time() for model, limiter in list(self._limiters.items())}
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """モデルごとの設定値・統計・現在の待ち時間"""
+        return {
+            model: {
+                "rpm": limiter.rpm,
+                "tpm": limiter.tpm,
+                "requests": limiter.total_requests,
+                "rate_limited": limiter.rate_limited,
+                "total_wait_seconds": round(limiter.total_wait_seconds, 3),
+                "current_wait_seconds": round(limiter.wait_time(), 3),
+            }
+            for model, limiter in list(self._limiters.items())
+        }
+
+
+def parse_rate_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    """"model=rpm:tpm,model=rpm:tpm" 形式のモデル別上限をパースする"""
+    limits = {}
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            model, spec = item.split("=", 1)
+            rpm, tpm = spec.split(":", 1)
+            limits[model.strip()] = (float(rpm), float(tpm))
+        except ValueError:
+            logger.warning(f"[RateLimiter] Ignoring invalid LLM_RATE_LIMITS entry: {item}")
+    return limits
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Configに基づくプロセス共通のレートリミッターを取得する"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter(
+                    default_rpm=Config.LLM_DEFAULT_RPM,
+                    default_tpm=Config.LLM_DEFAULT_TPM,
+                    overrides=parse_rate_limits(Config.LLM_RATE_LIMITS),
+                    burst_seconds=Config.LLM_RATE_LIMIT_BURST_SECONDS
+                )
+    return _rate_limiter
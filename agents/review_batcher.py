@@ -0,0 +1,229 @@
+import asyncio
+from collections import Counter
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+from config import Config
+from logger import Logger
+from agents.prompts import DEVELOP_PAGE_BATCH_REVIEW_ITEM_PROMPT, DEVELOP_PAGE_BATCH_REVIEW_PROMPT
+from agents.review_page import ReviewResult, _build_page_review_prompt, _normalize_review, areview_develop_page
+from agents.llm_client import ainvoke_llm, ainvoke_structured, store_response, _estimate_tokens
+from agents.json_extraction import robust_json_parser
+from agents.llm_telemetry import llm_tags
+from agents.circuit_breaker import ProviderUnavailableError
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+
+class PageReview(ReviewResult):
+    # バッチ内の位置（1始まり）。同じslugのページ候補が同じバッチに入るため、照合はこちらを優先する
+    index: Optional[int] = None
+    slug: str = ""
+
+
+class BatchReviewResult(BaseModel):
+    reviews: List[PageReview]
+
+
+class _ReviewRequest:
+    """バッチ待ちの1ページ分のレビュー依頼"""
+
+    def __init__(self, page_code: str, module_css_code: str, prompt_context: dict, prompt: str):
+        self.page_code = page_code
+        self.module_css_code = module_css_code
+        self.prompt_context = prompt_context
+        self.slug = prompt_context.get('page_spec', {}).get('slug', '')
+        self.prompt = prompt
+        self.tokens = _estimate_tokens(prompt)
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class _Batch:
+    """同じ共通コンテキスト（デザイン・サイトマップ・globals.css）を持つレビュー依頼の集まり"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.requests: List[_ReviewRequest] = []
+        self.tokens = _estimate_tokens(prefix)
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+def _build_batch_prompt(requests: List[_ReviewRequest]) -> str:
+    pages = "".join(
+        DEVELOP_PAGE_BATCH_REVIEW_ITEM_PROMPT.format(
+            index=i + 1,
+            slug=request.slug,
+            page_spec=request.prompt_context.get('page_spec', {}),
+            is_home_page=request.prompt_context.get('is_home_page', False),
+            page_code=request.page_code,
+            module_css_code=request.module_css_code
+        )
+        for i, request in enumerate(requests)
+    )
+    return DEVELOP_PAGE_BATCH_REVIEW_PROMPT.format(count=len(requests), pages=pages)
+
+
+def _parse_batch_response(response, requests: List[_ReviewRequest]) -> Dict[int, dict]:
+    """
+    バッチレビューのレスポンスを依頼のインデックス -> ReviewResultに対応付ける。
+    indexで照合し、indexで対応付かない依頼はバッチ内でslugが一意な場合だけslugで、
+    それでも残った依頼はレビュー数が依頼数と一致する場合だけ順序で対応付ける（1つのレビューを複数の依頼に使わない）
+    """
+    if getattr(response, "parsed", None) is not None:
+        reviews = [review.dict() for review in response.parsed.reviews]
+    else:
+        parsed_json = robust_json_parser(response.content, required_fields=['reviews'], label="batch_review")
+        reviews = []
+        for review in (parsed_json or {}).get('reviews', []) or []:
+            try:
+                reviews.append(PageReview(**review).dict())
+            except Exception:
+                continue
+
+    matched: Dict[int, int] = {}
+    used = set()
+    for n, review in enumerate(reviews):
+        index = review.get('index')
+        if isinstance(index, int) and 1 <= index <= len(requests) and index - 1 not in matched:
+            matched[index - 1] = n
+            used.add(n)
+
+    slug_counts = Counter(request.slug for request in requests)
+    for i, request in enumerate(requests):
+        if i in matched or not request.slug or slug_counts[request.slug] > 1:
+            continue
+        for n, review in enumerate(reviews):
+            if n not in used and review.get('slug') == request.slug:
+                matched[i] = n
+                used.add(n)
+                break
+
+    if len(reviews) == len(requests):
+        for i in range(len(requests)):
+            if i not in matched and i not in used:
+                matched[i] = i
+                used.add(i)
+
+    results = {i: _normalize_review({k: reviews[n][k] for k in ("score", "feedback", "passed")}) for i, n in matched.items()}
+    if len(results) == len(requests):
+        store_response(response)
+    return results
+
+
+class ReviewBatcher:
+    """
+    並列に生成されたページのレビュー依頼を短時間（REVIEW_BATCH_WINDOW_SECONDS）集め、
+    共通コンテキストを1回だけ含む1回のLLM呼び出しでまとめてレビューする。
+    - 1バッチの推定トークン数がREVIEW_BATCH_MAX_TOKENSを超える場合、またはREVIEW_BATCH_MAX_PAGESに達した場合はその時点で送信する
+    - 1ページだけのバッチや、バッチのレスポンスに含まれなかったページは通常の1ページ単位のレビューで処理する
+    asyncioの1つのイベントループ内（agenerate_stepsの1回の実行）で使う。
+    """
+
+    def __init__(self, max_tokens: int, max_pages: int, window_seconds: float):
+        self.max_tokens = max_tokens
+        self.max_pages = max(1, max_pages)
+        self.window_seconds = window_seconds
+        self._batches: Dict[str, _Batch] = {}
+        self._tasks = set()
+        # 統計
+        self.batches_sent = 0
+        self.pages_batched = 0
+
+    async def review(self, page_code: str, module_css_code: str, prompt_context: dict) -> dict:
+        """1ページのレビューを依頼し、バッチのレビュー結果（ReviewResultのdict）を待つ"""
+        prefix, prompt = _build_page_review_prompt(page_code, module_css_code, prompt_context)
+        request = _ReviewRequest(page_code, module_css_code, prompt_context, prompt)
+        if _estimate_tokens(prefix) + request.tokens > self.max_tokens:
+            # 1ページだけで予算を超える場合はまとめない
+            return await areview_develop_page(page_code, module_css_code, prompt_context)
+
+        batch = self._batches.get(prefix)
+        if batch is not None and batch.tokens + request.tokens > self.max_tokens:
+            self._flush(prefix)
+            batch = None
+        if batch is None:
+            batch = _Batch(prefix)
+            self._batches[prefix] = batch
+            batch.timer = asyncio.get_running_loop().call_later(self.window_seconds, self._flush, prefix)
+        batch.requests.append(request)
+        batch.tokens += request.tokens
+        if len(batch.requests) >= self.max_pages:
+            self._flush(prefix)
+        # 待っているページのタスクがキャンセルされた場合はfutureもキャンセルされ、送信時に除外される（他のページのバッチは続ける）
+        return await request.future
+
+    def _flush(self, prefix: str) -> None:
+        batch = self._batches.pop(prefix, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _Batch) -> None:
+        # キャンセル済み（不採用となったページ候補など）の依頼は送らない
+        requests = [request for request in batch.requests if not request.future.done()]
+        if not requests:
+            return
+        if len(requests) == 1:
+            await self._review_single(requests[0])
+            return
+
+        slugs = [request.slug for request in requests]
+        logger.info(f"[ReviewBatcher] Reviewing {len(requests)} pages in one request: {slugs}")
+        results = {}
+        try:
+            prompt = _build_batch_prompt(requests)
+            with llm_tags(stage="review", page="+".join(slugs), attempt=None, candidate=None):
+                if Config.LLM_STRUCTURED_OUTPUT:
+                    response = await ainvoke_structured(prompt, "gemini-2.5-flash", BatchReviewResult, temperature=0.2, timeout=180, use_cache=True, prefix=batch.prefix)
+                else:
+                    response = await ainvoke_llm(prompt, "gemini-2.5-flash", temperature=0.2, timeout=180, use_cache=True, prefix=batch.prefix)
+            results = _parse_batch_response(response, requests)
+            self.batches_sent += 1
+            self.pages_batched += len(results)
+        except ProviderUnavailableError as e:
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        except Exception as e:
+            logger.warning(f"[ReviewBatcher] Batch review failed, falling back to per-page reviews: {e}")
+
+        missing = []
+        for i, request in enumerate(requests):
+            if i in results:
+                if not request.future.done():
+                    request.future.set_result(results[i])
+            else:
+                missing.append(request)
+        if missing:
+            logger.info(f"[ReviewBatcher] {len(missing)} page(s) missing from batch review, reviewing individually")
+            await asyncio.gather(*(self._review_single(request) for request in missing))
+
+    async def _review_single(self, request: _ReviewRequest) -> None:
+        try:
+            result = await areview_develop_page(request.page_code, request.module_css_code, request.prompt_context)
+        except BaseException as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+        if not request.future.done():
+            request.future.set_result(result)
+
+    async def aclose(self) -> None:
+        """送信待ちのバッチと実行中のバッチレビューを止める（ワークフローの終了・中断時）"""
+        for batch in self._batches.values():
+            if batch.timer is not None:
+                batch.timer.cancel()
+            for request in batch.requests:
+                request.future.cancel()
+        self._batches.clear()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
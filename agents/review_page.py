@@ -1,11 +1,12 @@
-import re
-import json
-from typing import Dict, List
+from typing import Dict, List, Tuple
 from config import Config
 from logger import Logger
-from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel
-from agents.prompts import LAYOUT_REVIEW_PROMPT, DEVELOP_PAGE_REVIEW_PROMPT
+from agents.prompts import LAYOUT_REVIEW_PROMPT, DEVELOP_PAGE_REVIEW_CONTEXT_PROMPT, DEVELOP_PAGE_REVIEW_PROMPT
+from agents.llm_client import ainvoke_llm, ainvoke_structured, store_response
+from agents.json_extraction import robust_json_parser
+from agents.llm_telemetry import llm_tags
+from agents.circuit_breaker import ProviderUnavailableError
 
 logger = Logger(log_file=Config.LOG_FILE)
 
@@ -14,116 +15,95 @@ class ReviewResult(BaseModel):
     feedback: str
     passed: bool
 
-# 共通JSONパースユーティリティ
-def robust_json_parser(content: str, required_fields: list = None, specific_patterns: list = None, extract_multiple: bool = False):
+# review_index_page関数は廃止されました。homeページもreview_develop_pageで統一処理します。
+
+def _build_layout_review_prompt(layout_code: str, globals_css_code: str, prompt_context: dict) -> str:
+    """layout files レビュー用プロンプトを組み立てる"""
+    # プロンプトテンプレートに動的な値を埋め込み
+    return LAYOUT_REVIEW_PROMPT.format(
+        overall_design=prompt_context.get('overall_design', ''),
+        sitemap=prompt_context.get('sitemap', []),
+        required_navigation_targets=[p.get('slug', p.get('name', '')) for p in prompt_context.get('sitemap', [])],
+        layout_code=layout_code,
+        globals_css_code=globals_css_code
+    )
+
+def _build_page_review_prompt(page_code: str, module_css_code: str, prompt_context: dict) -> Tuple[str, str]:
     """
-    堅牢なJSONパース共通関数
+    develop page レビュー用プロンプトを組み立てる
+    Returns: (全ページ共通のプレフィックス, ページ固有のプロンプト)
     """
-    json_candidates = []
-    
-    # 戦略1: コードブロック内のJSONを抽出（```json または ``` のパターン）
-    code_blocks = re.findall(r"```(?:json)?\s*([\s\S]*?)```", content)
-    for block in code_blocks:
-        block = block.strip()
-        if block.startswith('{') and block.endswith('}'):
-            json_candidates.append(block)
-        else:
-            # コードブロック内で{}パターンを探す
-            json_matches = re.findall(r'\{[\s\S]*?\}', block)
-            json_candidates.extend(json_matches)
-    
-    # 戦略2: 生のレスポンステキストから{}パターンを抽出
-    raw_matches = re.findall(r'\{[\s\S]*?\}', content)
-    json_candidates.extend(raw_matches)
-    
-    # 戦略3: より厳密な複雑JSONパターンマッチング（長いfeedbackフィールド対応）
-    complex_json_pattern = r'\{\s*"score"\s*:\s*\d+\s*,\s*"feedback"\s*:\s*".*?"\s*,\s*"passed"\s*:\s*(?:true|false)\s*\}'
-    complex_matches = re.findall(complex_json_pattern, content, re.DOTALL)
-    json_candidates.extend(complex_matches)
-    
-    # 戦略4: 特化パターンマッチング
-    if specific_patterns:
-        for pattern in specific_patterns:
-            pattern_matches = re.findall(pattern, content, re.DOTALL)
-            json_candidates.extend(pattern_matches)
-    
-    # パース結果格納
-    parsed_objects = []
-    
-    # 各候補を試してパース
-    for candidate in json_candidates:
-        candidate = candidate.strip()
-        if not candidate:
-            continue
-        try:
-            parsed = json.loads(candidate)
-            if isinstance(parsed, dict):
-                # 必須フィールドチェック
-                if required_fields:
-                    if all(field in parsed for field in required_fields):
-                        if extract_multiple:
-                            parsed_objects.append(parsed)
-                        else:
-                            return parsed
-                else:
-                    if extract_multiple:
-                        parsed_objects.append(parsed)
-                    else:
-                        return parsed
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.debug(f"[robust_json_parser] JSON parse failed: {e}, candidate length: {len(candidate)}")
-            continue
-    
-    # 結果を返す
-    if extract_multiple:
-        return parsed_objects
-    elif parsed_objects:
-        return parsed_objects[0]
+    # プロンプトテンプレートに動的な値を埋め込み
+    prefix = DEVELOP_PAGE_REVIEW_CONTEXT_PROMPT.format(
+        overall_design=prompt_context.get('overall_design', ''),
+        sitemap=prompt_context.get('sitemap', []),
+        globals_css=prompt_context.get('globals_css', '')
+    )
+    return prefix, DEVELOP_PAGE_REVIEW_PROMPT.format(
+        page_spec=prompt_context.get('page_spec', {}),
+        slug=prompt_context.get('page_spec', {}).get('slug', ''),
+        is_home_page=prompt_context.get('is_home_page', False),
+        page_code=page_code,
+        module_css_code=module_css_code
+    )
+
+async def _ainvoke_review(review_prompt: str, prefix: str = ""):
+    """
+    レビューを実行する（構造化出力が有効ならReviewResultスキーマで直接検証）
+    prefix: 全ページ共通のプロンプト先頭部分（コンテキストキャッシュの対象）
+    """
+    with llm_tags(stage="review"):
+        if Config.LLM_STRUCTURED_OUTPUT:
+            return await ainvoke_structured(review_prompt, "gemini-2.5-flash", ReviewResult, temperature=0.2, timeout=180, use_cache=True, prefix=prefix)
+        return await ainvoke_llm(review_prompt, "gemini-2.5-flash", temperature=0.2, timeout=180, use_cache=True, prefix=prefix)
+
+def _parse_review_response(response) -> dict:
+    """レビューレスポンスをReviewResultとして検証する。パースできない場合はNone"""
+    if getattr(response, "parsed", None) is not None:
+        review_result = response.parsed.dict()
     else:
-        return None
+        # 構造化出力が無効、または検証に失敗した場合のみ正規表現でパース
+        patterns = [r'\{\s*"score"\s*:\s*\d+\s*,[\s\S]*?"passed"\s*:\s*(?:true|false)\s*\}']
+        parsed_json = robust_json_parser(response.content, required_fields=['score', 'feedback', 'passed'], specific_patterns=patterns, label="review")
+        
+        if not parsed_json:
+            return None
+        review_result = ReviewResult(**parsed_json).dict()
+    store_response(response)
+    return _normalize_review(review_result)
 
-# review_index_page関数は廃止されました。homeページもreview_develop_pageで統一処理します。
+def _normalize_review(review_result: dict) -> dict:
+    """スコアとpassedの整合性を自動補正する"""
+    if review_result['score'] >= 80 and not review_result['passed']:
+        review_result['passed'] = True
+    elif review_result['score'] < 80 and review_result['passed']:
+        review_result['passed'] = False
+    return review_result
 
 def review_layout_files(layout_code: str, globals_css_code: str, prompt_context: dict) -> dict:
+    """areview_layout_filesの同期版"""
+    from agents.step_generation import _run_sync
+    return _run_sync(areview_layout_files(layout_code, globals_css_code, prompt_context))
+
+async def areview_layout_files(layout_code: str, globals_css_code: str, prompt_context: dict) -> dict:
     """
     layout.tsx + globals.css 専用レビュー関数
     - layout構造の正確性をチェック
     - globals.cssのTailwindCSS準拠性を重視
     - 共有ヘッダー/フッターの実装確認
     """
+    review_prompt = _build_layout_review_prompt(layout_code, globals_css_code, prompt_context)
     
-    # プロンプトテンプレートに動的な値を埋め込み
-    review_prompt = LAYOUT_REVIEW_PROMPT.format(
-        overall_design=prompt_context.get('overall_design', ''),
-        sitemap=prompt_context.get('sitemap', []),
-        required_navigation_targets=[p.get('slug', p.get('name', '')) for p in prompt_context.get('sitemap', [])],
-        layout_code=layout_code,
-        globals_css_code=globals_css_code
-    )
-    
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        temperature=0.2, 
-        google_api_key=Config.GOOGLE_API_KEY,
-        timeout=180 
-    )
-
     # 最大3回リトライ
     for attempt in range(3):
         try:
-            response = llm.invoke(review_prompt)
-            
-            patterns = [r'\{\s*"score"\s*:\s*\d+\s*,[\s\S]*?"passed"\s*:\s*(?:true|false)\s*\}']
-            parsed_json = robust_json_parser(response.content, required_fields=['score', 'feedback', 'passed'], specific_patterns=patterns)
-            
-            if parsed_json:
-                review_result = ReviewResult(**parsed_json).dict()
-                # スコアとpassedの整合性を自動補正
-                if review_result['score'] >= 80 and not review_result['passed']:
-                    review_result['passed'] = True
-                elif review_result['score'] < 80 and review_result['passed']:
-                    review_result['passed'] = False
+            response = await _ainvoke_review(review_prompt)
+            review_result = _parse_review_response(response)
+            if review_result:
                 return review_result
+        except ProviderUnavailableError:
+            # プロバイダ障害中はリトライせず、ワークフローを即座に停止させる
+            raise
         except Exception as e:
             logger.debug(f"[review_layout_files] Attempt {attempt + 1} failed: {e}")
             if attempt == 2:  # 最後の試行
@@ -132,51 +112,32 @@ def review_layout_files(layout_code: str, globals_css_code: str, prompt_context:
     return {"score": 0, "feedback": "layout files レビュー実行に失敗しました", "passed": False}
 
 def review_develop_page(page_code: str, module_css_code: str, prompt_context: dict) -> dict:
+    """areview_develop_pageの同期版"""
+    from agents.step_generation import _run_sync
+    return _run_sync(areview_develop_page(page_code, module_css_code, prompt_context))
+
+async def areview_develop_page(page_code: str, module_css_code: str, prompt_context: dict) -> dict:
     """
     個別ページ (app/[slug]/page.tsx + module.css) 専用レビュー関数
     - ページ固有コンテンツの実装をチェック  
     - module.cssの正確性を重視
     - 共有ヘッダーとの重複チェック
     """
-    
-    # プロンプトテンプレートに動的な値を埋め込み
-    review_prompt = DEVELOP_PAGE_REVIEW_PROMPT.format(
-        overall_design=prompt_context.get('overall_design', ''),
-        page_spec=prompt_context.get('page_spec', {}),
-        sitemap=prompt_context.get('sitemap', []),
-        globals_css=prompt_context.get('globals_css', ''),
-        slug=prompt_context.get('page_spec', {}).get('slug', ''),
-        is_home_page=prompt_context.get('is_home_page', False),
-        page_code=page_code,
-        module_css_code=module_css_code
-    )
-
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        temperature=0.2, 
-        google_api_key=Config.GOOGLE_API_KEY,
-        timeout=180 
-    )
+    prefix, review_prompt = _build_page_review_prompt(page_code, module_css_code, prompt_context)
     
     # 最大3回リトライ
     for attempt in range(3):
         try:
-            response = llm.invoke(review_prompt)
-            
-            patterns = [r'\{\s*"score"\s*:\s*\d+\s*,[\s\S]*?"passed"\s*:\s*(?:true|false)\s*\}']
-            parsed_json = robust_json_parser(response.content, required_fields=['score', 'feedback', 'passed'], specific_patterns=patterns)
-            
-            if parsed_json:
-                review_result = ReviewResult(**parsed_json).dict()
-                # スコアとpassedの整合性を自動補正
-                if review_result['score'] >= 80 and not review_result['passed']:
-                    review_result['passed'] = True
-                elif review_result['score'] < 80 and review_result['passed']:
-                    review_result['passed'] = False
+            response = await _ainvoke_review(review_prompt, prefix)
+            review_result = _parse_review_response(response)
+            if review_result:
                 return review_result
+        except ProviderUnavailableError:
+            # プロバイダ障害中はリトライせず、ワークフローを即座に停止させる
+            raise
         except Exception as e:
             logger.debug(f"[review_develop_page] Attempt {attempt + 1} failed: {e}")
             if attempt == 2:  # 最後の試行
                 break
     
-    return {"score": 0, "feedback": "develop page レビュー実行に失敗しました", "passed": False} 
\ No newline at end of file
+    return {"score": 0, "feedback": "develop page レビュー実行に失敗しました", "passed": False}
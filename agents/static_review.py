@@ -0,0 +1,253 @@
+import re
+from typing import Dict, List, Optional
+from config import Config
+from logger import Logger
+
+logger = Logger(log_file=Config.LOG_FILE)
+
+# LLMレビュー前に生成コードを機械的に検査する（レビュープロンプトが明示的に禁止・要求している項目のみ）
+# 安全に直せるものはその場で修正し、直せないものはLLMレビューを呼ばずに不合格とする
+
+_USE_CLIENT = re.compile(r'^\s*["\']use client["\'];?[ \t]*\n?', re.MULTILINE)
+_HOOK_CALL = re.compile(r'\buse(?:State|Effect|LayoutEffect|Reducer|Ref|Context|Callback|Memo|Transition|Router|Pathname|SearchParams)\s*\(')
+_EVENT_HANDLER = re.compile(r'\son[A-Z]\w*\s*=\s*\{')
+_IMPORT_LINE = re.compile(r'^import\s[^\n]*\n', re.MULTILINE)
+_REACT_IMPORT = re.compile(r'^import\s+(?:\*\s+as\s+)?React\b', re.MULTILINE)
+_METADATA_EXPORT = re.compile(r'export\s+(?:const\s+metadata\b|(?:async\s+)?function\s+generateMetadata\b)')
+_GLOBALS_CSS_IMPORT = re.compile(r'^import\s+["\'](\.{1,2})/globals\.css["\'];?', re.MULTILINE)
+_MODULE_CSS_IMPORT = re.compile(r'^import\s+(\w+)\s+from\s+["\']\./([\w-]+\.module\.css)["\'];?', re.MULTILINE)
+_STYLES_USAGE = re.compile(r'\bstyles(?:\.\w|\[)')
+_HTML_COMMENT = re.compile(r'<!--(.*?)-->', re.DOTALL)
+_LAYOUT_ELEMENT = re.compile(r'<(header|nav)\b')
+_HREF = re.compile(r'\bhref\s*[=:]\s*\{?\s*["\'`]([^"\'`]*)["\'`]')
+_EXTERNAL_SRC = re.compile(r'\bsrc\s*=\s*\{?\s*["\'`]((?:https?:)?//[^"\'`]*)')
+_EXTERNAL_LINK_TAG = re.compile(r'<link\b[^>]*\bhref\s*=\s*["\']((?:https?:)?//[^"\']*)')
+_EXTERNAL_CSS_URL = re.compile(r'(?:url\(\s*["\']?|@import\s+["\'])((?:https?:)?//[^"\')\s]*)')
+_TAILWIND_DIRECTIVE = re.compile(r'^\s*@tailwind\s+[\w-]+;?[ \t]*\n?', re.MULTILINE)
+_ROOT_SELECTOR = re.compile(r'(^|[\s,}]):root\b')
+_APPLY_CSS_VARIABLE = re.compile(r'@apply\s[^;{}]*\[var\(')
+
+
+class StaticIssue:
+    """静的チェックで見つかった問題（repaired=Trueの場合は自動修正済み）"""
+
+    def __init__(self, code: str, message: str, repaired: bool = False):
+        self.code = code
+        self.message = message
+        self.repaired = repaired
+
+    def to_dict(self) -> Dict:
+        return {"code": self.code, "message": self.message, "repaired": self.repaired}
+
+
+class StaticReview:
+    """静的チェックの結果と、自動修正後のコード（files: キー -> コード）"""
+
+    def __init__(self, label: str, files: Dict[str, str]):
+        self.label = label
+        self.files = dict(files)
+        self.issues: List[StaticIssue] = []
+
+    def error(self, code: str, message: str) -> None:
+        self.issues.append(StaticIssue(code, message))
+
+    def repaired(self, code: str, message: str) -> None:
+        self.issues.append(StaticIssue(code, message, repaired=True))
+
+    @property
+    def errors(self) -> List[StaticIssue]:
+        return [issue for issue in self.issues if not issue.repaired]
+
+    @property
+    def repairs(self) -> List[StaticIssue]:
+        return [issue for issue in self.issues if issue.repaired]
+
+    @property
+    def passed(self) -> bool:
+        return not self.errors
+
+    def feedback(self) -> str:
+        """修正用プロンプトに渡すフィードバック（自動修正できなかった問題のみ）"""
+        lines = [f"- [{issue.code}] {issue.message}" for issue in self.errors]
+        return "Static pre-review found build/rule violations that must be fixed:\n" + "\n".join(lines)
+
+    def to_review_result(self) -> Dict:
+        """LLMレビューと同じ形式の不合格結果（LLMレビューを呼ばずに返す）"""
+        return {
+            "score": 0,
+            "feedback": self.feedback(),
+            "passed": False,
+            "static_issues": [issue.to_dict() for issue in self.issues],
+        }
+
+    def log(self) -> None:
+        for issue in self.repairs:
+            logger.info(f"[StaticReview] {self.label}: auto-repaired {issue.code}: {issue.message}")
+        if self.errors:
+            logger.info(f"[StaticReview] {self.label}: rejected ({', '.join(issue.code for issue in self.errors)})")
+
+
+def _insert_import(code: str, statement: str) -> str:
+    """最後のimport文の後（なければ 'use client' の後、またはファイル先頭）にimport文を挿入する"""
+    matches = list(_IMPORT_LINE.finditer(code))
+    if matches:
+        position = matches[-1].end()
+    else:
+        directive = _USE_CLIENT.match(code)
+        position = directive.end() if directive else 0
+    return code[:position] + statement + "\n" + code[position:]
+
+
+def _normalize_path(href: str) -> Optional[str]:
+    """内部リンクのパス部分（クエリ・アンカーを除く）。外部リンク・アンカーのみ・動的な値の場合はNone"""
+    if not href.startswith("/") or href.startswith("//") or "${" in href:
+        return None
+    path = re.split(r"[?#]", href, maxsplit=1)[0]
+    if len(path) > 1:
+        path = path.rstrip("/")
+    return path or "/"
+
+
+def _sitemap_paths(sitemap: list) -> List[str]:
+    paths = []
+    for entry in sitemap or []:
+        if not isinstance(entry, dict):
+            continue
+        path = entry.get("path")
+        if not path:
+            slug = entry.get("slug", "")
+            path = "/" if slug in ("", "home", "index") else f"/{slug}"
+        normalized = _normalize_path(path)
+        if normalized and normalized not in paths:
+            paths.append(normalized)
+    return paths
+
+
+def _check_server_component(review: StaticReview, key: str, file_label: str) -> None:
+    """Server Component制約：hooks・イベントハンドラは不可。'use client' はそれらがなければ削除する"""
+    code = review.files[key]
+    hooks = sorted(set(match.group(0).rstrip("( ") for match in _HOOK_CALL.finditer(code)))
+    handlers = sorted(set(match.group(0).strip().split("=")[0].strip() for match in _EVENT_HANDLER.finditer(code)))
+    if hooks or handlers:
+        used = ", ".join(hooks + handlers)
+        review.error("client_features", f"{file_label} must be a Server Component but uses React hooks/event handlers ({used}); remove them instead of adding 'use client'")
+    elif _USE_CLIENT.search(code):
+        review.files[key] = _USE_CLIENT.sub("", code, count=1)
+        review.repaired("use_client", f"removed unnecessary 'use client' directive from {file_label}")
+
+
+def _check_external_resources(review: StaticReview, key: str, file_label: str, patterns) -> None:
+    urls = []
+    for pattern in patterns:
+        urls.extend(match.group(1) for match in pattern.finditer(review.files[key]))
+    if urls:
+        shown = ", ".join(sorted(set(urls))[:3])
+        review.error("external_resource", f"{file_label} loads external resources ({shown}); use local files under /public instead")
+
+
+def _check_nav_targets(review: StaticReview, key: str, file_label: str, sitemap: list, require_all: bool) -> None:
+    allowed = _sitemap_paths(sitemap)
+    if not allowed:
+        return
+    linked = []
+    for match in _HREF.finditer(review.files[key]):
+        path = _normalize_path(match.group(1))
+        if path and path not in linked:
+            linked.append(path)
+    unknown = [path for path in linked if path not in allowed]
+    if unknown:
+        review.error("nav_target", f"{file_label} links to pages not in the sitemap: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+    if require_all:
+        missing = [path for path in allowed if path not in linked]
+        if missing:
+            review.error("nav_missing", f"{file_label} navigation is missing links to sitemap pages: {', '.join(missing)}")
+
+
+def _check_module_css(review: StaticReview, key: str, file_label: str) -> None:
+    css = review.files[key]
+    if _TAILWIND_DIRECTIVE.search(css):
+        review.files[key] = _TAILWIND_DIRECTIVE.sub("", css)
+        review.repaired("module_css_tailwind", f"removed @tailwind directives from {file_label}")
+    if _ROOT_SELECTOR.search(review.files[key]):
+        review.error("module_css_root", f"{file_label} must not use the :root selector (CSS modules only allow local class selectors)")
+
+
+def check_page_files(page_code: str, module_css_code: str, slug: str, is_home_page: bool, sitemap: list = None) -> StaticReview:
+    """
+    page.tsx + module.cssを静的にチェックする。
+    自動修正: React import・globals.css / module.cssのimport（欠落・パス誤り）、不要な 'use client'、HTMLコメント、module.cssの@tailwind
+    不合格: header/nav の重複、hooks・イベントハンドラ、外部リソース、サイトマップにないリンク、module.cssの:root
+    """
+    label = f"page '{slug or 'home'}'"
+    review = StaticReview(label, {"page": page_code or "", "module_css": module_css_code or ""})
+    code = review.files["page"]
+
+    if not _REACT_IMPORT.search(code):
+        code = _insert_import(code, "import React from 'react';")
+        review.repaired("react_import", "added missing `import React from 'react';`")
+
+    expected_globals = "." if is_home_page else ".."
+    globals_import = _GLOBALS_CSS_IMPORT.search(code)
+    if globals_import is None:
+        code = _insert_import(code, f"import '{expected_globals}/globals.css';")
+        review.repaired("globals_css_import", f"added missing `import '{expected_globals}/globals.css';`")
+    elif globals_import.group(1) != expected_globals:
+        code = code[:globals_import.start()] + f"import '{expected_globals}/globals.css';" + code[globals_import.end():]
+        review.repaired("globals_css_import", f"fixed globals.css import path to '{expected_globals}/globals.css'")
+
+    expected_module = "home.module.css" if is_home_page else f"{slug}.module.css"
+    module_import = _MODULE_CSS_IMPORT.search(code)
+    if module_import is None:
+        if _STYLES_USAGE.search(code):
+            code = _insert_import(code, f"import styles from './{expected_module}';")
+            review.repaired("module_css_import", f"added missing `import styles from './{expected_module}';`")
+    elif module_import.group(2) != expected_module:
+        code = code[:module_import.start()] + f"import {module_import.group(1)} from './{expected_module}';" + code[module_import.end():]
+        review.repaired("module_css_import", f"fixed module.css import path to './{expected_module}'")
+
+    if _HTML_COMMENT.search(code):
+        code = _HTML_COMMENT.sub(lambda match: "{/*" + match.group(1).replace("*/", "") + "*/}", code)
+        review.repaired("html_comment", "converted HTML comments to JSX comments")
+
+    review.files["page"] = code
+    _check_server_component(review, "page", "page.tsx")
+
+    elements = sorted(set(match.group(1) for match in _LAYOUT_ELEMENT.finditer(review.files["page"])))
+    if elements:
+        review.error("duplicate_header", f"page.tsx must not contain {', '.join('<' + e + '>' for e in elements)} (the shared header/navigation is inherited from layout.tsx)")
+
+    _check_external_resources(review, "page", "page.tsx", [_EXTERNAL_SRC, _EXTERNAL_CSS_URL])
+    _check_external_resources(review, "module_css", expected_module, [_EXTERNAL_CSS_URL])
+    _check_nav_targets(review, "page", "page.tsx", sitemap, require_all=False)
+    _check_module_css(review, "module_css", expected_module)
+    return review
+
+
+def check_layout_files(layout_code: str, globals_css_code: str, sitemap: list = None) -> StaticReview:
+    """
+    layout.tsx + globals.cssを静的にチェックする。
+    自動修正: globals.cssのimport欠落、不要な 'use client'
+    不合格: metadata exportの欠落、<header>の欠落、hooks・イベントハンドラ、外部リソース、
+            サイトマップとナビゲーションの不一致、@applyでのCSS変数の使用
+    """
+    review = StaticReview("layout", {"layout": layout_code or "", "globals_css": globals_css_code or ""})
+    code = review.files["layout"]
+
+    if not _GLOBALS_CSS_IMPORT.search(code):
+        code = _insert_import(code, "import './globals.css';")
+        review.repaired("globals_css_import", "added missing `import './globals.css';`")
+    review.files["layout"] = code
+    _check_server_component(review, "layout", "layout.tsx")
+
+    if not _METADATA_EXPORT.search(code):
+        review.error("metadata_export", "layout.tsx must export site-wide defaults with `export const metadata = { title, description }`")
+    if not re.search(r'<header\b', code):
+        review.error("missing_header", "layout.tsx must contain the shared <header> with navigation to all sitemap pages")
+
+    _check_external_resources(review, "layout", "layout.tsx", [_EXTERNAL_SRC, _EXTERNAL_LINK_TAG, _EXTERNAL_CSS_URL])
+    _check_external_resources(review, "globals_css", "globals.css", [_EXTERNAL_CSS_URL])
+    _check_nav_targets(review, "layout", "layout.tsx", sitemap, require_all=True)
+
+    if _APPLY_CSS_VARIABLE.search(review.files["globals_css"]):
+        review.error("apply_css_variable", "globals.css uses CSS variables inside @apply arbitrary values (e.g. `@apply bg-[var(--x)]`), which breaks the build; use plain CSS properties instead")
+    return review
@@ -2,19 +2,29 @@ import os
 import json
 import subprocess
 import time
-import random
+import asyncio
+import contextvars
 from dotenv import load_dotenv
 from config import Config
 from logger import Logger
 from typing import List, Dict
 from pydantic import BaseModel
-from concurrent.futures import ThreadPoolExecutor, wait, as_completed
-from agents.page_development import generate_layout, generate_tailwind_css, develop_page, LayoutCache
-from agents.review_page import review_develop_page, review_layout_files
+from concurrent.futures import ThreadPoolExecutor
+from agents.page_development import agenerate_layout, generate_tailwind_css, adevelop_page, apatch_page, LayoutCache, _is_home_page
+from agents.review_page import areview_develop_page, areview_layout_files
+from agents.llm_client import invalidate_response
+from agents.llm_telemetry import set_llm_tags, record_attempt, record_speculation, workflow_stage
+from agents.model_router import get_model_router
+from agents.circuit_breaker import ProviderUnavailableError
+from agents.review_batcher import ReviewBatcher
+from tools.node_toolchain import get_node_toolchain
 
 load_dotenv()
 logger = Logger(log_file=Config.LOG_FILE)
 
+# ページ候補を複数生成する場合の候補ごとのtemperatureの増分（1候補目は0.2）
+_CANDIDATE_TEMPERATURE_STEP = 0.3
+
 def write_file(file_path: str, content: str) -> None:
     """
     ファイルにコンテンツを書き込む関数
@@ -74,12 +84,13 @@ class SetupAgent:
         # 既に存在する場合はスキップ
         if not os.path.exists(project_path):
             try:
-                cmd = [
+                toolchain = get_node_toolchain()
+                cmd = toolchain.command(
                     "npx", "create-next-app@latest", project_name,
                     "--use-npm", "--no-git", "--typescript", "--eslint", "--src-dir", "--app"
-                ]
+                )
                 logger.info(f"[SetupAgent] Running: {' '.join(cmd)} in {output_dir}")
-                result = subprocess.run(cmd, cwd=output_dir, capture_output=True, text=True, check=True)
+                result = subprocess.run(cmd, cwd=output_dir, capture_output=True, text=True, check=True, env=toolchain.env())
                 description = f"Next.js project initialized at {project_path}\nstdout: {result.stdout}\nstderr: {result.stderr}"
             except Exception as e:
                 description = f"Failed to initialize Next.js project: {e}"
@@ -93,8 +104,78 @@ class SetupAgent:
             "description": description
         }
 
+def _run_sync(coro):
+    """
+    同期コードからコルーチンを実行する。
+    呼び出しスレッドで既にイベントループが動いている場合（MCPサーバーから同期ツールとして呼ばれた場合など）は
+    別スレッドで新しいループを起動して完了を待つ。contextvarsは呼び出し元のものを引き継ぐ。
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    ctx = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(ctx.run, asyncio.run, coro).result()
+
+def _app_dir(project_name: str) -> str:
+    """生成先のapp/ディレクトリ（プロジェクトルートからの絶対パス）"""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(project_root, Config.OUTPUT_DIR, project_name, "app")
+
+def _layout_file_paths(project_name: str) -> Dict[str, str]:
+    """layout生成結果のキー -> 書き込み先パス"""
+    project_path = _app_dir(project_name)
+    return {
+        "layout": os.path.join(project_path, "layout.tsx"),
+        "globals_css": os.path.join(project_path, "globals.css"),
+    }
+
+def _page_file_paths(project_name: str, page: dict, is_home_page: bool) -> Dict[str, str]:
+    """ページ生成結果のキー -> 書き込み先パス"""
+    project_path = _app_dir(project_name)
+    if is_home_page:
+        # homeページはルートに配置
+        return {
+            "page": os.path.join(project_path, "page.tsx"),
+            "module_css": os.path.join(project_path, "home.module.css"),
+        }
+    # 他のページは slug ディレクトリに配置
+    slug = page.get('slug', '')
+    page_dir = os.path.join(project_path, slug)
+    return {
+        "page": os.path.join(page_dir, "page.tsx"),
+        "module_css": os.path.join(page_dir, f"{slug}.module.css"),
+    }
+
+def _required_libs(result: Dict, keys) -> set:
+    """生成結果のファイルオブジェクト（result[key]）のrequired_libsをまとめる"""
+    libs = set()
+    for key in keys:
+        obj = result.get(key) if isinstance(result, dict) else None
+        if isinstance(obj, dict) and obj.get('required_libs'):
+            libs.update(obj['required_libs'])
+    return libs
+
+def _artifact_writer(paths: Dict[str, str], label: str):
+    """
+    ストリーミング中に閉じたファイルオブジェクトを即座に書き込むコールバックを返す。
+    レビュー前の暫定書き込みであり、合格した結果は承認時に改めて書き込まれる。
+    """
+    def on_artifact(key: str, obj: dict) -> None:
+        path = paths.get(key)
+        if path and obj.get('code'):
+            logger.debug(f"[StepGeneration] Writing streamed {obj.get('name')} for {label}")
+            write_file(path, obj['code'])
+    return on_artifact
+
 class StepGenerationAgent:
     def generate_steps(self, requirements: dict, project_name: str):
+        """同期エントリポイント。内部ではasyncioパイプライン（agenerate_steps）を実行する"""
+        return _run_sync(self.agenerate_steps(requirements, project_name))
+
+    async def agenerate_steps(self, requirements: dict, project_name: str):
         # instruction_analysis.pyの出力を受け取る
         overall_design = requirements.get("overall_design", "")
         pages = requirements.get("pages", [])
@@ -104,20 +185,34 @@ class StepGenerationAgent:
         steps = []
         all_required_libs = set()
         globals_css_content = ""
+        # 承認されたlayout候補のレビュー中に先行開始したページ生成（LAYOUT_SPECULATIVE_PAGES有効時）
+        speculative_pages = None
+        # 有効時は並列に生成されたページのレビューを短時間集めて1回のLLM呼び出しでまとめて行う
+        review_batcher = ReviewBatcher(
+            Config.REVIEW_BATCH_MAX_TOKENS, Config.REVIEW_BATCH_MAX_PAGES, Config.REVIEW_BATCH_WINDOW_SECONDS
+        ) if Config.REVIEW_BATCH_ENABLED else None
         
         # 2. Layout品質重視フロー  
-        def generate_layout_with_quality_control():
+        async def generate_layout_with_quality_control():
             """Layout品質重視フロー：生成 -> レビュー -> リトライ（最大3回）"""
             max_attempts = Config.MAX_ATTEMPTS
+            # 静的チェックで不合格になった場合の指摘（次の試行の修正用プロンプトに渡す）
+            static_feedback = ""
             for attempt in range(max_attempts):
                 try:
+                    set_llm_tags(stage="layout", page=None, attempt=attempt + 1)
                     if attempt > 0:
                         logger.info(f"[StepGeneration] Layout retry {attempt + 1}/{max_attempts}")
                     
-                    # Layout生成
-                    layout_result = generate_layout(overall_design, sitemap, project_name)
+                    # Layout生成（ストリーミング時は各ファイルが閉じた時点で書き込む）
+                    layout_result = await agenerate_layout(
+                        overall_design, sitemap, project_name,
+                        on_artifact=_artifact_writer(_layout_file_paths(project_name), "layout"),
+                        review_feedback=static_feedback
+                    )
                     
                     if not isinstance(layout_result, dict) or not layout_result.get('layout') or not layout_result.get('globals_css'):
+                        record_attempt("layout", attempt + 1, False)
                         if attempt == max_attempts - 1:
                             raise QualityControlException(
                                 f"Layout generation failed after {max_attempts} attempts", 
@@ -126,31 +221,50 @@ class StepGenerationAgent:
                             )
                         continue
                     
+                    # 静的チェックで不合格の場合はLLMレビューもページの先行生成も行わずに再生成する
+                    if layout_result.get('review') is not None:
+                        static_feedback = layout_result['review']['feedback']
+                        record_attempt("layout", attempt + 1, False, layout_result['review'].get('score', 0))
+                        invalidate_response(layout_result.get('cache_key'))
+                        if attempt == max_attempts - 1:
+                            raise QualityControlException(
+                                f"Layout static pre-review failed after {max_attempts} attempts: {static_feedback}", 
+                                component="layout", 
+                                attempts=max_attempts
+                            )
+                        continue
+                    static_feedback = ""
+                    
+                    # ページ生成をこのlayout候補で先行開始し、レビューと並行して進める（不合格なら破棄して再開する）
+                    speculation = start_speculative_pages(layout_result, attempt + 1)
+                    
                     # レビュー実行
-                    review_result = review_layout_files(
-                        layout_result['layout']['code'],
-                        layout_result['globals_css']['code'],
-                        {
-                            'overall_design': overall_design,
-                            'sitemap': sitemap
-                        }
-                    )
+                    try:
+                        review_result = await areview_layout_files(
+                            layout_result['layout']['code'],
+                            layout_result['globals_css']['code'],
+                            {
+                                'overall_design': overall_design,
+                                'sitemap': sitemap
+                            }
+                        )
+                    except BaseException:
+                        await discard_speculative_pages(speculation)
+                        raise
                     
                     review_score = review_result.get('score', 0)
                     
                     if review_score >= 80:
                         # 品質基準クリア
                         logger.info(f"[StepGeneration] Layout approved (score: {review_score})")
+                        record_attempt("layout", attempt + 1, True, review_score)
                         
                         # ファイル書き込み処理を実行
                         if layout_result.get('layout') and layout_result.get('globals_css'):
                             try:
-                                # プロジェクトルートからの絶対パスを構築
-                                project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                                output_dir_path = os.path.join(project_root, Config.OUTPUT_DIR)
-                                project_path = os.path.join(output_dir_path, project_name, "app")
-                                layout_path = os.path.join(project_path, "layout.tsx")
-                                css_path = os.path.join(project_path, "globals.css")
+                                layout_paths = _layout_file_paths(project_name)
+                                layout_path = layout_paths["layout"]
+                                css_path = layout_paths["globals_css"]
                                 
                                 # layout.tsx書き込み
                                 write_file(layout_path, layout_result['layout']['code'])
@@ -170,11 +284,19 @@ class StepGenerationAgent:
                         
                         layout_result['review'] = review_result
                         # globals.css内容を後続処理用に保存
-                        nonlocal globals_css_content
+                        nonlocal globals_css_content, speculative_pages
                         globals_css_content = layout_result['globals_css']['code']
+                        if speculation is not None:
+                            elapsed = time.perf_counter() - speculation["started"]
+                            record_speculation(attempt + 1, True, elapsed, len(speculation["progress"]), len(pages))
+                            logger.info(f"[StepGeneration] Keeping pages started during layout review ({elapsed:.1f}s ahead, {len(speculation['progress'])}/{len(pages)} pages done)")
+                            speculative_pages = speculation
                         return layout_result
                     else:
-                        # 品質基準未達
+                        # 品質基準未達 - 不合格の生成結果をキャッシュから除外して再生成させる
+                        record_attempt("layout", attempt + 1, False, review_score)
+                        invalidate_response(layout_result.get('cache_key'))
+                        await discard_speculative_pages(speculation)
                         if attempt == max_attempts - 1:
                             raise QualityControlException(
                                 f"Layout quality check failed after {max_attempts} attempts (final score: {review_score})", 
@@ -183,8 +305,8 @@ class StepGenerationAgent:
                             )
                         continue
                         
-                except QualityControlException:
-                    # QualityControlExceptionは再発生
+                except (QualityControlException, ProviderUnavailableError):
+                    # QualityControlException・ProviderUnavailableError（プロバイダ障害中）は再発生
                     raise
                 except Exception as e:
                     logger.error(f"[StepGeneration] Layout generation exception: {e}")
@@ -203,21 +325,142 @@ class StepGenerationAgent:
             )
 
         # 3. 各ページ品質重視フロー（既存）
-        def develop_page_with_quality_control(overall_design, page, sitemap, globals_css_content, project_name):
+        async def generate_page_candidate(overall_design, page, sitemap, globals_css_content, project_name, layout_code, model, candidate=None, on_artifact=None):
+            """
+            ページ候補を1つ生成してレビューする。生成に失敗した場合はNone、成功した場合はreview付きのpage_resultを返す。
+            model: 生成に使うモデル（ModelRouterの判断）
+            candidate: 複数候補を並列生成する場合の候補番号（0始まり、単一候補の場合はNone）
+            """
+            temperature = 0.2
+            if candidate is not None:
+                # 候補ごとのタスク内で設定するため、他の候補の呼び出しには影響しない
+                set_llm_tags(candidate=candidate + 1)
+                # 1候補目は従来どおりのtemperature（レスポンスキャッシュも共通）、2候補目以降は多様性のため上げる
+                temperature = min(1.0, 0.2 + _CANDIDATE_TEMPERATURE_STEP * candidate)
+
+            # develop_page実行（ストリーミング時は各ファイルが閉じた時点で書き込む）
+            page_result = await adevelop_page(
+                overall_design, page, sitemap, globals_css_content, project_name,
+                on_artifact=on_artifact, temperature=temperature, layout_code=layout_code, model=model
+            )
+
+            if not isinstance(page_result, dict) or not page_result.get("page") or not page_result.get("module_css"):
+                return None
+            return await review_page_result(overall_design, page, sitemap, globals_css_content, page_result)
+
+        async def review_page_result(overall_design, page, sitemap, globals_css_content, page_result):
+            """生成（または差分修正）したページをレビューし、review付きのpage_resultを返す"""
+            page_name = page.get('name', 'unknown')
+            # レビュー実行（develop_page側でレビュー済み・静的チェックで不合格の場合はその結果を使い、二重レビューしない）
+            review_result = page_result.get("review")
+            if review_result is None:
+                review_page = review_batcher.review if review_batcher is not None else areview_develop_page
+                review_result = await review_page(
+                    page_result["page"]["code"],
+                    page_result["module_css"]["code"],
+                    page_result.get("review_context") or {
+                        'overall_design': overall_design,
+                        'page_spec': page,
+                        'sitemap': sitemap,
+                        'globals_css': globals_css_content,
+                        'is_home_page': page_result.get('is_home_page', False)  # 🚨 CRITICAL FIX: is_home_page情報を正しく渡す
+                    }
+                )
+
+            # review_resultが辞書でない場合の対応
+            if not isinstance(review_result, dict):
+                logger.error(f"[StepGeneration] Invalid review_result type for {page_name}")
+                # デフォルト値で対応
+                review_result = {"score": 0, "feedback": f"Review failed - invalid result type: {review_result}", "passed": False}
+            page_result["review"] = review_result
+            return page_result
+
+        async def generate_best_page_candidate(overall_design, page, sitemap, globals_css_content, project_name, layout_code, model, candidates):
+            """
+            ページ候補をcandidates個並列に生成・レビューし、80点以上で最高スコアの候補を返す。
+            合格候補が出た時点で未完了の候補はキャンセルする（API呼び出しは共有レートリミッターを通る）。
+            合格候補がない場合は最高スコアの不合格候補、全候補の生成に失敗した場合はNoneを返す。
+            """
+            page_name = page.get('name', 'unknown')
+            candidate_tasks = [
+                asyncio.create_task(generate_page_candidate(overall_design, page, sitemap, globals_css_content, project_name, layout_code, model, candidate=i))
+                for i in range(candidates)
+            ]
+            results = []
+            pending = set(candidate_tasks)
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        try:
+                            candidate_result = task.result()
+                        except ProviderUnavailableError:
+                            raise
+                        except Exception as e:
+                            logger.warning(f"[StepGeneration] Page '{page_name}' candidate failed: {e}")
+                            continue
+                        if candidate_result is not None:
+                            results.append(candidate_result)
+                    if any(r["review"].get('score', 0) >= 80 for r in results):
+                        break
+            finally:
+                for remaining_task in pending:
+                    remaining_task.cancel()
+                if pending:
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    logger.info(f"[StepGeneration] Page '{page_name}' cancelled {len(pending)} remaining candidate(s)")
+
+            if not results:
+                return None
+            best = max(results, key=lambda r: r["review"].get('score', 0))
+            scores = [r["review"].get('score', 0) for r in results]
+            logger.info(f"[StepGeneration] Page '{page_name}' candidates reviewed: scores={scores}, selected={best['review'].get('score', 0)}")
+            # 選ばれなかった不合格候補はキャッシュから除外する（最高スコアの候補は呼び出し側で判定する）
+            for candidate_result in results:
+                if candidate_result is not best and candidate_result["review"].get('score', 0) < 80:
+                    invalidate_response(candidate_result.get('cache_key'))
+            return best
+
+        async def develop_page_with_quality_control(overall_design, page, sitemap, globals_css_content, project_name, layout_code):
             """品質重視フロー：develop_page -> review -> retry(最大3回) -> 品質確保後にファイル書き込み"""
             max_attempts = Config.MAX_ATTEMPTS
+            candidates = max(1, Config.PAGE_CANDIDATES)
             page_name = page.get('name', 'unknown')
             slug = page.get('slug', '')
+            # 直前の不合格結果（PAGE_REVISION_MODE=patchの場合、リトライはこのコードへの差分修正から始める）
+            previous_result = None
+            # 試行ごとのモデル選択（簡単なページはflash、不合格後のリトライはproにエスカレーション）
+            router = get_model_router()
+            previous_decision = None
             
             for attempt in range(max_attempts):
+                decision = None
                 try:
+                    # ページごとのタスク内で設定するため、他ページの呼び出しには影響しない
+                    set_llm_tags(stage="page", page=slug, attempt=attempt + 1)
                     if attempt > 0:
                         logger.info(f"[StepGeneration] Page '{page_name}' retry {attempt + 1}/{max_attempts}")
+                    decision = router.route_page(page, sitemap, attempt + 1, previous_decision)
                     
-                    # develop_page実行
-                    page_result = develop_page(overall_design, page, sitemap, globals_css_content, project_name)
+                    page_result = None
+                    if previous_result is not None and Config.PAGE_REVISION_MODE == "patch":
+                        # 前回のコード + フィードバックから差分だけを生成して適用する（適用できなければ全文再生成）
+                        patched = await apatch_page(overall_design, page, sitemap, globals_css_content, previous_result, layout_code, model=decision.model)
+                        if patched is not None:
+                            page_result = await review_page_result(overall_design, page, sitemap, globals_css_content, patched)
+                    if page_result is None and candidates > 1:
+                        # 複数候補を並列生成（候補同士が同じファイルに書き込まないよう、書き込みは承認時のみ）
+                        page_result = await generate_best_page_candidate(overall_design, page, sitemap, globals_css_content, project_name, layout_code, decision.model, candidates)
+                    elif page_result is None:
+                        page_result = await generate_page_candidate(
+                            overall_design, page, sitemap, globals_css_content, project_name, layout_code, decision.model,
+                            on_artifact=_artifact_writer(_page_file_paths(project_name, page, _is_home_page(page)), page_name)
+                        )
                     
-                    if not isinstance(page_result, dict) or not page_result.get("page") or not page_result.get("module_css"):
+                    if page_result is None:
+                        record_attempt(f"page_{page_name}", attempt + 1, False)
+                        router.record_outcome(decision, False)
+                        previous_decision = decision
                         if attempt == max_attempts - 1:  # 最後の試行
                             raise QualityControlException(
                                 f"develop_page failed for {page_name} after {max_attempts} attempts", 
@@ -226,51 +469,22 @@ class StepGenerationAgent:
                             )
                         continue
 
-                    # レビュー実行
-                    review_result = review_develop_page(
-                        page_result["page"]["code"],
-                        page_result["module_css"]["code"],
-                        {
-                            'overall_design': overall_design,
-                            'page_spec': page,
-                            'sitemap': sitemap,
-                            'globals_css': globals_css_content,
-                            'is_home_page': page_result.get('is_home_page', False)  # 🚨 CRITICAL FIX: is_home_page情報を正しく渡す
-                        }
-                    )
-                
-                    # review_resultが辞書でない場合の対応
-                    if not isinstance(review_result, dict):
-                        logger.error(f"[StepGeneration] Invalid review_result type for {page_name}")
-                        # デフォルト値で対応
-                        review_result = {"score": 0, "feedback": f"Review failed - invalid result type: {review_result}", "passed": False}
-                    
+                    review_result = page_result["review"]
                     review_score = review_result.get('score', 0)
                     
                     # スコア判定
                     if review_score >= 80:
                         # 品質基準クリア - ファイル書き込みが必要かチェック
                         logger.info(f"[StepGeneration] Page '{page_name}' approved (score: {review_score})")
+                        record_attempt(f"page_{page_name}", attempt + 1, True, review_score)
+                        router.record_outcome(decision, True, review_score)
                         
                         # develop_page内でファイル書き込みが失敗した可能性があるため、ここで確実に書き込む
                         if page_result.get("page") and page_result.get("module_css"):
                             try:
-                                # プロジェクトルートからの絶対パスを構築
-                                project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                                output_dir_path = os.path.join(project_root, Config.OUTPUT_DIR)
-                                project_path = os.path.join(output_dir_path, project_name, "app")
-                                is_home_page = page_result.get('is_home_page', False)
-                                
-                                if is_home_page:
-                                    # homeページはルートに配置
-                                    page_path = os.path.join(project_path, "page.tsx")
-                                    css_path = os.path.join(project_path, "home.module.css")
-                                else:
-                                    # 他のページは slug ディレクトリに配置
-                                    slug = page.get('slug', '')
-                                    page_dir = os.path.join(project_path, slug)
-                                    page_path = os.path.join(page_dir, "page.tsx")
-                                    css_path = os.path.join(page_dir, f"{slug}.module.css")
+                                page_paths = _page_file_paths(project_name, page, page_result.get('is_home_page', False))
+                                page_path = page_paths["page"]
+                                css_path = page_paths["module_css"]
                                 
                                 # ファイル書き込み実行
                                 write_file(page_path, page_result["page"]["code"])
@@ -283,7 +497,12 @@ class StepGenerationAgent:
                         
                         return page_result
                     else:
-                        # 品質基準未達 -> リトライまたはエラー
+                        # 品質基準未達 -> リトライまたはエラー（不合格の生成結果はキャッシュから除外）
+                        record_attempt(f"page_{page_name}", attempt + 1, False, review_score)
+                        router.record_outcome(decision, False, review_score)
+                        previous_decision = decision
+                        invalidate_response(page_result.get('cache_key'))
+                        previous_result = page_result
                         if attempt == max_attempts - 1:  # 最後の試行
                             logger.error(f"[StepGeneration] Quality check failed after {max_attempts} attempts for {page_name}")
                             raise QualityControlException(
@@ -296,11 +515,14 @@ class StepGenerationAgent:
                             page["review_feedback"] = review_result.get('feedback', 'Quality standards not met. Please improve the code.')
                             continue
                     
-                except QualityControlException:
-                    # QualityControlExceptionは再発生
+                except (QualityControlException, ProviderUnavailableError):
+                    # QualityControlException・ProviderUnavailableError（プロバイダ障害中）は再発生
                     raise
                 except Exception as e:
                     logger.error(f"[StepGeneration] Exception for {page_name}: {e}")
+                    if decision is not None:
+                        router.record_outcome(decision, False)
+                        previous_decision = decision
                     if attempt == max_attempts - 1:  # 最後の試行
                         raise QualityControlException(
                             f"Exception occurred for {page_name} after {max_attempts} attempts: {str(e)}",
@@ -316,13 +538,105 @@ class StepGenerationAgent:
                 attempts=max_attempts
             )
 
+        # 4. 全ページ（homeページ含む）品質重視フローを並列実行（1つ失敗で即座に停止）
+        async def develop_all_pages(layout_code, globals_css, speculation=None, progress=None):
+            """
+            全ページを並列に生成し、(ページ生成結果のリスト, required_libs) を返す。
+            speculation: layoutレビュー中の先行生成の場合、その前提のlayout試行番号
+            progress: 完了したページ名を追記するリスト（先行生成の進捗集計用）
+            """
+            if speculation is not None:
+                # このタスク内の呼び出しだけに付く（破棄時に無駄になった呼び出しとして集計する）
+                set_llm_tags(speculation=speculation)
+            # リトライ時に書き込まれるreview_feedbackを、破棄されうる先行生成と共有しないようコピーする
+            run_pages = [dict(page) for page in pages]
+            page_steps = []
+            page_libs = set()
+            completed_pages = progress if progress is not None else []
+            
+            # 同時に処理するページ数をセマフォで制限（API呼び出しの間隔は共有レートリミッターが調整する）
+            semaphore = asyncio.Semaphore(max(1, min(Config.MAX_CONCURRENCY, len(run_pages))))
+
+            async def run_page(index, page):
+                async with semaphore:
+                    return await develop_page_with_quality_control(overall_design, page, sitemap, globals_css, project_name, layout_code)
+
+            # すべてのページをタスクとして投入（task -> page_name のマッピング）
+            tasks = {}
+            for i, page in enumerate(run_pages):
+                task = asyncio.create_task(run_page(i, page))
+                tasks[task] = page.get('name', 'unknown')
+
+            # 完了順に処理し、エラーが発生したら残りのタスクをキャンセルして即座に停止
+            pending = set(tasks)
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        page_name = tasks[task]
+                        try:
+                            page_result = task.result()
+                        except QualityControlException as qce:
+                            # ページ生成で品質制御に失敗した場合 - 即座にワークフロー停止
+                            logger.error(f"[StepGeneration] Page '{page_name}' failed quality control")
+                            raise CriticalWorkflowError(
+                                f"Page generation failed: {page_name} failed quality control after {Config.MAX_ATTEMPTS} attempts. Error: {str(qce)}", 
+                                failed_component=f"page_{page_name}"
+                            )
+                        except ProviderUnavailableError:
+                            # プロバイダ障害 - 品質の問題ではないためそのまま送出してワークフロー停止
+                            logger.error(f"[StepGeneration] Page '{page_name}' stopped: Gemini provider unavailable")
+                            raise
+                        except Exception as e:
+                            # その他の予期しないエラー - 即座にワークフロー停止
+                            logger.error(f"[StepGeneration] Page '{page_name}' encountered unexpected error: {str(e)}")
+                            raise CriticalWorkflowError(
+                                f"Page generation unexpected error: {page_name} failed with exception: {str(e)}", 
+                                failed_component=f"page_{page_name}"
+                            )
+                        page_steps.append(page_result)
+                        page_libs.update(_required_libs(page_result, ("page", "module_css")))
+                        completed_pages.append(page_name)
+            finally:
+                # 失敗時（または外部からのキャンセル時）は残りのタスクをキャンセルし、終了を待つ
+                for remaining_task in pending:
+                    remaining_task.cancel()
+                if pending:
+                    await asyncio.gather(*pending, return_exceptions=True)
+            return page_steps, page_libs
+
+        def start_speculative_pages(layout_result, layout_attempt):
+            """レビュー待ちのlayout候補を前提にページ生成を先行開始する（LAYOUT_SPECULATIVE_PAGES無効時はNone）"""
+            if not Config.LAYOUT_SPECULATIVE_PAGES or not pages:
+                return None
+            logger.info(f"[StepGeneration] Starting {len(pages)} pages speculatively during layout review (attempt {layout_attempt})")
+            progress = []
+            task = asyncio.create_task(develop_all_pages(
+                layout_result['layout']['code'], layout_result['globals_css']['code'],
+                speculation=layout_attempt, progress=progress
+            ))
+            return {"task": task, "layout_attempt": layout_attempt, "started": time.perf_counter(), "progress": progress}
+
+        async def discard_speculative_pages(speculation):
+            """layoutが不合格（またはレビュー失敗）の場合に先行生成を破棄し、無駄になった作業量を記録する"""
+            if speculation is None:
+                return
+            speculation["task"].cancel()
+            await asyncio.gather(speculation["task"], return_exceptions=True)
+            elapsed = time.perf_counter() - speculation["started"]
+            completed = len(speculation["progress"])
+            record_speculation(speculation["layout_attempt"], False, elapsed, completed, len(pages))
+            logger.info(f"[StepGeneration] Discarded speculative pages for layout attempt {speculation['layout_attempt']} ({elapsed:.1f}s, {completed}/{len(pages)} pages done)")
+
         try:
             # 段階的品質重視フロー実行
             logger.info("[StepGeneration] Starting generation")
             
-            # 1. Layout品質重視フロー実行
-            layout_result = generate_layout_with_quality_control()
+            # 1. Layout品質重視フロー実行（有効時はレビュー中にページ生成を先行開始する）
+            with workflow_stage("layout"):
+                layout_result = await generate_layout_with_quality_control()
             steps.append(layout_result)
+            all_required_libs.update(_required_libs(layout_result, ("layout", "globals_css")))
             
             # 2. TailwindCSS生成（品質チェック不要）
             tailwind_result = generate_tailwind_css(project_name)
@@ -330,66 +644,18 @@ class StepGenerationAgent:
             
             # 3. 各ページ（homeページ含む）品質重視フローを並列実行（1つ失敗で即座に停止）
             logger.info(f"[StepGeneration] Processing {len(pages)} pages")
+            if speculative_pages is not None:
+                # 承認されたlayoutで先行開始済みのページ生成の完了を待つ（計測は先行開始の時点から）
+                with workflow_stage("pages", started=speculative_pages["started"]):
+                    page_steps, page_libs = await speculative_pages["task"]
+            else:
+                with workflow_stage("pages"):
+                    page_steps, page_libs = await develop_all_pages(layout_result['layout']['code'], globals_css_content)
+            steps.extend(page_steps)
+            all_required_libs.update(page_libs)
             
-            # レート制限回避のため、並列度を制限
-            max_workers = min(Config.MAX_CONCURRENCY, len(pages))  # 最大3並列でGemini APIを叩く
-            
-            # 並列処理で一つでも失敗したら即座に停止する戦略
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = {}  # future -> page_name のマッピング
-                
-                # すべてのページをサブミット
-                for i, page in enumerate(pages):
-                    # ページ間でAPI呼び出しを少し分散（レート制限回避）
-                    if i > 0:
-                        time.sleep(random.uniform(0.5, 1.0))
-                    
-                    future = executor.submit(develop_page_with_quality_control, overall_design, page, sitemap, globals_css_content, project_name)
-                    futures[future] = page.get('name', 'unknown')
-                
-                # as_completedを使って完了順に処理し、エラーが発生したら即座に停止
-                completed_pages = []
-                for future in as_completed(futures):
-                    page_name = futures[future]
-                    try:
-                        page_result = future.result()
-                        steps.append(page_result)
-                        if isinstance(page_result, dict) and "required_libs" in page_result and page_result["required_libs"]:
-                            all_required_libs.update(page_result["required_libs"])
-                        completed_pages.append(page_name)
-                        
-                    except QualityControlException as qce:
-                        # ページ生成で品質制御に失敗した場合 - 即座にワークフロー停止
-                        logger.error(f"[StepGeneration] Page '{page_name}' failed quality control")
-                        
-                        # 残りのタスクをキャンセル
-                        for remaining_future in futures:
-                            if remaining_future != future and not remaining_future.done():
-                                remaining_future.cancel()
-                        
-                        # 即座にCriticalWorkflowErrorを発生
-                        raise CriticalWorkflowError(
-                            f"Page generation failed: {page_name} failed quality control after {Config.MAX_ATTEMPTS} attempts. Error: {str(qce)}", 
-                            failed_component=f"page_{page_name}"
-                        )
-                        
-                    except Exception as e:
-                        # その他の予期しないエラー - 即座にワークフロー停止
-                        logger.error(f"[StepGeneration] Page '{page_name}' encountered unexpected error: {str(e)}")
-                        
-                        # 残りのタスクをキャンセル
-                        for remaining_future in futures:
-                            if remaining_future != future and not remaining_future.done():
-                                remaining_future.cancel()
-                        
-                        # 即座にCriticalWorkflowErrorを発生
-                        raise CriticalWorkflowError(
-                            f"Page generation unexpected error: {page_name} failed with exception: {str(e)}", 
-                            failed_component=f"page_{page_name}"
-                        )
-                
-                # 全てのページが正常完了した場合
-                logger.info(f"[StepGeneration] All pages completed successfully")
+            # 全てのページが正常完了した場合
+            logger.info(f"[StepGeneration] All pages completed successfully")
 
         except QualityControlException as qce:
             # Index PageまたはLayoutの品質制御失敗 -> CriticalWorkflowErrorに変換
@@ -402,12 +668,24 @@ class StepGenerationAgent:
             # CriticalWorkflowErrorは再発生してワークフロー全体を停止
             logger.error(f"[StepGeneration] Critical workflow error")
             raise
+        except ProviderUnavailableError as pue:
+            # サーキットブレーカーが開いている - リトライせずに即座に停止
+            logger.error(f"[StepGeneration] Gemini provider unavailable: {pue}")
+            raise
         except Exception as e:
             logger.error(f"[StepGeneration] Unexpected error: {type(e).__name__}")
             raise CriticalWorkflowError(
                 f"Unexpected critical error: {str(e)}", 
                 failed_component="workflow"
             )
+        finally:
+            # 先行生成したページの完了を待たずに終了する場合（Tailwind生成の失敗など）は停止させる
+            if speculative_pages is not None and not speculative_pages["task"].done():
+                speculative_pages["task"].cancel()
+                await asyncio.gather(speculative_pages["task"], return_exceptions=True)
+            if review_batcher is not None:
+                await review_batcher.aclose()
+                logger.info(f"[StepGeneration] Batched reviews: {review_batcher.pages_batched} pages in {review_batcher.batches_sent} requests")
         
         logger.info(f"[StepGeneration] Generation completed successfully")
         return steps, list(all_required_libs)
@@ -7,6 +7,34 @@ class Config:
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
     OUTPUT_DIR = os.getenv("OUTPUT_DIR", "static_site_output")
     LOG_FILE = os.getenv("LOG_FILE", "app.log")
+
+    # Next.jsプロジェクトの作成
+    # create-next-appのバージョン
+    CREATE_NEXT_APP_VERSION = os.getenv("CREATE_NEXT_APP_VERSION", "14.1.0")
+    # create-next-appで作成した雛形（node_modules込み）をバージョンごとに1回だけ作成してキャッシュし、新規プロジェクトはコピーで作成する
+    # 作成条件・チェックサムが一致しない場合は作り直し、雛形が使えない場合はcreate-next-appで作成する
+    NEXTJS_TEMPLATE_CACHE_ENABLED = os.getenv("NEXTJS_TEMPLATE_CACHE_ENABLED", "true").lower() == "true"
+    # 雛形の保存先（相対パスはプロジェクトルート基準）
+    NEXTJS_TEMPLATE_CACHE_DIR = os.getenv("NEXTJS_TEMPLATE_CACHE_DIR", ".nextjs_template_cache")
+    # コピー方式（"auto": reflink -> node_modulesのハードリンク -> 通常コピーの順に試す / "reflink" / "hardlink" / "copy"）
+    NEXTJS_TEMPLATE_COPY_MODE = os.getenv("NEXTJS_TEMPLATE_COPY_MODE", "auto").lower()
+    # 作成済みプロジェクトのプール（OUTPUT_DIR/.project_pool）に常に用意しておく数（0でプールを使わない）
+    # setup_nextjs_projectはプールから取り出して即座に返し、取り出した分はバックグラウンドで補充する
+    PROJECT_POOL_SIZE = int(os.getenv("PROJECT_POOL_SIZE", "2"))
+    # プールの補充で同時に作成するプロジェクト数
+    PROJECT_POOL_REFILL_CONCURRENCY = int(os.getenv("PROJECT_POOL_REFILL_CONCURRENCY", "1"))
+    # プールのディスク使用量の上限（MB、超える場合は補充しない。0で無制限）
+    PROJECT_POOL_MAX_DISK_MB = int(os.getenv("PROJECT_POOL_MAX_DISK_MB", "2048"))
+    # 生成したプロジェクトのnode_modulesを内容アドレスのストアに1つだけ保存し、各プロジェクトからハードリンクで共有する
+    # 有効な場合、雛形のnode_modulesはreflinkではなくストアへのハードリンクでコピーする（NEXTJS_TEMPLATE_COPY_MODE=autoのとき）
+    PACKAGE_STORE_ENABLED = os.getenv("PACKAGE_STORE_ENABLED", "true").lower() == "true"
+    # ストアの保存先（相対パスはプロジェクトルート基準。OUTPUT_DIRと同じファイルシステム上に置く）
+    PACKAGE_STORE_DIR = os.getenv("PACKAGE_STORE_DIR", ".package_store")
+    # Node.jsツールチェーン（プロセス内で1回だけ解決し、create-next-app・npm install・npm run dev/buildに同じものを使う）
+    # node / npm / npxのあるディレクトリ（指定した場合はnvm・PATHより優先）
+    NODE_BIN_DIR = os.getenv("NODE_BIN_DIR", "")
+    # nvmで使うバージョン（インストール済みでなければ最初の1回だけnvm installする。空の場合はnvmを使わずPATHのnodeを使う）
+    NODE_VERSION = os.getenv("NODE_VERSION", "lts/*")
     
     # AWS Configuration
     AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
@@ -25,6 +53,120 @@ class Config:
     # ページ生成処理の最大試行回数
     MAX_ATTEMPTS = int(os.getenv("MAX_ATTEMPTS", "3"))
 
+    # ページレビューを実行するステージ（"step_generation" または "develop_page"）
+    # どちらか一方だけがレビューするため、1候補につきレビューは1回
+    PAGE_REVIEW_OWNER = os.getenv("PAGE_REVIEW_OWNER", "step_generation")
+
+    # LLMレビュー前の静的チェック（metadata export・CSS import・header重複・外部リソース・'use client'・サイトマップ外リンク等）
+    # 機械的に直せる問題は自動修正し、直せない問題はLLMレビューを呼ばずに不合格として修正用プロンプトに指摘を渡す
+    STATIC_REVIEW_ENABLED = os.getenv("STATIC_REVIEW_ENABLED", "true").lower() == "true"
+
+    # 複数ページのレビューを1回のLLM呼び出しにまとめる（PAGE_REVIEW_OWNER=step_generationの場合に適用）
+    # 完成したページをREVIEW_BATCH_WINDOW_SECONDS秒集め、共通コンテキスト（デザイン・サイトマップ・globals.css）は1回だけ送る
+    # 1バッチの推定トークン数がREVIEW_BATCH_MAX_TOKENS、ページ数がREVIEW_BATCH_MAX_PAGESに達したらその時点で送信する
+    REVIEW_BATCH_ENABLED = os.getenv("REVIEW_BATCH_ENABLED", "false").lower() == "true"
+    REVIEW_BATCH_MAX_TOKENS = int(os.getenv("REVIEW_BATCH_MAX_TOKENS", "60000"))
+    REVIEW_BATCH_MAX_PAGES = int(os.getenv("REVIEW_BATCH_MAX_PAGES", "4"))
+    REVIEW_BATCH_WINDOW_SECONDS = float(os.getenv("REVIEW_BATCH_WINDOW_SECONDS", "3"))
+
+    # 1ページあたり並列に生成・レビューする候補数（1で無効）
+    # 80点以上で最高スコアの候補を採用し、合格候補が出た時点で残りはキャンセルする（APIクォータと引き換えにリトライ待ちを減らす）
+    PAGE_CANDIDATES = int(os.getenv("PAGE_CANDIDATES", "1"))
+
+    # layoutのレビュー中に、レビュー待ちのlayout候補を前提としてページ生成を先行開始する
+    # layoutが不合格の場合は先行生成を破棄して再開する（破棄された作業量はllm_metricsのspeculationに記録）
+    LAYOUT_SPECULATIVE_PAGES = os.getenv("LAYOUT_SPECULATIVE_PAGES", "true").lower() == "true"
+
+    # ページのレビュー不合格時の修正方法
+    # "patch": 前回のコードとフィードバックからsearch/replaceブロックだけを生成して適用する（適用できなければ全文再生成）
+    # "full": 毎回page.tsx / module.cssを全文再生成する
+    PAGE_REVISION_MODE = os.getenv("PAGE_REVISION_MODE", "patch").lower()
+
+    # ページ生成のモデル選択
+    # "adaptive": 複雑さのスコア（contentsの量・重いコンテンツ・サイトマップのページ数）が閾値以下のページはgemini-2.5-flashで生成し、
+    #             レビュー不合格後のリトライはgemini-2.5-proにエスカレーションする / "pro": 常にgemini-2.5-pro
+    MODEL_ROUTING = os.getenv("MODEL_ROUTING", "adaptive").lower()
+    MODEL_ROUTER_FLASH_MAX_COMPLEXITY = float(os.getenv("MODEL_ROUTER_FLASH_MAX_COMPLEXITY", "6"))
+    # 同じ複雑さの区分でflashの過去の合格率がこれを下回る場合はproを使う（試行数がMIN_SAMPLES未満の間は判定しない）
+    MODEL_ROUTER_MIN_PASS_RATE = float(os.getenv("MODEL_ROUTER_MIN_PASS_RATE", "0.6"))
+    MODEL_ROUTER_MIN_SAMPLES = int(os.getenv("MODEL_ROUTER_MIN_SAMPLES", "5"))
+    # 判断と結果（スコア・所要時間）を追記するJSON Linesファイル（相対パスはlogディレクトリ基準、空文字で無効）
+    MODEL_ROUTER_LOG_FILE = os.getenv("MODEL_ROUTER_LOG_FILE", "model_routing.jsonl")
+
+    # LLMレスポンスのディスクキャッシュ設定
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    # trueの場合はキャッシュを読まずに再生成する（結果は書き込まれる）
+    LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "false").lower() == "true"
+    LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+    LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", "200")) * 1024 * 1024
+    LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600
+
+    # Gemini APIのレート制限（全エージェント共通のトークンバケット、0は無制限）
+    LLM_DEFAULT_RPM = float(os.getenv("LLM_DEFAULT_RPM", "60"))
+    LLM_DEFAULT_TPM = float(os.getenv("LLM_DEFAULT_TPM", "1000000"))
+    # モデル別の上限（"model=rpm:tpm" をカンマ区切り）
+    LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "gemini-2.5-pro=150:2000000,gemini-2.5-flash=1000:1000000")
+    # バースト上限（何秒分のクォータまで一度に送出するか）
+    LLM_RATE_LIMIT_BURST_SECONDS = float(os.getenv("LLM_RATE_LIMIT_BURST_SECONDS", "10"))
+    # 429受信時のリトライ回数と、リトライヒントがない場合の指数バックオフ（秒）
+    LLM_RATE_LIMIT_MAX_RETRIES = int(os.getenv("LLM_RATE_LIMIT_MAX_RETRIES", "4"))
+    LLM_RATE_LIMIT_BACKOFF_BASE = float(os.getenv("LLM_RATE_LIMIT_BACKOFF_BASE", "2"))
+    LLM_RATE_LIMIT_BACKOFF_MAX = float(os.getenv("LLM_RATE_LIMIT_BACKOFF_MAX", "60"))
+
+    # モデル別のサーキットブレーカー（全エージェント共通）
+    # タイムアウト・5xx・接続エラーがこの回数連続したら、RESET_SECONDSの間は呼び出しを即座に拒否してワークフローを
+    # error_type="provider_unavailable"で終了する。経過後は1回だけ試験的に呼び出す（0で無効、429は数えない）
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "3"))
+    CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "60"))
+
+    # layout / ページ生成をストリーミングで受信し、ファイルのJSONが閉じた時点で書き込む
+    LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"
+    # JSONオブジェクト外のテキストがこの文字数を超えたら生成を打ち切る
+    LLM_STREAM_ABORT_CHARS = int(os.getenv("LLM_STREAM_ABORT_CHARS", "4000"))
+
+    # スキーマ制約付き出力（with_structured_output）でレスポンスをpydanticモデルとして直接検証する
+    # レビュー・要件分析に適用し、layout / ページ生成はLLM_STREAMINGが無効な場合に適用する
+    LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "true").lower() == "true"
+
+    # ページ生成・修正・レビュープロンプトの共通プレフィックス（デザイン・layout・globals.css・サイトマップ）のコンテキストキャッシュ
+    # "gemini": Geminiのcached_contentとして1回だけ送信し、以降はページ固有部分のみ送る
+    # "local": 送信内容は変えずにプレフィックスの再利用状況だけを記録する（テスト用） / "off": 無効
+    LLM_CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE", "gemini").lower()
+    LLM_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("LLM_CONTEXT_CACHE_TTL_SECONDS", "900"))
+    # これより小さいプレフィックスはキャッシュしない（Geminiのキャッシュ最小トークン数未満は作成できない）
+    LLM_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("LLM_CONTEXT_CACHE_MIN_TOKENS", "2048"))
+
+    # LLM呼び出しのテレメトリ（ステージ・ページ・モデル・試行ごとのレイテンシ・トークン数・リトライ）
+    # 実行ごとの集計と呼び出し記録を追記するJSON Linesファイル（相対パスはlogディレクトリ基準、空文字で無効）
+    LLM_METRICS_FILE = os.getenv("LLM_METRICS_FILE", "llm_metrics.jsonl")
+    # コスト概算用の単価（"model=入力:出力" をカンマ区切り、100万トークンあたりのUSD）
+    LLM_PRICING = os.getenv("LLM_PRICING", "gemini-2.5-pro=1.25:10,gemini-2.5-flash=0.30:2.50,gemini-2.5-pro-preview-06-05=1.25:10")
+
+    # 応答が遅いLLM呼び出しの複製リクエスト（ヘッジ、非同期の生成・レビュー呼び出しが対象）
+    # 同じモデル・ステージの直近LLM_HEDGE_WINDOW件のレイテンシ（ストリーミングは最初のチャンクまでの時間）の
+    # LLM_HEDGE_PERCENTILEパーセンタイルを過ぎても応答がなければ同じリクエストをもう1つ送り、先に返った方を使う
+    # 複製リクエストもレートリミッターを通る。勝敗はllm_metricsのhedgingに記録
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "50"))
+    # これより少ないサンプル数では複製リクエストを送らない
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "10"))
+    LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "5"))
+    # 対象のステージ（カンマ区切り）
+    LLM_HEDGE_STAGES = os.getenv("LLM_HEDGE_STAGES", "layout,page,page_patch,review")
+
+    # LLMバックエンド（"gemini": 実際のGemini API / "record": Geminiを呼び出して応答を記録 / "replay": 記録済みの応答を返すオフライン実行）
+    # replay / recordはプロンプト全体のハッシュで応答を照合するため、コンテキストキャッシュはlocal扱いになる
+    LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+    # 記録ファイル（JSON Lines、相対パスはプロジェクトルート基準）
+    LLM_FAKE_RECORDINGS = os.getenv("LLM_FAKE_RECORDINGS", ".llm_recordings/recordings.jsonl")
+    # replay時に注入するレイテンシの分布（秒）: "0" / "1.5"（固定） / "uniform:最小:最大" / "lognormal:中央値:sigma"
+    LLM_FAKE_LATENCY = os.getenv("LLM_FAKE_LATENCY", "0")
+    # replay時に429（RESOURCE_EXHAUSTED）を返す確率
+    LLM_FAKE_RATE_LIMIT_RATE = float(os.getenv("LLM_FAKE_RATE_LIMIT_RATE", "0"))
+    # レイテンシ・429の乱数シード（同じ呼び出し順なら同じ結果を再現する）
+    LLM_FAKE_SEED = int(os.getenv("LLM_FAKE_SEED", "0"))
+
     # S3 Bucket Policy Template (セキュアなパブリック読み取り専用)
     @staticmethod
     def get_s3_bucket_policy(bucket_name: str) -> dict:
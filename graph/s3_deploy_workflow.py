@@ -2,6 +2,7 @@ import os
 from typing import Optional
 from agents.build_agent import BuildAgent
 from agents.s3_deploy_agent import S3DeployAgent
+from agents.llm_telemetry import workflow_stage
 from logger import Logger
 from config import Config
 
@@ -27,16 +28,20 @@ def run_s3_deploy_workflow(project_id: str, bucket_name: Optional[str] = None) -
         logger.info("[S3DeployWorkflow] Step 1: Building project")
         build_agent = BuildAgent()
         
-        # 静的エクスポート用の設定を準備
-        prepare_result = build_agent.prepare_for_static_export(project_id)
-        if prepare_result["status"] == "error":
-            logger.error(f"[S3DeployWorkflow] Failed to prepare static export: {prepare_result['error']}")
-            return prepare_result
-        
-        logger.info("[S3DeployWorkflow] Static export configuration prepared")
-        
-        # プロジェクトをビルド
-        build_result = build_agent.build_project(project_id)
+        with workflow_stage("build") as stage:
+            # 静的エクスポート用の設定を準備
+            prepare_result = build_agent.prepare_for_static_export(project_id)
+            if prepare_result["status"] == "error":
+                stage["status"] = "error"
+                logger.error(f"[S3DeployWorkflow] Failed to prepare static export: {prepare_result['error']}")
+                return prepare_result
+            
+            logger.info("[S3DeployWorkflow] Static export configuration prepared")
+            
+            # プロジェクトをビルド
+            build_result = build_agent.build_project(project_id)
+            if build_result["status"] == "error":
+                stage["status"] = "error"
         if build_result["status"] == "error":
             logger.error(f"[S3DeployWorkflow] Build failed: {build_result['error']}")
             return build_result
@@ -58,13 +63,16 @@ def run_s3_deploy_workflow(project_id: str, bucket_name: Optional[str] = None) -
         
         # Step 2: S3デプロイエージェントでS3にデプロイ
         logger.info("[S3DeployWorkflow] Step 2: Deploying to S3")
-        s3_agent = S3DeployAgent()
-        
-        deploy_result = s3_agent.deploy_website(
-            project_id=project_id,
-            source_path=static_output_path,
-            bucket_name=bucket_name
-        )
+        with workflow_stage("upload") as stage:
+            s3_agent = S3DeployAgent()
+            
+            deploy_result = s3_agent.deploy_website(
+                project_id=project_id,
+                source_path=static_output_path,
+                bucket_name=bucket_name
+            )
+            if deploy_result["status"] == "error":
+                stage["status"] = "error"
         
         if deploy_result["status"] == "error":
             logger.error(f"[S3DeployWorkflow] S3 deployment failed: {deploy_result['error']}")
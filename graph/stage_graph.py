@@ -0,0 +1,133 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from logger import Logger
+logger = Logger(log_level="INFO")
+
+
+class StageFailed(Exception):
+    """ステージが失敗し、ワークフローをresult（エラー結果のdict）で終了する場合に送出する"""
+
+    def __init__(self, result: Dict):
+        super().__init__(result.get("error", "stage failed"))
+        self.result = result
+
+
+class StageGraph:
+    """
+    ワークフローのステージを依存関係（inputs）付きのノードとして登録し、依存先が終わったものから並行に実行する。
+    - 各ノードは依存先のノード名 -> 戻り値のdictを受け取り、戻り値が後続のノードに渡される
+    - ノードは呼び出し元のcontextvars（テレメトリなど）を引き継いだスレッドで実行する
+      （inline=Trueのノードは呼び出し元のスレッドで実行する。signalの登録などメインスレッドが必要な処理用）
+    - いずれかのノードが例外を送出した場合は、未開始のノードを実行せず、実行中のノードの完了を待ってからその例外を呼び出し元に送出する
+      （完了したノードの戻り値はresultsに残るので、呼び出し元で後片付けに使える）
+    - report()で各ノードの開始・所要時間とクリティカルパスを返す
+    """
+
+    def __init__(self, name: str = "workflow"):
+        self.name = name
+        self._nodes: Dict[str, tuple] = {}
+        self._timings: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._started: Optional[float] = None
+        # 完了したノード名 -> 戻り値（失敗した場合も、それまでに完了したノードの分が残る）
+        self.results: Dict[str, Any] = {}
+
+    def add(self, name: str, func: Callable[[Dict[str, Any]], Any], inputs: Iterable[str] = (), inline: bool = False) -> None:
+        """ノードを登録する（依存先は先に登録しておくこと。登録順で循環しないことを保証する）"""
+        inputs = tuple(inputs)
+        unknown = [dependency for dependency in inputs if dependency not in self._nodes]
+        if name in self._nodes or unknown:
+            raise ValueError(f"Invalid stage {name!r}: duplicate name or unknown inputs {unknown}")
+        self._nodes[name] = (func, inputs, inline)
+
+    def _run_node(self, name: str, func: Callable, inputs: Dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return func(inputs)
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            with self._lock:
+                self._timings[name] = {"start": started, "end": time.perf_counter(), "status": status}
+
+    def run(self, max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """全ノードを実行し、ノード名 -> 戻り値のdictを返す"""
+        results = self.results = {}
+        pending = dict(self._nodes)
+        running = {}
+        self._started = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=max_workers or max(1, len(self._nodes)), thread_name_prefix="stage-graph")
+        try:
+            while pending or running:
+                ready = [name for name, (_, inputs, _) in pending.items() if all(dependency in results for dependency in inputs)]
+                # 呼び出し元のスレッドで実行するノードは、他のノードを開始してから実行する
+                ready.sort(key=lambda name: pending[name][2])
+                for name in ready:
+                    func, inputs, inline = pending.pop(name)
+                    node_inputs = {dependency: results[dependency] for dependency in inputs}
+                    if inline:
+                        results[name] = self._run_node(name, func, node_inputs)
+                        continue
+                    ctx = contextvars.copy_context()
+                    running[executor.submit(ctx.run, self._run_node, name, func, node_inputs)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    # 例外はここで送出される
+                    results[running.pop(future)] = future.result()
+        finally:
+            # 失敗した場合も実行中のノードは最後まで実行させ、所要時間と戻り値を記録する
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future, name in running.items():
+                if not future.cancelled() and future.exception() is None:
+                    results[name] = future.result()
+            path = self.critical_path()
+            failed = [name for name, timing in self._timings.items() if timing["status"] == "error"]
+            status = f" (failed: {', '.join(failed)})" if failed else ""
+            logger.info(f"[StageGraph] {self.name} critical path{status}: " +
+                        " > ".join(f"{name} ({self._timings[name]['end'] - self._timings[name]['start']:.1f}s)" for name in path))
+        return results
+
+    def critical_path(self) -> List[str]:
+        """最後に終わったノードから、最後に終わった依存先を順にたどった経路（実行順）"""
+        with self._lock:
+            timings = dict(self._timings)
+        if not timings:
+            return []
+        current = max(timings, key=lambda name: timings[name]["end"])
+        path = [current]
+        while True:
+            dependencies = [dependency for dependency in self._nodes[current][1] if dependency in timings]
+            if not dependencies:
+                break
+            current = max(dependencies, key=lambda name: timings[name]["end"])
+            path.append(current)
+        return list(reversed(path))
+
+    def report(self) -> Dict:
+        """各ノードの開始（run開始からの秒数）・所要時間・状態と、クリティカルパス"""
+        with self._lock:
+            timings = dict(self._timings)
+        origin = self._started or 0.0
+        stages = {
+            name: {
+                "inputs": list(self._nodes[name][1]),
+                "start_offset_seconds": round(timing["start"] - origin, 3),
+                "seconds": round(timing["end"] - timing["start"], 3),
+                "status": timing["status"],
+            }
+            for name, timing in sorted(timings.items(), key=lambda item: item[1]["start"])
+        }
+        path = self.critical_path()
+        return {
+            "stages": stages,
+            "critical_path": path,
+            "critical_path_seconds": round(sum(stages[name]["seconds"] for name in path), 3),
+            "wall_seconds": round(max(timing["end"] for timing in timings.values()) - origin, 3) if timings else 0.0,
+        }
@@ -5,44 +5,90 @@ import os
 from config import Config
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
 from tools.setup_nextjs_project import setup_nextjs_project
+from tools.package_store import link_project_packages
+from tools.node_toolchain import get_node_toolchain
+from graph.stage_graph import StageFailed, StageGraph
 
 def run_workflow(user_instruction: str) -> dict:
-    from agents.instruction_analysis import InstructionAnalysisAgent
-    from agents.step_generation import StepGenerationAgent, CriticalWorkflowError
-    from agents.execution import ExecutionAgent
+    """
+    ワークフローを実行し、LLM呼び出しのテレメトリ（ステージ別のレイテンシ・トークン数・リトライ・試行回数）を
+    結果のllm_metricsに付けて返す。呼び出しごとの記録はメトリクスファイルにも追記する。
+    終了時（失敗時を含む）には作成したコンテキストキャッシュを破棄する。
+    Gemini障害でサーキットブレーカーが開いた場合は、どのステージでもリトライせずにerror_type="provider_unavailable"を返す。
+    """
+    from agents.llm_telemetry import telemetry_run
+    from agents.circuit_breaker import ProviderUnavailableError, get_circuit_breakers
     from logger import Logger
     logger = Logger(log_level="INFO")
 
-    logger.info("[Workflow] Start workflow")
-    # 1. 指示解析
-    analysis_agent = InstructionAnalysisAgent()
-    analysis_result = analysis_agent.analyze(user_instruction)
-    requirements = analysis_result
-    logger.info("[Workflow] Instruction analysis complete")
-    logger.debug(f"[Workflow] requirements: {requirements}")
+    with telemetry_run("create_website") as telemetry:
+        try:
+            result = _run_workflow(user_instruction)
+        except ProviderUnavailableError as pue:
+            logger.error(f"[Workflow] *** WORKFLOW TERMINATED: Gemini provider unavailable ({pue.model}) ***")
+            result = {
+                "status": "error",
+                "error": f"Gemini provider unavailable: {str(pue)}",
+                "error_type": "provider_unavailable",
+                "model": pue.model,
+                "retry_after_seconds": round(pue.retry_after),
+                "circuit_breakers": get_circuit_breakers().snapshot(),
+                "recommendation": "The Gemini API is failing or timing out repeatedly. Please wait and try again later."
+            }
+        finally:
+            context_cache_stats = _release_context_cache()
+    result["llm_metrics"] = telemetry.summary()
+    if context_cache_stats is not None:
+        # コンテキストキャッシュの作成数・再利用数・再利用したトークン数
+        result["llm_metrics"]["context_cache"] = context_cache_stats
+    if Config.PROJECT_POOL_SIZE > 0:
+        from tools.setup_nextjs_project import project_pool_snapshot
+        # 作成済みプロジェクトのプールのヒット率・補充状況
+        result["project_pool"] = project_pool_snapshot()
+    metrics_path = telemetry.write()
+    if metrics_path:
+        result["llm_metrics_file"] = metrics_path
+    metrics = result["llm_metrics"]
+    logger.info(f"[Workflow] LLM calls: {metrics['calls']}, latency total: {metrics['latency_total_seconds']}s, "
+                f"tokens: {metrics['input_tokens']}/{metrics['output_tokens']}, retries: {metrics['retries']}")
+    return result
 
-    # 2. Next.jsセットアップ（setup_nextjs_project.pyを一度だけ実行）
-    logger.info("[Workflow] Project setup start")
-    setup_result = setup_nextjs_project()
-    if setup_result.get("status") == "error":
-        logger.debug(f"[Workflow] setup_nextjs_project.py failed: {setup_result}")
-        return {"status": "error", "error": setup_result.get("error", "setup failed")}
-    
-    # プロジェクト名を取得
-    project_name = setup_result.get("project_name")
-    if not project_name:
-        return {"status": "error", "error": "Failed to get project name from setup"}
-    
-    logger.info(f"[Workflow] Project setup complete with name: {project_name}")
+def _release_context_cache():
+    # コンテキストキャッシュの統計を取得してから、作成したキャッシュとそれを使うクライアントを破棄する
+    from agents.context_cache import get_context_cache
+    from agents.llm_client import LLMClientRegistry
 
-    # 3. ステップ生成（品質制御付き）
-    logger.info("[Workflow] Step generation start")
+    context_cache = get_context_cache()
+    if context_cache is None:
+        return None
+    stats = context_cache.snapshot()
+    LLMClientRegistry.discard(context_cache.release())
+    return stats
+
+def _run_workflow(user_instruction: str) -> dict:
+    """
+    ワークフローの各ステージを依存関係のグラフとして実行する。
+    指示解析（analysis）とプロジェクトのセットアップ（setup）、Node.jsツールチェーンの解決（toolchain）は互いに依存しないので並行に実行する。
+    analysis, setup -> steps -> install -> server_start
+    """
+    from agents.step_generation import CriticalWorkflowError
+    from logger import Logger
+    logger = Logger(log_level="INFO")
+
+    logger.info("[Workflow] Start workflow")
+    graph = StageGraph("create_website")
+    graph.add("analysis", lambda inputs: _analyze(user_instruction))
+    graph.add("setup", lambda inputs: _setup())
+    graph.add("toolchain", lambda inputs: get_node_toolchain())
+    graph.add("steps", lambda inputs: _generate_steps(inputs["analysis"], inputs["setup"]), inputs=["analysis", "setup"])
+    graph.add("install", lambda inputs: _install(inputs["setup"], inputs["steps"]), inputs=["setup", "steps", "toolchain"])
+    # サーバー起動はsignalハンドラを登録するので呼び出し元のスレッドで実行する
+    graph.add("server_start", lambda inputs: _start_server(inputs["setup"]), inputs=["setup", "install", "toolchain"], inline=True)
     try:
-        step_agent = StepGenerationAgent()
-        steps, all_required_libs = step_agent.generate_steps(requirements, project_name)
-        logger.info("[Workflow] Step generation complete")
-        logger.debug(f"[Workflow] steps: {steps}")
-        logger.debug(f"[Workflow] all_required_libs: {all_required_libs}")
+        results = graph.run()
+        result = results["server_start"]
+    except StageFailed as sf:
+        result = sf.result
     except CriticalWorkflowError as cwe:
         # 品質制御で3回失敗した場合はワークフロー全体を停止
         logger.error(f"[Workflow] *** CRITICAL WORKFLOW TERMINATION ***")
@@ -51,19 +97,97 @@ def run_workflow(user_instruction: str) -> dict:
         logger.error(f"[Workflow] Error details: {str(cwe)}")
         logger.error(f"[Workflow] Recommendation: Review and improve the generated content quality")
         logger.error(f"[Workflow] *** WORKFLOW TERMINATED ***")
-        return {
+        result = {
             "status": "error", 
             "error": f"Critical workflow failure: {str(cwe)}",
             "failed_component": cwe.failed_component,
             "error_type": "quality_control_failure",
             "recommendation": "The system attempted to generate content 3 times but failed to meet quality standards. Please review the requirements and try again."
         }
+    finally:
+        # 指示解析が失敗した場合、並行して作成したプロジェクトには何も生成されていないので削除する
+        if "analysis" not in graph.results and "setup" in graph.results:
+            _discard_project(graph.results["setup"])
+    if result.get("status") == "error" and "analysis" in graph.results and "setup" in graph.results:
+        # 生成途中のプロジェクトは確認できるように残し、結果にプロジェクト名を付ける
+        result.setdefault("project_name", graph.results["setup"]["project_name"])
+    result["stage_graph"] = graph.report()
+    return result
 
-    # 4. 必要なnpmパッケージをまとめてインストール
+def _analyze(user_instruction: str):
+    # 1. 指示解析
+    from agents.instruction_analysis import InstructionAnalysisAgent
+    from agents.llm_telemetry import workflow_stage
+    from logger import Logger
+    logger = Logger(log_level="INFO")
+
+    with workflow_stage("analysis"):
+        analysis_agent = InstructionAnalysisAgent()
+        analysis_result = analysis_agent.analyze(user_instruction)
+    logger.info("[Workflow] Instruction analysis complete")
+    logger.debug(f"[Workflow] requirements: {analysis_result}")
+    return analysis_result
+
+def _setup() -> dict:
+    # 2. Next.jsセットアップ（setup_nextjs_project.pyを一度だけ実行）
+    from agents.llm_telemetry import workflow_stage
+    from logger import Logger
+    logger = Logger(log_level="INFO")
+
+    logger.info("[Workflow] Project setup start")
+    with workflow_stage("setup") as stage:
+        setup_result = setup_nextjs_project()
+        if setup_result.get("status") == "error":
+            stage["status"] = "error"
+    if setup_result.get("status") == "error":
+        logger.debug(f"[Workflow] setup_nextjs_project.py failed: {setup_result}")
+        raise StageFailed({"status": "error", "error": setup_result.get("error", "setup failed")})
+    
+    # プロジェクト名を取得
+    project_name = setup_result.get("project_name")
+    if not project_name:
+        raise StageFailed({"status": "error", "error": "Failed to get project name from setup"})
+    
+    logger.info(f"[Workflow] Project setup complete with name: {project_name}")
+    return setup_result
+
+def _generate_steps(requirements, setup_result: dict):
+    # 3. ステップ生成（品質制御付き）。品質制御で3回失敗した場合はCriticalWorkflowErrorを送出する
+    from agents.step_generation import StepGenerationAgent
+    from logger import Logger
+    logger = Logger(log_level="INFO")
+
+    logger.info("[Workflow] Step generation start")
+    step_agent = StepGenerationAgent()
+    steps, all_required_libs = step_agent.generate_steps(requirements, setup_result["project_name"])
+    logger.info("[Workflow] Step generation complete")
+    logger.debug(f"[Workflow] steps: {steps}")
+    logger.debug(f"[Workflow] all_required_libs: {all_required_libs}")
+    return all_required_libs
+
+def _project_path(project_name: str) -> str:
     # プロジェクトパスの構築
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     output_dir_path = os.path.join(project_root, Config.OUTPUT_DIR)
-    project_path = os.path.join(output_dir_path, project_name)
+    return os.path.join(output_dir_path, project_name)
+
+def _discard_project(setup_result: dict) -> None:
+    # 使わなかったプロジェクトの削除
+    import shutil
+    from logger import Logger
+    logger = Logger(log_level="INFO")
+
+    project_path = _project_path(setup_result["project_name"])
+    logger.info(f"[Workflow] Removing unused project: {project_path}")
+    shutil.rmtree(project_path, ignore_errors=True)
+
+def _install(setup_result: dict, all_required_libs) -> None:
+    # 4. 必要なnpmパッケージをまとめてインストール
+    from agents.llm_telemetry import workflow_stage
+    from logger import Logger
+    logger = Logger(log_level="INFO")
+
+    project_path = _project_path(setup_result["project_name"])
     
     # Next.jsのデフォルトライブラリリスト（これらはインストール不要）
     nextjs_default_libs = {
@@ -92,26 +216,42 @@ def run_workflow(user_instruction: str) -> dict:
         import subprocess
         try:
             # 必ずNext.jsプロジェクトディレクトリでnpm installを実行
-            result = subprocess.run(["npm", "install"] + libs_to_install, cwd=project_path, capture_output=True, text=True, check=True)
+            # （npmのキャッシュを優先して使い、追加されたパッケージは共有のパッケージストアに取り込む）
+            with workflow_stage("install"):
+                toolchain = get_node_toolchain()
+                result = subprocess.run(toolchain.command("npm", "install", "--prefer-offline", "--no-audit", "--no-fund", *libs_to_install),
+                                        cwd=project_path, capture_output=True, text=True, check=True, env=toolchain.env())
+                link_project_packages(project_path)
             logger.debug(f"[Workflow] npm install stdout: {result.stdout}")
             logger.debug(f"[Workflow] npm install stderr: {result.stderr}")
             logger.info("[Workflow] npm install complete")
         except Exception as e:
             logger.debug(f"[Workflow] npm install failed: {e}")
-            return {"status": "error", "error": str(e)}
+            raise StageFailed({"status": "error", "error": str(e)})
     else:
         logger.info("[Workflow] No additional packages to install (all required libraries are Next.js defaults)")
 
-    # 5. サーバー起動とページ表示
+def _start_server(setup_result: dict) -> dict:
+    # 5. サーバー起動とページ表示（ワークフローの最終結果を返す）
+    from agents.execution import ExecutionAgent
+    from agents.llm_telemetry import workflow_stage
+    from logger import Logger
+    logger = Logger(log_level="INFO")
+
+    project_path = _project_path(setup_result["project_name"])
+
     logger.info("[Workflow] Next.js server startup start")
     exec_agent = ExecutionAgent()
     
     # サーバーを起動
-    server_result = exec_agent.start_nextjs_server(project_path)
+    with workflow_stage("server_start") as stage:
+        server_result = exec_agent.start_nextjs_server(project_path)
+        if server_result.get("status") == "error":
+            stage["status"] = "error"
     
     if server_result.get("status") == "error":
         logger.error(f"[Workflow] Failed to start server: {server_result.get('error')}")
-        return {"status": "error", "error": server_result.get("error")}
+        raise StageFailed({"status": "error", "error": server_result.get("error")})
     
     logger.info(f"[Workflow] Server started: {server_result.get('message')}")
     logger.info(f"[Workflow] Server URL: {server_result.get('url')}")
@@ -145,7 +285,7 @@ def run_workflow(user_instruction: str) -> dict:
 
     return {
         "status": "success",
-        "project_name": project_name,
+        "project_name": setup_result["project_name"],
         "server_url": server_result.get("url"),
         "port": server_result.get("port"),
         "project_path": project_path,
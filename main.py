@@ -1,6 +1,7 @@
 from mcp.server.fastmcp import FastMCP
 from graph.workflow import run_workflow
 from graph.s3_deploy_workflow import run_s3_deploy_workflow, check_s3_deployment_status
+from tools.setup_nextjs_project import warm_project_pool
 from logger import Logger
 from config import Config
 from typing import Optional
@@ -67,4 +68,6 @@ def check_s3_deployment(bucket_name: str) -> dict:
 
 if __name__ == "__main__":
     logger.info("Starting MCP server for web development")
+    # 作成済みプロジェクトのプールをバックグラウンドで用意しておく
+    warm_project_pool()
     mcp.run()
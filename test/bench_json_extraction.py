@@ -0,0 +1,174 @@
+# JSON抽出処理のマイクロベンチマーク
+# 旧実装（正規表現カスケード + raw_decodeフォールバック）と、agents/json_extraction.pyの1パス括弧スキャンを比較します
+# LLMレスポンスキャッシュ（.llm_cache）に記録済みのレスポンスがあればそれも計測対象にします
+#   python test/bench_json_extraction.py --sizes 10 50 100 --repeat 5
+import sys
+import os
+import re
+import json
+import time
+import glob
+import argparse
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from config import Config
+from agents.json_extraction import robust_json_parser, iter_json_objects
+
+PAGE_PATTERNS = [
+    r'\{\s*"name"\s*:\s*"page\.tsx"[\s\S]*?"file_type"\s*:\s*"page"[\s\S]*?\}',
+    r'\{\s*"name"\s*:\s*"[^"]*\.module\.css"[\s\S]*?"file_type"\s*:\s*"css"[\s\S]*?\}'
+]
+
+
+def legacy_robust_json_parser(content, required_fields=None, specific_patterns=None, extract_multiple=False):
+    """比較用：旧robust_json_parser（5段階の抽出戦略）"""
+    json_candidates = []
+    for block in re.findall(r"```(?:json)?\s*([\s\S]*?)```", content):
+        block = block.strip()
+        if block.startswith('{') and block.endswith('}'):
+            json_candidates.append(block)
+        else:
+            json_candidates.extend(re.findall(r'\{[\s\S]*?\}', block))
+    json_candidates.extend(re.findall(r'\{[\s\S]*?\}', content))
+    complex_json_pattern = r'\{\s*"score"\s*:\s*\d+\s*,\s*"feedback"\s*:\s*".*?"\s*,\s*"passed"\s*:\s*(?:true|false)\s*\}'
+    json_candidates.extend(re.findall(complex_json_pattern, content, re.DOTALL))
+
+    i = 0
+    text = content
+    while i < len(text):
+        if text[i] == '{':
+            bracket_count, start, in_string, escape_next = 1, i, False, False
+            i += 1
+            while i < len(text) and bracket_count > 0:
+                char = text[i]
+                if escape_next:
+                    escape_next = False
+                elif char == '\\':
+                    escape_next = True
+                elif char == '"':
+                    in_string = not in_string
+                elif not in_string:
+                    if char == '{':
+                        bracket_count += 1
+                    elif char == '}':
+                        bracket_count -= 1
+                i += 1
+            if bracket_count == 0:
+                json_candidates.append(text[start:i])
+        else:
+            i += 1
+
+    for pattern in specific_patterns or []:
+        json_candidates.extend(re.findall(pattern, content, re.DOTALL))
+
+    parsed_objects = []
+    for candidate in json_candidates:
+        candidate = candidate.strip()
+        if not candidate:
+            continue
+        try:
+            parsed = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(parsed, dict) and (not required_fields or all(f in parsed for f in required_fields)):
+            if not extract_multiple:
+                return parsed
+            parsed_objects.append(parsed)
+    return parsed_objects if extract_multiple else (parsed_objects[0] if parsed_objects else None)
+
+
+def legacy_extract_json_objects(text):
+    """比較用：旧extract_json_objects（何も見つからない場合はraw_decodeで1文字ずつ前進）"""
+    json_objs = legacy_robust_json_parser(text, required_fields=['name', 'file_type'], specific_patterns=PAGE_PATTERNS, extract_multiple=True)
+    if not json_objs:
+        idx = 0
+        while idx < len(text):
+            try:
+                obj, end = json.JSONDecoder().raw_decode(text[idx:])
+                if isinstance(obj, dict):
+                    json_objs.append(obj)
+                idx += end
+            except Exception:
+                idx += 1
+    return json_objs
+
+
+def new_extract_json_objects(text):
+    """現行のextract_json_objectsと同じ処理"""
+    json_objs = robust_json_parser(text, required_fields=['name', 'file_type'], specific_patterns=PAGE_PATTERNS, extract_multiple=True, label="bench")
+    if not json_objs:
+        json_objs = list(iter_json_objects(text))
+    return json_objs
+
+
+def synthesize_response(size_kb: int, truncated: bool = False) -> str:
+    """Geminiのページ生成レスポンスに似せたテキスト（TSXを含む2つのJSONブロック）を生成する"""
+    line = '      <div className="grid grid-cols-3 gap-4">{items.map((item) => (<Card key={item.id} title="{item.title}" />))}</div>\n'
+    code = "import React from 'react';\nexport default function Page() {\n  return (\n    <main>\n"
+    while len(code) < size_kb * 1024 * 0.8:
+        code += line
+    code += "    </main>\n  );\n}\n"
+    css = ".container {\n  display: flex;\n  gap: 1rem;\n}\n" * max(1, size_kb * 4)
+    page = json.dumps({"name": "page.tsx", "dir": "about", "file_type": "page", "code": code, "meta": {}, "required_libs": []})
+    module_css = json.dumps({"name": "about.module.css", "dir": "about", "file_type": "css", "code": css, "meta": {}, "required_libs": []})
+    text = f"Here are the files:\n```json\n{page}\n```\n\n```json\n{module_css}\n```\n"
+    if truncated:
+        # max tokensで途中終了したレスポンス（有効なオブジェクトが1つもない）
+        text = text[: len(text) // 2]
+    return text
+
+
+def load_recorded_responses(limit: int):
+    """LLMレスポンスキャッシュに記録済みのレスポンス本文を読み込む"""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cache_dir = os.path.join(project_root, Config.LLM_CACHE_DIR)
+    responses = []
+    for path in sorted(glob.glob(os.path.join(cache_dir, "*", "*.json")), key=os.path.getsize, reverse=True)[:limit]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = json.load(f).get("content", "")
+        except Exception:
+            continue
+        if content:
+            responses.append((f"recorded:{os.path.basename(path)[:12]}", content))
+    return responses
+
+
+def measure(func, text, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON extraction microbenchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100], help="合成レスポンスのサイズ（KB）")
+    parser.add_argument("--repeat", type=int, default=3, help="各ケースの試行回数（最良値を採用）")
+    parser.add_argument("--recorded", type=int, default=5, help="計測するキャッシュ済みレスポンスの最大件数")
+    parser.add_argument("--skip-legacy-truncated", action="store_true", help="旧実装の途中終了ケース（二乗時間）を省略する")
+    args = parser.parse_args()
+
+    cases = []
+    for size in args.sizes:
+        cases.append((f"synthetic {size}KB", synthesize_response(size), True))
+        cases.append((f"synthetic {size}KB truncated", synthesize_response(size, truncated=True), not args.skip_legacy_truncated))
+    cases.extend((name, text, True) for name, text in load_recorded_responses(args.recorded))
+
+    print(f"{'case':<36}{'chars':>10}{'legacy (ms)':>14}{'new (ms)':>12}{'speedup':>10}{'objects':>10}")
+    for name, text, run_legacy in cases:
+        new_time, new_result = measure(new_extract_json_objects, text, args.repeat)
+        if run_legacy:
+            legacy_time, legacy_result = measure(legacy_extract_json_objects, text, args.repeat)
+            legacy_ms = f"{legacy_time * 1000:.2f}"
+            speedup = f"{legacy_time / new_time:.1f}x" if new_time > 0 else "-"
+            objects = f"{len(legacy_result)}/{len(new_result)}"
+        else:
+            legacy_ms, speedup, objects = "skipped", "-", f"-/{len(new_result)}"
+        print(f"{name:<36}{len(text):>10}{legacy_ms:>14}{new_time * 1000:>12.2f}{speedup:>10}{objects:>10}")
+
+
+if __name__ == "__main__":
+    main()
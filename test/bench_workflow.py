@@ -0,0 +1,543 @@
+# ワークフロー全体（run_workflow + run_s3_deploy_workflow）のエンドツーエンドベンチマーク
+# LLMはLLM_BACKEND=replay（記録済みレスポンス + 合成レスポンス）、create-next-app / npm はスタブ、S3はmotoで置き換え、
+# MAX_CONCURRENCY・ページ数・レビュー不合格率・429率の組み合わせごとにステージ別の所要時間とクリティカルパスを計測します
+# 結果はJSONに保存し、--compareで別コミットの結果と比較できます
+#   python test/bench_workflow.py --concurrency 1 3 5 --pages 3 10 20 --failure-rates 0 0.2
+#   python test/bench_workflow.py --output after.json --compare before.json
+# 各シナリオは環境変数で設定した子プロセスで実行します（Config・プロセス共通のレートリミッター等をシナリオ間で共有しないため）
+import sys
+import os
+import re
+import json
+import time
+import random
+import shutil
+import argparse
+import datetime
+import tempfile
+import platform
+import itertools
+import statistics
+import subprocess
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ステージの依存関係（クリティカルパスの算出に使う。記録されなかったステージは依存先をたどって飛ばす）
+STAGE_DEPENDENCIES = {
+    "analysis": [],
+    "setup": [],
+    "layout": ["analysis", "setup"],
+    "pages": ["layout"],
+    "install": ["pages"],
+    "server_start": ["install"],
+    "build": ["server_start"],
+    "upload": ["build"],
+}
+STAGES = list(STAGE_DEPENDENCIES)
+
+# ---------------------------------------------------------------------------
+# npx / npm のスタブ（PATHの先頭に置く。所要時間はBENCH_*_SECONDSで指定）
+# ---------------------------------------------------------------------------
+NPX_STUB = r'''
+import os, sys, json, time
+args = sys.argv[1:]
+if not args or not args[0].startswith("create-next-app"):
+    sys.exit(0)
+time.sleep(float(os.environ.get("BENCH_SETUP_SECONDS", "0")))
+project = os.path.join(os.getcwd(), args[1])
+os.makedirs(os.path.join(project, "app"), exist_ok=True)
+with open(os.path.join(project, "package.json"), "w") as f:
+    json.dump({"name": args[1], "private": True, "scripts": {"dev": "next dev", "build": "next build"},
+               "dependencies": {"next": "14.1.0", "react": "^18", "react-dom": "^18"}}, f, indent=2)
+with open(os.path.join(project, "next.config.js"), "w") as f:
+    f.write("/** @type {import('next').NextConfig} */\nconst nextConfig = {}\n\nmodule.exports = nextConfig\n")
+os.makedirs(os.path.join(project, "node_modules", "next"), exist_ok=True)
+with open(os.path.join(project, "node_modules", "next", "package.json"), "w") as f:
+    json.dump({"name": "next", "version": "14.1.0"}, f)
+with open(os.path.join(project, "node_modules", ".package-lock.json"), "w") as f:
+    json.dump({"name": args[1], "lockfileVersion": 3, "packages": {"node_modules/next": {"version": "14.1.0"}}}, f)
+with open(os.path.join(project, "package-lock.json"), "w") as f:
+    json.dump({"name": args[1], "lockfileVersion": 3, "packages": {"": {"name": args[1]}, "node_modules/next": {"version": "14.1.0"}}}, f)
+for name, code in (("layout.tsx", "export default function RootLayout({ children }) { return children }\n"),
+                   ("globals.css", "@tailwind base;\n@tailwind components;\n@tailwind utilities;\n"),
+                   ("page.tsx", "export default function Home() { return null }\n")):
+    with open(os.path.join(project, "app", name), "w") as f:
+        f.write(code)
+print("Success! Created " + args[1])
+'''
+
+NPM_STUB = r'''
+import os, sys, json, time
+args = sys.argv[1:]
+cwd = os.getcwd()
+if args[:1] in (["-v"], ["--version"]):
+    print("10.0.0")
+elif args[:1] == ["install"]:
+    time.sleep(float(os.environ.get("BENCH_INSTALL_SECONDS", "0")))
+    path = os.path.join(cwd, "package.json")
+    with open(path) as f:
+        package = json.load(f)
+    libs = [arg for arg in args[1:] if not arg.startswith("-")]
+    for lib in libs:
+        package.setdefault("dependencies", {})[lib] = "latest"
+        os.makedirs(os.path.join(cwd, "node_modules", lib), exist_ok=True)
+        with open(os.path.join(cwd, "node_modules", lib, "package.json"), "w") as f:
+            json.dump({"name": lib, "version": "1.0.0", "main": "index.js"}, f)
+        with open(os.path.join(cwd, "node_modules", lib, "index.js"), "w") as f:
+            f.write("module.exports = {};\n")
+    with open(path, "w") as f:
+        json.dump(package, f, indent=2)
+    print("added %d packages" % len(libs))
+elif args[:2] == ["run", "build"]:
+    pages = [d for d in sorted(os.listdir(os.path.join(cwd, "app"))) if os.path.exists(os.path.join(cwd, "app", d, "page.tsx"))]
+    time.sleep(float(os.environ.get("BENCH_BUILD_SECONDS", "0")) + float(os.environ.get("BENCH_BUILD_SECONDS_PER_PAGE", "0")) * (len(pages) + 1))
+    out = os.path.join(cwd, "out")
+    for page in [""] + pages:
+        os.makedirs(os.path.join(out, page), exist_ok=True)
+        with open(os.path.join(out, page, "index.html"), "w") as f:
+            f.write("<html><body>%s</body></html>" % (page or "home"))
+    with open(os.path.join(out, "error.html"), "w") as f:
+        f.write("<html><body>error</body></html>")
+    print("Export successful")
+elif args[:2] == ["run", "dev"]:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+    port = int(args[args.index("--port") + 1]) if "--port" in args else 3000
+    time.sleep(float(os.environ.get("BENCH_SERVER_START_SECONDS", "0")))
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *a):
+            pass
+    server = HTTPServer(("127.0.0.1", port), Handler)
+    print("ready - started server on 0.0.0.0:%d, url: http://localhost:%d" % (port, port), flush=True)
+    server.serve_forever()
+'''
+
+
+def write_stubs(directory: str) -> str:
+    """npx / npm のスタブとnvmの空定義を作成し、PATHに追加するbinディレクトリを返す"""
+    bin_dir = os.path.join(directory, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, source in (("npx", NPX_STUB), ("npm", NPM_STUB)):
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(f"#!{sys.executable}\n{source}")
+        os.chmod(path, 0o755)
+    nvm_dir = os.path.join(directory, "nvm")
+    os.makedirs(nvm_dir, exist_ok=True)
+    with open(os.path.join(nvm_dir, "nvm.sh"), "w") as f:
+        f.write("nvm() { :; }\n")
+    return bin_dir
+
+
+# ---------------------------------------------------------------------------
+# 合成LLMレスポンス（記録にないプロンプトに対するFakeLLMBackendのresponder）
+# ---------------------------------------------------------------------------
+class BenchResponder:
+    """
+    プロンプトの種類（要件分析・layout生成・ページ生成・修正・レビュー）を判別し、静的チェックを通るコードと
+    レビュー結果を返す。レビューはfailure_rateの確率で不合格にする（乱数はシードで固定）。
+    """
+
+    def __init__(self, page_count: int, failure_rate: float, seed: int, libs: list):
+        self.pages = [{"name": "Home", "slug": "home", "path": "/"}] + [
+            {"name": f"Page {i}", "slug": f"page-{i}", "path": f"/page-{i}"} for i in range(1, page_count)
+        ]
+        self.failure_rate = failure_rate
+        self.libs = libs
+        self._rng = random.Random(seed)
+
+    def __call__(self, model: str, prompt: str, schema: str = None) -> str:
+        if "**PAGES UNDER REVIEW" in prompt:
+            pages = re.findall(r"^=== PAGE (\d+): ([\w-]*) ===$", prompt, re.MULTILINE)
+            reviews = [dict(index=int(index), slug=slug, **self._review()) for index, slug in pages]
+            return json.dumps({"reviews": reviews})
+        if "**PAGE UNDER REVIEW:**" in prompt or "specializing in layout files" in prompt:
+            return json.dumps(self._review())
+        if "(PATCH MODE)" in prompt:
+            return self._patch(prompt)
+        if "**PAGE TO GENERATE:**" in prompt or "## PAGE TO REVISE" in prompt:
+            return self._page(prompt, schema)
+        if "expert. Generate both a high-quality /app/layout.tsx" in prompt or "CRITICAL REVISION of the layout" in prompt:
+            return self._layout(schema)
+        if "information architect" in prompt:
+            return self._analysis()
+        return "{}"
+
+    def _review(self) -> dict:
+        if self._rng.random() < self.failure_rate:
+            return {"score": 60, "feedback": "Section spacing is inconsistent; revise the note paragraph.", "passed": False}
+        return {"score": 90, "feedback": "Looks good.", "passed": True}
+
+    def _analysis(self) -> str:
+        pages = [
+            dict(page, contents=[f"Hero section for {page['name']}", "Feature list with three items", "Call to action"],
+                 nav=[p["slug"] for p in self.pages])
+            for page in self.pages
+        ]
+        site_map = [{"slug": page["slug"], "path": page["path"], "title": page["name"]} for page in self.pages]
+        return json.dumps({"overall_design": "Clean corporate site with a navy and white palette.", "pages": pages, "siteMap": site_map})
+
+    @staticmethod
+    def _files(schema: str, keys: tuple, objects: list) -> str:
+        if schema:
+            return json.dumps(dict(zip(keys, objects)))
+        return "\n\n".join("```json\n" + json.dumps(obj) + "\n```" for obj in objects)
+
+    def _layout(self, schema: str) -> str:
+        links = "\n".join(f'          <Link href="{page["path"]}">{page["name"]}</Link>' for page in self.pages)
+        code = (
+            "import React from 'react';\nimport Link from 'next/link';\nimport './globals.css';\n\n"
+            "export const metadata = { title: 'Bench Site', description: 'Benchmark site' };\n\n"
+            "export default function RootLayout({ children }: { children: React.ReactNode }) {\n"
+            "  return (\n    <html lang=\"en\">\n      <body>\n        <header>\n        <nav>\n"
+            f"{links}\n        </nav>\n        </header>\n        <main>{{children}}</main>\n"
+            "        <footer>Bench Site</footer>\n      </body>\n    </html>\n  );\n}\n"
+        )
+        css = "@tailwind base;\n@tailwind components;\n@tailwind utilities;\n\nbody {\n  margin: 0;\n  color: #0b1f3a;\n}\n"
+        return self._files(schema, ("layout", "globals_css"), [
+            {"name": "layout.tsx", "dir": "", "file_type": "layout", "code": code, "meta": {}, "required_libs": ["react", "next/link"]},
+            {"name": "globals.css", "dir": "", "file_type": "css", "code": css, "meta": {}, "required_libs": []},
+        ])
+
+    def _page(self, prompt: str, schema: str) -> str:
+        match = re.search(r"slug=([\w-]+), path=", prompt) or re.search(r"'slug': '([\w-]*)'", prompt.split("## PAGE TO REVISE")[-1])
+        slug = match.group(1) if match else "home"
+        is_home = slug in ("", "home", "index")
+        css_name = "home.module.css" if is_home else f"{slug}.module.css"
+        sections = "\n".join(
+            f"      <section className={{styles.section}}>\n        <h2>Section {i}</h2>\n"
+            f"        <p>Content block {i} for {slug}.</p>\n      </section>"
+            for i in range(1, 6)
+        )
+        code = (
+            "import React from 'react';\n"
+            f"import '{'.' if is_home else '..'}/globals.css';\n"
+            f"import styles from './{css_name}';\n\n"
+            f"export default function Page() {{\n  return (\n    <div className={{styles.container}}>\n"
+            f"      <h1>{slug}</h1>\n{sections}\n"
+            "      <p className={styles.note} data-revision=\"1\">Revision note</p>\n"
+            "    </div>\n  );\n}\n"
+        )
+        css = ".container {\n  padding: 2rem;\n}\n\n.section {\n  margin-bottom: 1.5rem;\n}\n\n.note {\n  color: #555;\n}\n"
+        libs = list(self.libs) if slug == self.pages[-1]["slug"] else []
+        return self._files(schema, ("page", "module_css"), [
+            {"name": "page.tsx", "dir": slug, "file_type": "page", "code": code, "meta": {}, "required_libs": libs},
+            {"name": css_name, "dir": slug, "file_type": "css", "code": css, "meta": {}, "required_libs": []},
+        ])
+
+    @staticmethod
+    def _patch(prompt: str) -> str:
+        match = re.search(r'^(\s*<p className=\{styles\.note\} data-revision="(\d+)">Revision note</p>)$', prompt, re.MULTILINE)
+        if match is None:
+            return ""
+        line, revision = match.group(1), int(match.group(2))
+        replacement = line.replace(f'data-revision="{revision}"', f'data-revision="{revision + 1}"')
+        return f"FILE: page.tsx\n<<<<<<< SEARCH\n{line}\n=======\n{replacement}\n>>>>>>> REPLACE\n"
+
+
+# ---------------------------------------------------------------------------
+# クリティカルパス
+# ---------------------------------------------------------------------------
+def critical_path(stages: dict) -> list:
+    """
+    最後に終わったステージから、依存先のうち最後に終わったステージを順にたどる。
+    stages: ステージ名 -> {"start": 秒, "end": 秒, ...}（ベンチマーク開始からの時刻）
+    """
+    def recorded_dependencies(name):
+        result = []
+        for dependency in STAGE_DEPENDENCIES.get(name, []):
+            result.extend([dependency] if dependency in stages else recorded_dependencies(dependency))
+        return result
+
+    if not stages:
+        return []
+    current = max(stages, key=lambda name: stages[name]["end"])
+    path = [current]
+    while True:
+        dependencies = recorded_dependencies(current)
+        if not dependencies:
+            break
+        current = max(dependencies, key=lambda name: stages[name]["end"])
+        path.append(current)
+    return list(reversed(path))
+
+
+# ---------------------------------------------------------------------------
+# 1シナリオの実行（子プロセス）
+# ---------------------------------------------------------------------------
+def run_scenario(scenario: dict) -> dict:
+    """環境変数で設定済みの子プロセス内で、ワークフロー1回分（+ S3デプロイ）を実行して計測する"""
+    from agents.fake_llm import get_fake_llm_backend
+    from graph.workflow import run_workflow
+
+    backend = get_fake_llm_backend()
+    backend.responder = BenchResponder(scenario["pages"], scenario["failure_rate"], scenario["seed"], scenario["libs"])
+
+    if scenario.get("project_pool", 0) > 0:
+        # 起動済みのサーバーと同じく、作成済みプロジェクトのプールが埋まってから計測を始める
+        from tools.setup_nextjs_project import project_pool_snapshot, warm_project_pool
+        warm_project_pool()
+        deadline = time.time() + 600
+        while project_pool_snapshot()["ready"] < scenario["project_pool"] and time.time() < deadline:
+            time.sleep(0.2)
+
+    stages = {}
+
+    def collect(summary: dict, offset: float):
+        for stage in summary.get("stages", []):
+            start = offset + stage["start_offset_seconds"]
+            # 同じステージが複数回記録された場合（リトライ等）は最初の開始から最後の終了までとする
+            entry = stages.setdefault(stage["stage"], {"start": start, "end": start, "status": stage["status"]})
+            entry["start"] = min(entry["start"], start)
+            entry["end"] = max(entry["end"], start + stage["seconds"])
+            entry["status"] = stage["status"]
+
+    started = time.perf_counter()
+    result = run_workflow("Create a corporate website for a consulting firm.")
+    metrics = result.get("llm_metrics", {})
+    collect(metrics, 0.0)
+    if result.get("process_pid"):
+        try:
+            os.kill(result["process_pid"], 15)
+        except OSError:
+            pass
+
+    if result.get("status") == "success" and scenario["libs"] and "install" not in stages:
+        # 最後のページのrequired_libsがワークフローに渡っていない（installステージを計測できていない）
+        result = dict(result, status="error", error=f"install stage was not run for required_libs {scenario['libs']}")
+
+    deploy = {"status": "skipped"}
+    if result.get("status") == "success" and not scenario["skip_deploy"]:
+        deploy = _run_deploy(result["project_name"], started, collect)
+
+    for entry in stages.values():
+        entry["seconds"] = round(entry["end"] - entry["start"], 3)
+        entry["start"], entry["end"] = round(entry["start"], 3), round(entry["end"], 3)
+    path = critical_path(stages)
+    return {
+        "scenario": scenario,
+        "status": result.get("status"),
+        "error": result.get("error"),
+        "deploy_status": deploy.get("status"),
+        "deploy_error": deploy.get("error"),
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "stages": stages,
+        "critical_path": path,
+        "critical_path_seconds": round(sum(stages[name]["seconds"] for name in path), 3),
+        "llm": {
+            "calls": metrics.get("calls"),
+            "retries": metrics.get("retries"),
+            "input_tokens": metrics.get("input_tokens"),
+            "output_tokens": metrics.get("output_tokens"),
+            "attempts": {component: entry["attempts"] for component, entry in metrics.get("attempts", {}).items()},
+            "fake_backend": backend.snapshot(),
+        },
+    }
+
+
+def _run_deploy(project_name: str, started: float, collect) -> dict:
+    """motoのS3モック上でrun_s3_deploy_workflowを実行する（motoがない場合はスキップ）"""
+    try:
+        from moto import mock_aws
+    except ImportError:
+        try:
+            from moto import mock_s3 as mock_aws
+        except ImportError:
+            return {"status": "skipped", "error": "moto is not installed (pip install moto)"}
+    from agents.llm_telemetry import telemetry_run
+    from graph.s3_deploy_workflow import run_s3_deploy_workflow
+
+    with mock_aws():
+        offset = time.perf_counter() - started
+        with telemetry_run("s3_deploy") as telemetry:
+            deploy = run_s3_deploy_workflow(project_name)
+        collect(telemetry.summary(), offset)
+    return deploy
+
+
+# ---------------------------------------------------------------------------
+# スイープ（親プロセス）
+# ---------------------------------------------------------------------------
+def scenario_env(args, scenario: dict, work_dir: str, bin_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PATH": bin_dir + os.pathsep + env.get("PATH", ""),
+        "NVM_DIR": os.path.join(work_dir, "nvm"),
+        "BROWSER": "true",
+        "OUTPUT_DIR": os.path.join(work_dir, "output"),
+        # 雛形キャッシュは全シナリオで共有する（最初のシナリオだけがcreate-next-appのスタブで作成する）
+        "NEXTJS_TEMPLATE_CACHE_DIR": os.path.join(os.path.dirname(bin_dir), "nextjs_template_cache"),
+        "GOOGLE_API_KEY": env.get("GOOGLE_API_KEY") or "bench",
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "MAX_CONCURRENCY": str(scenario["concurrency"]),
+        "PROJECT_POOL_SIZE": str(scenario.get("project_pool", 0)),
+        "LLM_BACKEND": "replay",
+        "LLM_FAKE_RECORDINGS": args.recordings or "",
+        "LLM_FAKE_LATENCY": args.llm_latency,
+        "LLM_FAKE_RATE_LIMIT_RATE": str(scenario["rate_limit_rate"]),
+        "LLM_FAKE_SEED": str(scenario["seed"]),
+        "LLM_CACHE_ENABLED": "false",
+        "LLM_METRICS_FILE": "",
+        "MODEL_ROUTER_LOG_FILE": "",
+        "BENCH_SETUP_SECONDS": str(args.setup_seconds),
+        "BENCH_INSTALL_SECONDS": str(args.install_seconds),
+        "BENCH_SERVER_START_SECONDS": str(args.server_start_seconds),
+        "BENCH_BUILD_SECONDS": str(args.build_seconds),
+        "BENCH_BUILD_SECONDS_PER_PAGE": str(args.build_seconds_per_page),
+    })
+    return env
+
+
+def run_in_subprocess(args, scenario: dict, work_dir: str, bin_dir: str) -> dict:
+    result_file = os.path.join(work_dir, "result.json")
+    if os.path.exists(result_file):
+        os.remove(result_file)
+    command = [sys.executable, os.path.abspath(__file__), "--run-scenario", json.dumps(scenario), "--result-file", result_file]
+    process = subprocess.run(command, cwd=PROJECT_ROOT, env=scenario_env(args, scenario, work_dir, bin_dir),
+                             capture_output=not args.verbose, text=True, timeout=args.timeout)
+    if not os.path.exists(result_file):
+        tail = (process.stderr or "")[-2000:] if not args.verbose else ""
+        return {"scenario": scenario, "status": "crashed", "error": f"exit code {process.returncode}: {tail}", "stages": {}, "critical_path": []}
+    with open(result_file, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def aggregate(runs: list) -> dict:
+    """同じシナリオの繰り返し実行を中央値にまとめる"""
+    stage_names = [name for name in STAGES if any(name in run["stages"] for run in runs)]
+    paths = [" > ".join(run["critical_path"]) for run in runs]
+    return {
+        "scenario": runs[0]["scenario"],
+        "runs": len(runs),
+        "succeeded": sum(1 for run in runs if run["status"] == "success"),
+        "wall_seconds": round(statistics.median(run.get("wall_seconds", 0) for run in runs), 3),
+        "stages": {
+            name: round(statistics.median(run["stages"][name]["seconds"] for run in runs if name in run["stages"]), 3)
+            for name in stage_names
+        },
+        "critical_path": max(set(paths), key=paths.count).split(" > ") if paths[0] else [],
+        "critical_path_seconds": round(statistics.median(run.get("critical_path_seconds", 0) for run in runs), 3),
+        "llm_calls": statistics.median(run.get("llm", {}).get("calls") or 0 for run in runs),
+        "llm_retries": statistics.median(run.get("llm", {}).get("retries") or 0 for run in runs),
+    }
+
+
+def scenario_key(scenario: dict) -> str:
+    return f"c{scenario['concurrency']}_p{scenario['pages']}_f{scenario['failure_rate']}_r{scenario['rate_limit_rate']}"
+
+
+def print_table(results: list, baseline: dict = None) -> None:
+    header = f"{'scenario':<28}{'ok':>5}{'wall':>9}" + "".join(f"{name:>13}" for name in STAGES) + "  critical path"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        key = scenario_key(result["scenario"])
+        base = (baseline or {}).get(key)
+        row = f"{key:<28}{result['succeeded']:>3}/{result['runs']:<1}{result['wall_seconds']:>9.2f}"
+        for name in STAGES:
+            value = result["stages"].get(name)
+            if value is None:
+                row += f"{'-':>13}"
+            elif base and name in base["stages"]:
+                row += f"{value:>7.2f}({value - base['stages'][name]:+.1f})"
+            else:
+                row += f"{value:>13.2f}"
+        print(row + "  " + " > ".join(result["critical_path"]))
+    if baseline:
+        print("\n(+x.x) = difference from the baseline in seconds")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end workflow benchmark with a replayed LLM, stubbed npm and a moto S3")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 3, 5], help="MAX_CONCURRENCY values to sweep")
+    parser.add_argument("--pages", type=int, nargs="+", default=[3, 10, 20], help="page counts to sweep (3 to 20)")
+    parser.add_argument("--failure-rates", type=float, nargs="+", default=[0.0, 0.2], help="probability that an LLM review fails")
+    parser.add_argument("--rate-limit-rates", type=float, nargs="+", default=[0.0], help="probability of an injected 429 per LLM call")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario (the median is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", default="lognormal:0.5:0.4", help="LLM_FAKE_LATENCY for the replayed LLM")
+    parser.add_argument("--recordings", default=None, help="LLM_FAKE_RECORDINGS file recorded with LLM_BACKEND=record (misses are synthesized)")
+    parser.add_argument("--setup-seconds", type=float, default=2.0, help="stubbed create-next-app duration")
+    parser.add_argument("--install-seconds", type=float, default=1.0, help="stubbed npm install duration")
+    parser.add_argument("--server-start-seconds", type=float, default=1.0, help="stubbed npm run dev startup duration")
+    parser.add_argument("--build-seconds", type=float, default=1.0, help="stubbed npm run build base duration")
+    parser.add_argument("--build-seconds-per-page", type=float, default=0.1, help="stubbed npm run build duration per page")
+    parser.add_argument("--libs", nargs="*", default=["clsx"], help="required_libs returned for the last page (the install stage is expected to run when any are given)")
+    parser.add_argument("--project-pool", type=int, default=0, help="PROJECT_POOL_SIZE (the pool is filled before timing starts)")
+    parser.add_argument("--skip-deploy", action="store_true", help="do not run run_s3_deploy_workflow")
+    parser.add_argument("--timeout", type=float, default=1800, help="per-run timeout in seconds")
+    parser.add_argument("--output", default=None, help="result JSON path (default: bench_workflow_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="baseline result JSON to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show workflow logs")
+    parser.add_argument("--run-scenario", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        result = run_scenario(json.loads(args.run_scenario))
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    commit = git_commit()
+    output = args.output or os.path.join(PROJECT_ROOT, f"bench_workflow_{commit or 'local'}.json")
+    scenarios = [
+        {"concurrency": c, "pages": p, "failure_rate": f, "rate_limit_rate": r, "seed": args.seed,
+         "libs": args.libs, "skip_deploy": args.skip_deploy, "project_pool": args.project_pool}
+        for c, p, f, r in itertools.product(args.concurrency, args.pages, args.failure_rates, args.rate_limit_rates)
+    ]
+    print(f"Running {len(scenarios)} scenarios x {args.repeat} (commit {commit or 'unknown'})")
+
+    results, raw = [], []
+    work_root = tempfile.mkdtemp(prefix="bench_workflow_")
+    try:
+        bin_dir = write_stubs(work_root)
+        for scenario in scenarios:
+            runs = []
+            for repeat in range(args.repeat):
+                run_scenario_ = dict(scenario, seed=scenario["seed"] + repeat)
+                work_dir = os.path.join(work_root, f"{scenario_key(scenario)}_{repeat}")
+                os.makedirs(work_dir, exist_ok=True)
+                shutil.copytree(os.path.join(work_root, "nvm"), os.path.join(work_dir, "nvm"))
+                run = run_in_subprocess(args, run_scenario_, work_dir, bin_dir)
+                runs.append(run)
+                shutil.rmtree(work_dir, ignore_errors=True)
+                status = run["status"] if run.get("deploy_status") in (None, "success") else f"{run['status']}, deploy {run['deploy_status']}"
+                error = run.get("error") or run.get("deploy_error")
+                print(f"  {scenario_key(scenario)} #{repeat + 1}: {status} in {run.get('wall_seconds', 0):.2f}s" + (f" ({error})" if error else ""))
+            raw.extend(runs)
+            results.append(aggregate(runs))
+    finally:
+        shutil.rmtree(work_root, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {scenario_key(result["scenario"]): result for result in json.load(f)["results"]}
+    print()
+    print_table(results, baseline)
+
+    report = {
+        "commit": commit,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("run_scenario", "result_file", "output", "compare", "verbose")},
+        "results": results,
+        "runs": raw,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
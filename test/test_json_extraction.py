@@ -0,0 +1,55 @@
+# JSON抽出（agents/json_extraction.py）の壊れたレスポンスからの取り出しを確認するテストスクリプト
+# 閉じない・デコードできないオブジェクトがあっても、その中や後ろにある有効なオブジェクトを取り出せることを確認します
+#   python test/test_json_extraction.py
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from agents.json_extraction import IncrementalJSONExtractor, iter_json_objects, robust_json_parser
+
+
+def test_unclosed_object():
+    """閉じない {" の後ろにあるオブジェクトを取り出す"""
+    assert list(iter_json_objects('{"a": 1, {"b":2}')) == [{"b": 2}]
+    assert list(iter_json_objects('{"broken": [1, 2\n```json\n{"score": 90, "feedback": "ok", "passed": true}\n```')) == [
+        {"score": 90, "feedback": "ok", "passed": True}
+    ]
+
+
+def test_undecodable_object():
+    """括弧は閉じているがデコードできないオブジェクトの中のオブジェクトを取り出す"""
+    assert list(iter_json_objects('{"a": 1, {"b":2}}')) == [{"b": 2}]
+    assert list(iter_json_objects('{"files": [{"name": "page.tsx"},]} {"c": 3}')) == [{"name": "page.tsx"}, {"c": 3}]
+
+
+def test_valid_objects_unchanged():
+    """有効なオブジェクトは入れ子を分解せずにそのまま返す"""
+    text = 'prefix {"a": {"b": "{\\"c\\": 1}"}} middle {"d": []}'
+    assert list(iter_json_objects(text)) == [{"a": {"b": '{"c": 1}'}}, {"d": []}]
+
+
+def test_streamed_chunks():
+    """チャンクに分けてfeedしても同じ結果になる"""
+    text = '{"a": 1, {"b":2}} {"c": {"d": 3}} {"e": '
+    extractor = IncrementalJSONExtractor()
+    objects = []
+    for i in range(0, len(text), 3):
+        objects.extend(extractor.feed(text[i:i + 3]))
+    objects.extend(extractor.finish())
+    assert objects == [{"b": 2}, {"c": {"d": 3}}], objects
+
+
+def test_robust_json_parser():
+    """最後の手段のrobust_json_parserでも壊れたラッパーの後ろのレビューを取り出す"""
+    content = 'Review: {"summary": "unterminated {"score": 72, "feedback": "fix nav", "passed": false}'
+    assert robust_json_parser(content, required_fields=["score", "feedback", "passed"], label="test") == {
+        "score": 72, "feedback": "fix nav", "passed": False
+    }
+
+
+if __name__ == "__main__":
+    test_unclosed_object()
+    test_undecodable_object()
+    test_valid_objects_unchanged()
+    test_streamed_chunks()
+    test_robust_json_parser()
+    print("[INFO]test_json_extraction.py passed")
@@ -0,0 +1,49 @@
+# バッチレビューのレスポンスの対応付けを確認するテストスクリプト
+# 同じslugのページ候補（PAGE_CANDIDATES > 1）が同じバッチに入った場合に、各候補が自分のレビューを受け取ることを確認します
+#   python test/test_review_batcher.py
+import sys
+import os
+import json
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from agents.llm_client import LLMResponse
+from agents.review_batcher import BatchReviewResult, _ReviewRequest, _parse_batch_response
+
+
+def _requests(slugs):
+    return [_ReviewRequest(f"// page {i}", "", {"page_spec": {"slug": slug}}, f"prompt {i}") for i, slug in enumerate(slugs)]
+
+
+async def test_same_slug_candidates():
+    """同じslugの2候補がindexでそれぞれのレビューに対応付けられる（レビューの順序が逆でも）"""
+    requests = _requests(["about", "about"])
+    content = json.dumps({"reviews": [
+        {"index": 2, "slug": "about", "score": 50, "feedback": "candidate 2", "passed": False},
+        {"index": 1, "slug": "about", "score": 90, "feedback": "candidate 1", "passed": True},
+    ]})
+    for response in (LLMResponse(content, "test"), LLMResponse(content, "test", parsed=BatchReviewResult(**json.loads(content)))):
+        results = _parse_batch_response(response, requests)
+        assert results[0]["feedback"] == "candidate 1" and results[0]["passed"], results
+        assert results[1]["feedback"] == "candidate 2" and not results[1]["passed"], results
+
+
+async def test_slug_fallback_only_for_unique_slugs():
+    """indexがないレビューは、slugがバッチ内で一意な依頼にだけslugで対応付ける（残りは個別レビューに回す）"""
+    requests = _requests(["about", "about", "contact"])
+    content = json.dumps({"reviews": [
+        {"slug": "contact", "score": 85, "feedback": "contact", "passed": True},
+        {"slug": "about", "score": 70, "feedback": "about", "passed": False},
+    ]})
+    results = _parse_batch_response(LLMResponse(content, "test"), requests)
+    assert set(results) == {2}, results
+    assert results[2]["feedback"] == "contact", results
+
+
+async def main():
+    await test_same_slug_candidates()
+    await test_slug_fallback_only_for_unique_slugs()
+    print("[INFO]test_review_batcher.py passed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from logger import Logger
+from config import Config
+from tools.package_store import link_project_packages
+from tools.node_toolchain import get_node_toolchain
+logger = Logger(log_level="INFO")
+
+# create-next-appのオプション（プロジェクト名以外は毎回同じ）
+CREATE_NEXT_APP_ARGS = [
+    "--use-npm", "--no-git", "--typescript", "--eslint",
+    "--app", "--tailwind", "--no-src-dir", "--no-import-alias", "--yes"
+]
+# 雛形を作成するときのプロジェクト名（コピー時にpackage.json / package-lock.jsonのnameを書き換える）
+TEMPLATE_PROJECT_NAME = "nextjs_template"
+MANIFEST_NAME = "manifest.json"
+SKELETON_DIR = "skeleton"
+# チェックサムを記録するnode_modules内のファイル（npmがインストール済みの依存ツリーを記録する隠しロックファイル）
+_NODE_MODULES_LOCK = os.path.join("node_modules", ".package-lock.json")
+# コピー後にnameを書き換えるファイル（ハードリンクにせず必ず実体をコピーする）
+_NAMED_FILES = ("package.json", "package-lock.json")
+# node_modules直下のnpm・ツールのメタデータのうち、ハードリンクにしてよいもの（.binはシンボリックリンクのみ）
+_LINKABLE_METADATA = (".bin",)
+
+
+class TemplateCacheError(Exception):
+    """雛形の作成・検証・コピーに失敗した場合の例外（呼び出し側はnpxでの作成にフォールバックする）"""
+    pass
+
+
+def create_next_app_command(project_name: str, version: Optional[str] = None) -> List[str]:
+    """create-next-appのコマンド（バージョンは指定がなければCREATE_NEXT_APP_VERSION。npxは解決済みのツールチェーンのもの）"""
+    return get_node_toolchain().command("npx", f"create-next-app@{version or Config.CREATE_NEXT_APP_VERSION}", project_name, *CREATE_NEXT_APP_ARGS)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _checksums(skeleton: str) -> Dict[str, str]:
+    """node_modules以外の全ファイルと、node_modules/.package-lock.jsonのチェックサム"""
+    checksums = {}
+    for root, dirs, files in os.walk(skeleton):
+        dirs[:] = sorted(d for d in dirs if not (root == skeleton and d == "node_modules"))
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                checksums[os.path.relpath(path, skeleton).replace(os.sep, "/")] = _sha256(path)
+    lock_path = os.path.join(skeleton, _NODE_MODULES_LOCK)
+    if os.path.isfile(lock_path):
+        checksums[_NODE_MODULES_LOCK.replace(os.sep, "/")] = _sha256(lock_path)
+    return checksums
+
+
+def _rename_project(project_path: str, project_name: str) -> None:
+    """コピーした雛形のpackage.json / package-lock.jsonのプロジェクト名を書き換える"""
+    for name in _NAMED_FILES:
+        path = os.path.join(project_path, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        data["name"] = project_name
+        if isinstance(data.get("packages", {}).get(""), dict):
+            data["packages"][""]["name"] = project_name
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.write("\n")
+
+
+def _reflink_tree(src: str, dst: str) -> None:
+    """copy-on-writeのクローン（btrfs / XFS / APFS）。対応していないファイルシステムではCalledProcessError"""
+    if sys.platform == "darwin":
+        cmd = ["cp", "-c", "-R", src + "/.", dst]
+    elif sys.platform.startswith("linux"):
+        cmd = ["cp", "-a", "--reflink=always", src + "/.", dst]
+    else:
+        raise TemplateCacheError(f"reflink copy is not supported on {sys.platform}")
+    os.makedirs(dst, exist_ok=True)
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+
+def _written_in_place(relpath: str) -> bool:
+    """
+    node_modules内のファイルのうち、npmなどがその場で書き換えるもの（node_modules/.package-lock.json、.cacheなど）か。
+    パッケージのファイルはnpmが別ファイルに書いてからrenameで置き換えるため、ハードリンクのままでも雛形は変わらない
+    """
+    parts = relpath.replace(os.sep, "/").split("/")
+    return any(part == "node_modules" and i + 1 < len(parts) and parts[i + 1].startswith(".") and parts[i + 1] not in _LINKABLE_METADATA
+               for i, part in enumerate(parts))
+
+
+def _copy_tree(src: str, dst: str, link_node_modules: bool) -> str:
+    """
+    雛形をコピーする。link_node_modules=Trueの場合、node_modules内のパッケージのファイルはハードリンクにする
+    （プロジェクト側で書き換えるapp/ やpackage.json、npmがその場で書き換えるnode_modules/.package-lock.jsonなどは常に実体をコピーする）。
+    ハードリンクできない場合（別デバイスなど）は通常のコピーに切り替える。使った方式を返す
+    """
+    mode = {"value": "hardlink" if link_node_modules else "copy"}
+
+    def link_or_copy(source, target):
+        if mode["value"] == "hardlink" and not _written_in_place(os.path.relpath(source, src)):
+            try:
+                os.link(source, target)
+                return target
+            except OSError as e:
+                logger.warning(f"[NextjsTemplateCache] Hardlink failed ({e}), copying node_modules instead")
+                mode["value"] = "copy"
+        return shutil.copy2(source, target)
+
+    shutil.copytree(src, dst, symlinks=True, dirs_exist_ok=True,
+                    ignore=lambda directory, names: ["node_modules"] if os.path.samefile(directory, src) else [])
+    node_modules = os.path.join(src, "node_modules")
+    if os.path.isdir(node_modules):
+        shutil.copytree(node_modules, os.path.join(dst, "node_modules"), symlinks=True, dirs_exist_ok=True, copy_function=link_or_copy)
+    return mode["value"]
+
+
+class NextjsTemplateCache:
+    """
+    create-next-appで作成したプロジェクトの雛形（node_modules込み）をバージョン・オプション・Node.jsのバージョンごとに
+    1回だけ作成してキャッシュし、新規プロジェクトはそこからコピーして作成する。
+    - キャッシュ: <cache_dir>/create-next-app-<version>-<key>/{manifest.json, skeleton/}
+    - manifest.jsonには作成条件のキーとファイルのチェックサムを記録し、一致しない場合（バージョン変更・破損）は作り直す
+    - コピー方式（NEXTJS_TEMPLATE_COPY_MODE）: auto = reflink -> node_modulesのハードリンク -> 通常コピーの順に試す
+    """
+
+    def __init__(self, cache_dir: str, version: str, copy_mode: str = "auto"):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.copy_mode = copy_mode
+        self._lock = threading.Lock()
+
+    @property
+    def node_version(self) -> str:
+        return get_node_toolchain().version
+
+    @property
+    def key(self) -> str:
+        """作成条件（create-next-appのバージョン・オプション・Node.jsのバージョン）のハッシュ"""
+        source = json.dumps({"version": self.version, "args": CREATE_NEXT_APP_ARGS, "node": self.node_version}, sort_keys=True)
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def template_dir(self) -> str:
+        return os.path.join(self.cache_dir, f"create-next-app-{self.version}-{self.key}")
+
+    @property
+    def skeleton_path(self) -> str:
+        return os.path.join(self.template_dir, SKELETON_DIR)
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.template_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_valid(self) -> bool:
+        """キャッシュ済みの雛形が作成条件とチェックサムに一致するか"""
+        manifest = self._read_manifest()
+        if manifest is None or manifest.get("key") != self.key or not os.path.isdir(self.skeleton_path):
+            return False
+        try:
+            checksums = _checksums(self.skeleton_path)
+        except OSError:
+            return False
+        if checksums != manifest.get("checksums"):
+            logger.warning(f"[NextjsTemplateCache] Checksum mismatch in {self.template_dir}, template will be rebuilt")
+            return False
+        return True
+
+    def invalidate(self) -> None:
+        """キャッシュ済みの雛形を削除する（次回のensure()で作り直す）"""
+        if os.path.exists(self.template_dir):
+            logger.info(f"[NextjsTemplateCache] Removing template {self.template_dir}")
+            shutil.rmtree(self.template_dir, ignore_errors=True)
+
+    def build(self) -> str:
+        """create-next-appで雛形を作成し、チェックサムを記録してキャッシュに配置する。雛形のパスを返す"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 作業ディレクトリで作成してから1回のrenameで配置する（他プロセスが途中の雛形を使わないように）
+        staging = os.path.join(self.cache_dir, f".staging-{uuid.uuid4().hex[:8]}")
+        os.makedirs(staging)
+        started = time.perf_counter()
+        try:
+            cmd = create_next_app_command(TEMPLATE_PROJECT_NAME, self.version)
+            logger.info(f"[NextjsTemplateCache] Building template: {' '.join(cmd)}")
+            subprocess.run(cmd, cwd=staging, capture_output=True, text=True, check=True, env=get_node_toolchain().env({"CI": "true"}))
+            os.rename(os.path.join(staging, TEMPLATE_PROJECT_NAME), os.path.join(staging, SKELETON_DIR))
+            skeleton = os.path.join(staging, SKELETON_DIR)
+            if not os.path.exists(os.path.join(skeleton, "package.json")) or not os.path.isdir(os.path.join(skeleton, "app")):
+                raise TemplateCacheError(f"create-next-app did not produce a complete project in {skeleton}")
+            # 雛形のnode_modulesをパッケージストアに取り込む（雛形からハードリンクしたプロジェクトもストアを共有する）
+            link_project_packages(skeleton)
+            manifest = {
+                "key": self.key,
+                "create_next_app_version": self.version,
+                "args": CREATE_NEXT_APP_ARGS,
+                "node_version": self.node_version,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "checksums": _checksums(skeleton),
+            }
+            with open(os.path.join(staging, MANIFEST_NAME), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            if os.path.exists(self.template_dir):
+                shutil.rmtree(self.template_dir, ignore_errors=True)
+            try:
+                os.rename(staging, self.template_dir)
+            except OSError:
+                # 他プロセスが同時に作成して先に配置した場合はそちらを使う
+                if not self.is_valid():
+                    raise
+            logger.info(f"[NextjsTemplateCache] Template ready at {self.template_dir} ({time.perf_counter() - started:.1f}s)")
+            return self.skeleton_path
+        except subprocess.CalledProcessError as e:
+            raise TemplateCacheError(f"create-next-app failed with exit code {e.returncode}: {e.stderr}") from e
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def ensure(self) -> str:
+        """有効な雛形がなければ作成する。雛形のパスを返す"""
+        with self._lock:
+            if self.is_valid():
+                return self.skeleton_path
+            return self.build()
+
+    def materialize(self, project_path: str, project_name: str) -> Dict:
+        """雛形から新規プロジェクトを作成する（project_pathは存在しないか空であること）"""
+        skeleton = self.ensure()
+        if os.path.isdir(project_path) and os.listdir(project_path):
+            raise TemplateCacheError(f"Project path is not empty: {project_path}")
+        started = time.perf_counter()
+        mode = None
+        if self.copy_mode in ("auto", "reflink"):
+            try:
+                _reflink_tree(skeleton, project_path)
+                mode = "reflink"
+            except (OSError, subprocess.CalledProcessError, TemplateCacheError) as e:
+                if self.copy_mode == "reflink":
+                    raise TemplateCacheError(f"reflink copy failed: {e}") from e
+                shutil.rmtree(project_path, ignore_errors=True)
+        if mode is None:
+            mode = _copy_tree(skeleton, project_path, link_node_modules=self.copy_mode in ("auto", "hardlink"))
+        _rename_project(project_path, project_name)
+        seconds = time.perf_counter() - started
+        logger.info(f"[NextjsTemplateCache] Materialized {project_name} from template ({mode}, {seconds:.2f}s)")
+        return {"template_dir": self.template_dir, "copy_mode": mode, "seconds": round(seconds, 3)}
+
+
+_template_cache = None
+_template_cache_lock = threading.Lock()
+
+
+def get_template_cache() -> NextjsTemplateCache:
+    """Configに基づくプロセス共通の雛形キャッシュを取得する"""
+    global _template_cache
+    if _template_cache is None:
+        with _template_cache_lock:
+            if _template_cache is None:
+                cache_dir = Config.NEXTJS_TEMPLATE_CACHE_DIR
+                if not os.path.isabs(cache_dir):
+                    # プロジェクトルートからの絶対パスを構築
+                    cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), cache_dir)
+                copy_mode = Config.NEXTJS_TEMPLATE_COPY_MODE
+                if Config.PACKAGE_STORE_ENABLED and copy_mode == "auto":
+                    # reflinkはファイルごとにinodeを作るので、パッケージストアを使う場合はハードリンクで共有する
+                    copy_mode = "hardlink"
+                _template_cache = NextjsTemplateCache(cache_dir, Config.CREATE_NEXT_APP_VERSION, copy_mode)
+    return _template_cache
+
+
+if __name__ == "__main__":
+    # 雛形を事前に作成する（デプロイ時やcreate-next-appのバージョン更新時）
+    #   python tools/nextjs_template_cache.py [--rebuild]
+    parser = argparse.ArgumentParser(description="Build or verify the cached Next.js project template")
+    parser.add_argument("--rebuild", action="store_true", help="discard the cached template and build it again")
+    args = parser.parse_args()
+    cache = get_template_cache()
+    if args.rebuild:
+        cache.invalidate()
+    print(cache.ensure())
@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import shutil
+import threading
+import subprocess
+from typing import Dict, List, Optional
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from logger import Logger
+from config import Config
+logger = Logger(log_level="INFO")
+
+
+class NodeToolchain:
+    """
+    解決済みのnode / npm / npxの絶対パスと、それらを実行するための環境変数。
+    サブプロセス（create-next-app、npm install、npm run dev、npm run build）はcommand()とenv()で起動する
+    """
+
+    def __init__(self, node: str, npm: str, npx: str, bin_dir: Optional[str], version: str, source: str, validated: bool):
+        self.node = node
+        self.npm = npm
+        self.npx = npx
+        # PATHの先頭に追加するディレクトリ（npmが内部で起動するnodeも同じバージョンにするため）
+        self.bin_dir = bin_dir
+        self.version = version
+        self.source = source
+        self.validated = validated
+        self.resolve_seconds = 0.0
+
+    def command(self, tool: str, *args: str) -> List[str]:
+        """tool（"node" / "npm" / "npx"）を解決済みの絶対パスで実行するコマンド"""
+        return [getattr(self, tool)] + list(args)
+
+    def env(self, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """サブプロセスに渡す環境変数（現在の環境変数 + bin_dirを先頭にしたPATH + extra）"""
+        env = dict(os.environ)
+        if self.bin_dir:
+            env["PATH"] = self.bin_dir + os.pathsep + env.get("PATH", "")
+        if extra:
+            env.update(extra)
+        return env
+
+    def snapshot(self) -> Dict:
+        return {
+            "node": self.node,
+            "npm": self.npm,
+            "npx": self.npx,
+            "version": self.version,
+            "source": self.source,
+            "validated": self.validated,
+            "resolve_seconds": round(self.resolve_seconds, 3),
+        }
+
+
+def _run(cmd: List[str], env: Dict[str, str], timeout: float) -> Optional[str]:
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, env=env)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    lines = result.stdout.strip().splitlines()
+    return lines[-1].strip() if lines else None
+
+
+def _from_bin_dir(bin_dir: str, source: str) -> Optional[NodeToolchain]:
+    """bin_dir内のnode / npm / npxから作成する（npm / npxがない場合はNone）"""
+    tools = {name: shutil.which(name, path=bin_dir) for name in ("node", "npm", "npx")}
+    if not all(tools.values()):
+        return None
+    return NodeToolchain(tools["node"], tools["npm"], tools["npx"], bin_dir, "unknown", source, False)
+
+
+def _from_nvm(version_spec: str) -> Optional[NodeToolchain]:
+    """nvmでインストール済みのバージョンを探す（なければ1回だけnvm installする）"""
+    nvm_dir = os.environ.get("NVM_DIR")
+    if not nvm_dir or not os.path.exists(os.path.join(nvm_dir, "nvm.sh")):
+        return None
+    script = (f'source "$NVM_DIR/nvm.sh" >/dev/null 2>&1 && '
+              f'(nvm which "{version_spec}" || (nvm install "{version_spec}" >/dev/null 2>&1 && nvm which "{version_spec}"))')
+    logger.info(f"[NodeToolchain] Resolving Node.js {version_spec} via nvm")
+    node = _run(["bash", "-c", script], dict(os.environ), timeout=600)
+    if not node or not os.path.isfile(node):
+        return None
+    return _from_bin_dir(os.path.dirname(node), "nvm")
+
+
+def _from_path() -> Optional[NodeToolchain]:
+    """PATH上のnode / npm / npx（それぞれ個別に探す）"""
+    tools = {name: shutil.which(name) for name in ("node", "npm", "npx")}
+    if not tools["npm"] or not tools["npx"]:
+        return None
+    return NodeToolchain(tools["node"] or "node", tools["npm"], tools["npx"], None, "unknown", "path", False)
+
+
+def _validate(toolchain: NodeToolchain) -> bool:
+    """node -v / npm -vが実行できることを確認し、バージョンを記録する"""
+    env = toolchain.env()
+    version = _run([toolchain.node, "-v"], env, timeout=30)
+    npm_version = _run([toolchain.npm, "-v"], env, timeout=60)
+    if not version or not npm_version:
+        return False
+    toolchain.version = version
+    toolchain.validated = True
+    logger.info(f"[NodeToolchain] Using Node.js {version} / npm {npm_version} from {toolchain.source} ({toolchain.node})")
+    return True
+
+
+def resolve_node_toolchain() -> NodeToolchain:
+    """
+    node / npm / npxを次の順に探し、実行できることを確認したものを返す。
+    NODE_BIN_DIR -> nvm（NODE_VERSION、未インストールの場合のみnvm install）-> PATH
+    どれも確認できない場合はコマンド名のまま（PATHで解決）のものを返す
+    """
+    started = time.perf_counter()
+    candidates = []
+    if Config.NODE_BIN_DIR:
+        candidates.append(lambda: _from_bin_dir(Config.NODE_BIN_DIR, "config"))
+    if Config.NODE_VERSION:
+        candidates.append(lambda: _from_nvm(Config.NODE_VERSION))
+    candidates.append(_from_path)
+    toolchain = None
+    for candidate in candidates:
+        resolved = candidate()
+        if resolved is None:
+            continue
+        if _validate(resolved):
+            toolchain = resolved
+            break
+        logger.warning(f"[NodeToolchain] Node.js from {resolved.source} failed validation ({resolved.node})")
+        if resolved.source == "path":
+            # nodeは実行できないがnpm / npxはある（ラッパーなど）。検証なしでそのまま使う
+            toolchain = resolved
+    if toolchain is None:
+        logger.warning("[NodeToolchain] No usable Node.js toolchain found, falling back to PATH lookup at run time")
+        toolchain = NodeToolchain("node", "npm", "npx", None, "unknown", "fallback", False)
+    toolchain.resolve_seconds = time.perf_counter() - started
+    return toolchain
+
+
+_node_toolchain = None
+_node_toolchain_lock = threading.Lock()
+
+
+def get_node_toolchain() -> NodeToolchain:
+    """プロセス内で1回だけ解決したNode.jsツールチェーンを取得する"""
+    global _node_toolchain
+    if _node_toolchain is None:
+        with _node_toolchain_lock:
+            if _node_toolchain is None:
+                _node_toolchain = resolve_node_toolchain()
+    return _node_toolchain
+
+
+if __name__ == "__main__":
+    # 解決されるツールチェーンを確認する
+    #   python tools/node_toolchain.py
+    print(json.dumps(get_node_toolchain().snapshot(), indent=2))
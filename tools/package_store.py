@@ -0,0 +1,276 @@
+import os
+import sys
+import json
+import stat
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from logger import Logger
+from config import Config
+logger = Logger(log_level="INFO")
+
+FILES_DIR = "files"
+INDEX_DIR = "index"
+
+
+class PackageStoreError(Exception):
+    """パッケージストアに取り込めない場合の例外（ハードリンクできないファイルシステムなど）"""
+    pass
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_package_json(package_dir: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(package_dir, "package.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else None
+    except (OSError, ValueError):
+        return None
+
+
+def _iter_packages(node_modules: str) -> Iterator[str]:
+    """node_modules内のパッケージディレクトリ（@scope/name、入れ子のnode_modulesを含む）"""
+    try:
+        entries = sorted(os.scandir(node_modules), key=lambda entry: entry.name)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.startswith(".") or not entry.is_dir(follow_symlinks=False):
+            continue
+        if entry.name.startswith("@"):
+            candidates = [scoped.path for scoped in sorted(os.scandir(entry.path), key=lambda e: e.name) if scoped.is_dir(follow_symlinks=False)]
+        else:
+            candidates = [entry.path]
+        for package_dir in candidates:
+            yield package_dir
+            nested = os.path.join(package_dir, "node_modules")
+            if os.path.isdir(nested):
+                yield from _iter_packages(nested)
+
+
+def _package_files(package_dir: str) -> Dict[str, os.stat_result]:
+    """パッケージ内の通常ファイル（入れ子のnode_modulesとシンボリックリンクは除く）の相対パスとstat"""
+    files = {}
+    for root, dirs, names in os.walk(package_dir):
+        if root == package_dir:
+            dirs[:] = [d for d in dirs if d != "node_modules"]
+        for name in names:
+            path = os.path.join(root, name)
+            st = os.lstat(path)
+            if stat.S_ISREG(st.st_mode):
+                files[os.path.relpath(path, package_dir).replace(os.sep, "/")] = st
+    return files
+
+
+class PackageStore:
+    """
+    生成したプロジェクトのnode_modulesのファイルを内容のハッシュで1つだけ保存し、各プロジェクトからはハードリンクで参照する
+    （サイト数ではなくパッケージの種類数に応じたディスク使用量・inode数にする）。
+    - ファイル: <store_dir>/files/<sha256の先頭2文字>/<sha256>[-x]（-xは実行権限付き。ハードリンクは権限を共有するため分ける）
+    - 索引: <store_dir>/index/<name>@<version>.json（パッケージ内の相対パス -> ファイル名）。
+      取り込み済みのパッケージはinodeの比較だけで済ませ、ハッシュを計算しない
+    - プロジェクトから参照されなくなったファイルはリンク数が1（ストアのみ）になるので、gc()でそれを削除する
+    ストアとプロジェクトは同じファイルシステム上に置くこと（ハードリンクできない場合はPackageStoreError）
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.files_dir = os.path.join(store_dir, FILES_DIR)
+        self.index_dir = os.path.join(store_dir, INDEX_DIR)
+
+    def _blob_path(self, blob: str) -> str:
+        return os.path.join(self.files_dir, blob[:2], blob)
+
+    def _index_path(self, name: str, version: str) -> str:
+        return os.path.join(self.index_dir, f"{name.replace('/', '+')}@{version}.json")
+
+    def _read_index(self, name: str, version: str) -> Optional[Dict[str, str]]:
+        try:
+            with open(self._index_path(name, version), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_index(self, name: str, version: str, entries: Dict[str, str]) -> None:
+        path = self._index_path(name, version)
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f, sort_keys=True)
+        os.replace(tmp, path)
+
+    def _is_linked(self, files: Dict[str, os.stat_result], entries: Optional[Dict[str, str]]) -> bool:
+        """パッケージの全ファイルが索引どおりのストアのファイルとinodeを共有しているか"""
+        if not entries or set(files) != set(entries):
+            return False
+        for relpath, st in files.items():
+            try:
+                blob_stat = os.lstat(self._blob_path(entries[relpath]))
+            except OSError:
+                return False
+            if (blob_stat.st_dev, blob_stat.st_ino) != (st.st_dev, st.st_ino):
+                return False
+        return True
+
+    def _link_file(self, path: str, st: os.stat_result, stats: Dict) -> str:
+        """ファイルをストアに取り込み（未登録の場合）、プロジェクト側をストアのファイルへのハードリンクに置き換える"""
+        blob = _sha256(path) + ("-x" if st.st_mode & stat.S_IXUSR else "")
+        blob_path = self._blob_path(blob)
+        try:
+            blob_stat = os.lstat(blob_path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            try:
+                # プロジェクトのファイルをそのままストアのファイルにする（コピーしない）
+                os.link(path, blob_path)
+                stats["new_files"] += 1
+                stats["new_bytes"] += st.st_size
+                return blob
+            except FileExistsError:
+                # 他のプロセスが同時に登録した
+                blob_stat = os.lstat(blob_path)
+        if (blob_stat.st_dev, blob_stat.st_ino) != (st.st_dev, st.st_ino):
+            tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex[:8]}.link")
+            os.link(blob_path, tmp)
+            os.replace(tmp, path)
+            stats["linked_files"] += 1
+            stats["saved_bytes"] += st.st_size
+        return blob
+
+    def link_project(self, project_path: str) -> Dict:
+        """
+        プロジェクトのnode_modules内のパッケージをストアに取り込み、ハードリンクに置き換える。
+        npm installの後に呼ぶと、追加されたパッケージだけがハッシュ計算の対象になる
+        """
+        node_modules = os.path.join(project_path, "node_modules")
+        stats = {"packages": 0, "packages_linked": 0, "new_files": 0, "new_bytes": 0, "linked_files": 0, "saved_bytes": 0}
+        if not os.path.isdir(node_modules):
+            return stats
+        started = time.perf_counter()
+        os.makedirs(self.files_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+        for package_dir in _iter_packages(node_modules):
+            package = _read_package_json(package_dir)
+            if package is None:
+                continue
+            stats["packages"] += 1
+            name, version = package.get("name"), package.get("version")
+            files = _package_files(package_dir)
+            indexed = bool(name and version)
+            if indexed and self._is_linked(files, self._read_index(name, version)):
+                continue
+            try:
+                entries = {relpath: self._link_file(os.path.join(package_dir, relpath), st, stats) for relpath, st in files.items()}
+            except OSError as e:
+                raise PackageStoreError(f"Cannot hardlink {package_dir} into {self.store_dir}: {e}") from e
+            if indexed:
+                self._write_index(name, version, entries)
+            stats["packages_linked"] += 1
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        logger.info(f"[PackageStore] Linked {project_path}: {stats['packages_linked']}/{stats['packages']} packages, "
+                    f"{stats['new_files']} new files, {stats['saved_bytes'] / 1024 / 1024:.1f}MB deduplicated ({stats['seconds']}s)")
+        return stats
+
+    def _iter_blobs(self) -> Iterator[Tuple[str, os.stat_result]]:
+        if not os.path.isdir(self.files_dir):
+            return
+        for prefix in os.listdir(self.files_dir):
+            directory = os.path.join(self.files_dir, prefix)
+            for blob in os.listdir(directory):
+                try:
+                    yield os.path.join(directory, blob), os.lstat(os.path.join(directory, blob))
+                except OSError:
+                    continue
+
+    def gc(self) -> Dict:
+        """どのプロジェクト（雛形を含む）からも参照されていないファイルと、それを含むパッケージの索引を削除する"""
+        removed_files, removed_bytes = 0, 0
+        for path, st in self._iter_blobs():
+            if st.st_nlink <= 1:
+                try:
+                    os.remove(path)
+                    removed_files += 1
+                    removed_bytes += st.st_size
+                except OSError:
+                    continue
+        removed_packages = 0
+        if os.path.isdir(self.index_dir):
+            for name in os.listdir(self.index_dir):
+                path = os.path.join(self.index_dir, name)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        entries = json.load(f)
+                except (OSError, ValueError):
+                    entries = None
+                if entries is None or not all(os.path.exists(self._blob_path(blob)) for blob in entries.values()):
+                    os.remove(path)
+                    removed_packages += 1
+        result = {"removed_files": removed_files, "removed_bytes": removed_bytes, "removed_packages": removed_packages}
+        logger.info(f"[PackageStore] GC removed {removed_packages} packages, {removed_files} files ({removed_bytes / 1024 / 1024:.1f}MB)")
+        return result
+
+    def stats(self) -> Dict:
+        """ストアのパッケージ数・ファイル数・サイズ（参照数は各ファイルのリンク数 - 1）"""
+        files, size, references = 0, 0, 0
+        for _, st in self._iter_blobs():
+            files += 1
+            size += st.st_size
+            references += st.st_nlink - 1
+        packages = len(os.listdir(self.index_dir)) if os.path.isdir(self.index_dir) else 0
+        return {"packages": packages, "files": files, "bytes": size, "references": references}
+
+
+_package_store = None
+_package_store_lock = threading.Lock()
+
+
+def get_package_store() -> PackageStore:
+    """Configに基づくプロセス共通のパッケージストアを取得する"""
+    global _package_store
+    if _package_store is None:
+        with _package_store_lock:
+            if _package_store is None:
+                store_dir = Config.PACKAGE_STORE_DIR
+                if not os.path.isabs(store_dir):
+                    # プロジェクトルートからの絶対パスを構築
+                    store_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), store_dir)
+                _package_store = PackageStore(store_dir)
+    return _package_store
+
+
+def link_project_packages(project_path: str) -> Optional[Dict]:
+    """PACKAGE_STORE_ENABLEDの場合にプロジェクトをストアに取り込む。失敗してもプロジェクトはそのまま使えるので警告のみ"""
+    if not Config.PACKAGE_STORE_ENABLED:
+        return None
+    try:
+        return get_package_store().link_project(project_path)
+    except Exception as e:
+        logger.warning(f"[PackageStore] Could not link {project_path} into the package store: {e}")
+        return {"error": str(e)}
+
+
+if __name__ == "__main__":
+    #   python tools/package_store.py gc                 参照されなくなったパッケージを削除
+    #   python tools/package_store.py stats
+    #   python tools/package_store.py link <project>...  既存のプロジェクトをストアに取り込む
+    parser = argparse.ArgumentParser(description="Manage the shared node_modules package store")
+    parser.add_argument("command", choices=["gc", "stats", "link"])
+    parser.add_argument("projects", nargs="*", help="project directories for the link command")
+    args = parser.parse_args()
+    store = get_package_store()
+    if args.command == "gc":
+        print(json.dumps(store.gc(), indent=2))
+    elif args.command == "link":
+        for project in args.projects:
+            print(json.dumps(store.link_project(os.path.abspath(project)), indent=2))
+    print(json.dumps(store.stats(), indent=2))
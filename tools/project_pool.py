@@ -0,0 +1,210 @@
+import os
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from logger import Logger
+from config import Config
+logger = Logger(log_level="INFO")
+
+# プールのディレクトリ（OUTPUT_DIR内）。create-next-appのバージョンごとに分け、他のバージョンのプールは起動時に削除する
+POOL_DIR_NAME = ".project_pool"
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # Windowsではos.kill(pid, 0)がプロセスを終了させるため確認しない（作成途中のディレクトリを消さない側に倒す）
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _disk_usage(path: str) -> int:
+    """ディスク上の使用量（同じinodeのハードリンクは1回だけ数える）"""
+    total = 0
+    seen = set()
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            key = (stat.st_dev, stat.st_ino)
+            if key in seen:
+                continue
+            seen.add(key)
+            total += getattr(stat, "st_blocks", 0) * 512 or stat.st_size
+    return total
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+class ProjectPool:
+    """
+    作成済みのNext.jsプロジェクト（nextjs_site_*）をsize個まで事前に用意しておき、setup_nextjs_projectに即座に渡す。
+    - <output_dir>/.project_pool/<version>/building/<pid>/<name> で作成し、完成したら ready/<name> にrenameする
+    - claim()は ready/<name> を <output_dir>/<name> にrenameして取り出す（renameは原子的なため、複数プロセスで同じものを取らない）
+    - 取り出し・取り出し失敗のたびにバックグラウンド（refill_concurrency並列）で補充する。
+      プールのディスク使用量がmax_disk_bytesを超える場合は補充しない
+    """
+
+    def __init__(self, output_dir_path: str, version: str, size: int, refill_concurrency: int, max_disk_bytes: int):
+        self.output_dir_path = output_dir_path
+        self.root = os.path.join(output_dir_path, POOL_DIR_NAME)
+        self.pool_dir = os.path.join(self.root, version)
+        self.ready_dir = os.path.join(self.pool_dir, "ready")
+        self.building_dir = os.path.join(self.pool_dir, "building", str(os.getpid()))
+        self.size = size
+        self.max_disk_bytes = max_disk_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max(1, refill_concurrency), thread_name_prefix="project-pool")
+        self._lock = threading.Lock()
+        self._building = 0
+        # 統計（snapshot()で参照）
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.build_failures = 0
+        self.build_seconds = 0.0
+        self.skipped_for_disk = 0
+        self._cleanup()
+
+    def _cleanup(self) -> None:
+        """他のバージョンのプールと、終了済みプロセスが作成途中だったディレクトリを削除する"""
+        os.makedirs(self.ready_dir, exist_ok=True)
+        os.makedirs(self.building_dir, exist_ok=True)
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if path != self.pool_dir and os.path.isdir(path):
+                logger.info(f"[ProjectPool] Removing pool for another create-next-app version: {path}")
+                shutil.rmtree(path, ignore_errors=True)
+        building_root = os.path.dirname(self.building_dir)
+        for name in os.listdir(building_root):
+            if name.isdigit() and int(name) != os.getpid() and not _pid_alive(int(name)):
+                shutil.rmtree(os.path.join(building_root, name), ignore_errors=True)
+        # 前回のプロセスが残した準備済みプロジェクトも上限の計算に含める
+        self._disk_bytes = _disk_usage(self.pool_dir)
+        self._project_bytes = self._disk_bytes // self.ready_count() if self.ready_count() else 0
+
+    def ready_count(self) -> int:
+        try:
+            return len(os.listdir(self.ready_dir))
+        except OSError:
+            return 0
+
+    def claim(self) -> Optional[Tuple[str, str]]:
+        """準備済みのプロジェクトを1つ取り出す。(project_name, project_path)、なければNone"""
+        from tools.setup_nextjs_project import is_setup_done
+        try:
+            # 古いものから使う
+            names = sorted(os.listdir(self.ready_dir), key=lambda name: _mtime(os.path.join(self.ready_dir, name)))
+        except OSError:
+            names = []
+        claimed = None
+        for name in names:
+            target = os.path.join(self.output_dir_path, name)
+            try:
+                os.rename(os.path.join(self.ready_dir, name), target)
+            except OSError:
+                # 他のプロセスが先に取り出した
+                continue
+            if is_setup_done(target):
+                claimed = (name, target)
+                break
+            logger.warning(f"[ProjectPool] Discarding incomplete pooled project {name}")
+            shutil.rmtree(target, ignore_errors=True)
+        with self._lock:
+            if claimed is not None:
+                self.hits += 1
+                # 取り出した分を見積もりで差し引く（リクエスト処理中にディレクトリを走査しない）
+                self._disk_bytes = max(0, self._disk_bytes - self._project_bytes)
+            else:
+                self.misses += 1
+        logger.info(f"[ProjectPool] {'Hit' if claimed else 'Miss'} ({self.ready_count()} ready, {self._building} building)")
+        self.refill()
+        return claimed
+
+    def refill(self) -> None:
+        """準備済み + 作成中がsize個になるまでバックグラウンドで作成を開始する"""
+        with self._lock:
+            missing = self.size - self.ready_count() - self._building
+            for _ in range(max(0, missing)):
+                if self.max_disk_bytes > 0 and self._disk_bytes + self._project_bytes * (self._building + 1) > self.max_disk_bytes:
+                    self.skipped_for_disk += 1
+                    logger.warning(f"[ProjectPool] Disk ceiling reached ({self._disk_bytes / 1024 / 1024:.0f}MB used), not refilling")
+                    break
+                self._building += 1
+                self._executor.submit(self._build_one)
+
+    def _build_one(self) -> None:
+        from tools.setup_nextjs_project import create_nextjs_project, generate_unique_project_name
+        started = time.perf_counter()
+        name = generate_unique_project_name()
+        try:
+            result = create_nextjs_project(self.building_dir, name)
+            if result.get("status") != "success":
+                raise RuntimeError(result.get("error", result.get("status")))
+            os.rename(os.path.join(self.building_dir, name), os.path.join(self.ready_dir, name))
+            seconds = time.perf_counter() - started
+            disk_bytes = _disk_usage(self.pool_dir)
+            with self._lock:
+                self.builds += 1
+                self.build_seconds += seconds
+                self._project_bytes = max(self._project_bytes, disk_bytes - self._disk_bytes) if self._disk_bytes else disk_bytes
+                self._disk_bytes = disk_bytes
+            logger.info(f"[ProjectPool] Prepared {name} in {seconds:.1f}s ({self.ready_count()} ready)")
+        except Exception as e:
+            with self._lock:
+                self.build_failures += 1
+            logger.warning(f"[ProjectPool] Failed to prepare a pooled project: {e}")
+            shutil.rmtree(os.path.join(self.building_dir, name), ignore_errors=True)
+        finally:
+            with self._lock:
+                self._building -= 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            claims = self.hits + self.misses
+            return {
+                "size": self.size,
+                "ready": self.ready_count(),
+                "building": self._building,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / claims, 3) if claims else None,
+                "builds": self.builds,
+                "build_failures": self.build_failures,
+                "avg_build_seconds": round(self.build_seconds / self.builds, 3) if self.builds else None,
+                "disk_mb": round(self._disk_bytes / 1024 / 1024, 1),
+                "skipped_for_disk": self.skipped_for_disk,
+            }
+
+
+_pools: Dict[str, ProjectPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_project_pool(output_dir_path: str) -> ProjectPool:
+    """出力ディレクトリごとのプロセス共通のプロジェクトプールを取得する"""
+    with _pools_lock:
+        pool = _pools.get(output_dir_path)
+        if pool is None:
+            pool = ProjectPool(
+                output_dir_path,
+                version=Config.CREATE_NEXT_APP_VERSION,
+                size=Config.PROJECT_POOL_SIZE,
+                refill_concurrency=Config.PROJECT_POOL_REFILL_CONCURRENCY,
+                max_disk_bytes=Config.PROJECT_POOL_MAX_DISK_MB * 1024 * 1024
+            )
+            _pools[output_dir_path] = pool
+        return pool
@@ -1,8 +1,13 @@
 import os
+import shutil
 import subprocess
 import uuid
 from logger import Logger
 from config import Config
+from tools.nextjs_template_cache import TemplateCacheError, create_next_app_command, get_template_cache
+from tools.node_toolchain import get_node_toolchain
+from tools.project_pool import get_project_pool
+from tools.package_store import link_project_packages
 logger = Logger(log_level="INFO")
 
 def generate_unique_project_name() -> str:
@@ -14,7 +19,7 @@ def generate_unique_project_name() -> str:
 def is_setup_done(project_path):
     return os.path.exists(os.path.join(project_path, "package.json")) and os.path.exists(os.path.join(project_path, "app"))
 
-def setup_nextjs_project(output_dir: str = None) -> dict:
+def _output_dir_path(output_dir: str = None) -> str:
     # output_dirが指定されていない場合は、Config.OUTPUT_DIRを使用
     if output_dir is None:
         output_dir = Config.OUTPUT_DIR
@@ -23,13 +28,41 @@ def setup_nextjs_project(output_dir: str = None) -> dict:
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     
     # プロジェクトルートからの相対パスでoutput_dirを構築
-    output_dir_path = os.path.join(project_root, output_dir)
-    
+    return os.path.join(project_root, output_dir)
+
+def warm_project_pool(output_dir: str = None) -> None:
+    """作成済みプロジェクトのプールの補充を開始する（サーバー起動時に呼ぶ。PROJECT_POOL_SIZE=0の場合は何もしない）"""
+    if Config.PROJECT_POOL_SIZE > 0:
+        get_project_pool(_output_dir_path(output_dir)).refill()
+
+def project_pool_snapshot(output_dir: str = None) -> dict:
+    """作成済みプロジェクトのプールの統計（ヒット・ミス・補充状況・ディスク使用量）"""
+    return get_project_pool(_output_dir_path(output_dir)).snapshot()
+
+def setup_nextjs_project(output_dir: str = None) -> dict:
+    output_dir_path = _output_dir_path(output_dir)
+    os.makedirs(output_dir_path, exist_ok=True)
+
+    # 事前に作成済みのプロジェクトがあれば取り出して使う（取り出した分はバックグラウンドで補充される）
+    if Config.PROJECT_POOL_SIZE > 0:
+        claimed = get_project_pool(output_dir_path).claim()
+        if claimed is not None:
+            project_name, project_path = claimed
+            logger.info(f"[SetupNextjsProject] Project ID Claimed from pool: {project_name}")
+            return {
+                "status": "success",
+                "project_path": project_path,
+                "project_name": project_name,
+                "pool": "hit"
+            }
+
     project_name = generate_unique_project_name()
     logger.info(f"[SetupNextjsProject] Project ID Created: {project_name}")
-    logger.info(f"[SetupNextjsProject] Project root: {project_root}")
     logger.info(f"[SetupNextjsProject] Output directory: {output_dir_path}")
-    
+    return create_nextjs_project(output_dir_path, project_name)
+
+def create_nextjs_project(output_dir_path: str, project_name: str) -> dict:
+    """output_dir_path/project_name にNext.jsプロジェクトを作成する（雛形キャッシュ、使えない場合はcreate-next-app）"""
     project_path = os.path.join(output_dir_path, project_name)
     os.makedirs(output_dir_path, exist_ok=True)
 
@@ -37,18 +70,30 @@ def setup_nextjs_project(output_dir: str = None) -> dict:
         return {"status": "already_exists", "project_path": project_path, "project_name": project_name}
 
     os.makedirs(project_path, exist_ok=True)
-    try:
-        # Node.js LTSバージョンを明示的に使う
-        nvm_cmd = ["bash", "-c", "source $NVM_DIR/nvm.sh && nvm install --lts && nvm use --lts && node -v"]
-        logger.info(f"Ensuring Node.js LTS version via nvm: {' '.join(nvm_cmd)}")
-        subprocess.run(nvm_cmd, cwd=output_dir_path, capture_output=True, text=True, check=False)
 
-        # create-next-appの安定版を指定（例: 14.1.0）
-        cmd = [
-            "npx", "create-next-app@14.1.0", project_name,
-            "--use-npm", "--no-git", "--typescript", "--eslint",
-            "--app", "--tailwind", "--no-src-dir", "--no-import-alias", "--yes"
-        ]
+    # キャッシュ済みの雛形（node_modules込み）からコピーして作成する。使えない場合はcreate-next-appで作成する
+    if Config.NEXTJS_TEMPLATE_CACHE_ENABLED:
+        try:
+            template = get_template_cache().materialize(project_path, project_name)
+            if not is_setup_done(project_path):
+                raise TemplateCacheError("Project not fully initialized from template")
+            # ハードリンクの場合は雛形がストアに取り込み済みなので不要
+            package_store = link_project_packages(project_path) if template["copy_mode"] != "hardlink" else None
+            return {
+                "status": "success",
+                "project_path": project_path,
+                "project_name": project_name,
+                "template": template,
+                "package_store": package_store
+            }
+        except Exception as e:
+            logger.warning(f"[SetupNextjsProject] Template cache unavailable, falling back to create-next-app: {e}")
+            shutil.rmtree(project_path, ignore_errors=True)
+            os.makedirs(project_path, exist_ok=True)
+
+    try:
+        # create-next-appの安定版を指定（CREATE_NEXT_APP_VERSION）。Node.jsはプロセス内で1回だけ解決したものを使う
+        cmd = create_next_app_command(project_name)
 
         logger.info(f"Running: {' '.join(cmd)} in {output_dir_path}")
         result = subprocess.run(
@@ -57,7 +102,7 @@ def setup_nextjs_project(output_dir: str = None) -> dict:
             capture_output=True,
             text=True,
             check=True,
-            env={**os.environ, "CI": "true"}
+            env=get_node_toolchain().env({"CI": "true"})
         )
         logger.info(f"Next.js project initialized at {project_path}\nstdout: {result.stdout}\nstderr: {result.stderr}")
         if is_setup_done(project_path):
@@ -65,6 +110,7 @@ def setup_nextjs_project(output_dir: str = None) -> dict:
                 "status": "success",
                 "project_path": project_path,
                 "project_name": project_name,
+                "package_store": link_project_packages(project_path),
                 "stdout": result.stdout,
                 "stderr": result.stderr
             }